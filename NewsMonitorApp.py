@@ -1,108 +1,65 @@
-import os
-import requests
+"""Flask app sending the news digest built from NewsAPI top headlines.
+
+Articles come from NewsAPISource; deduplication, ranking, rendering, sending
+and the sent history are the Vercel function's (api/send-news.py), so both
+entry points send the same digest through the same pipeline.
+"""
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+
 from flask import Flask, request, jsonify, abort
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 
-app = Flask(__name__)
+SEND_NEWS_PATH = Path(__file__).resolve().parent / "api" / "send-news.py"
 
-# Environment variables
-NEWS_API_KEY = os.getenv('NEWS_API_KEY')
-SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
-SENDER_EMAIL = os.getenv('SENDER_EMAIL')
-RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')
-MY_SECRET_API_KEY = os.getenv('MY_SECRET_API_KEY')
+def load_send_news():
+    """Import api/send-news.py, which isn't an importable module name, by path."""
+    spec = importlib.util.spec_from_file_location("send_news", SEND_NEWS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
-# NewsAPI categories
-CATEGORIES = {
-    "business news": "business",
-    "entertainment news": "entertainment",
-    "general news": "general",
-    "health news": "health",
-    "science news": "science",
-    "sports news": "sports",
-    "technology news": "technology"
-}
+send_news = load_send_news()
+
+app = Flask(__name__)
 
 @app.route('/', methods=['GET'])
 def fetch_and_send_news():
     api_key = request.headers.get('X-API-KEY')
-    if api_key != MY_SECRET_API_KEY:
+    if api_key != send_news.MY_SECRET_API_KEY:
         abort(403)
 
-    news_data = {}
-
-    for label, category in CATEGORIES.items():
-        # Construct the News API URL for top headlines
-        url = (f"https://newsapi.org/v2/top-headlines?"
-               f"category={category}&"
-               f"country=us&"
-               f"pageSize=15&"
-               f"apiKey={NEWS_API_KEY}")
-
-        response = requests.get(url)
-        print(f"Request URL: {url}")
-        print(f"Response Status Code: {response.status_code}")
-        print(f"Response Content: {response.text}")
-
-        if response.status_code == 200:
-            data = response.json()
-            articles = data.get("articles", [])
-            news_data[label] = [
-                {
-                    "title": article.get("title"),
-                    "source": article["source"].get("name"),
-                    "published_at": article.get("publishedAt"),
-                    "url": article.get("url"),
-                    "description": article.get("description") or "No description available."
-                }
-                for article in articles[:15]  # Limit to top 15 articles
-            ]
-        else:
-            print(f"Error for {label}: {response.text}")
-            news_data[label] = []
-
-    email_content = format_email_content(news_data)
-    send_email("Your Top News Update", email_content)
-
-    return jsonify({"message": "Email sent successfully!"})
-
-def format_email_content(news_data):
-    """Format the news data into HTML for the email."""
-    content = "<h1>Your Top News Update</h1>"
-    for category, articles in news_data.items():
-        content += f"<h2>{category.capitalize()}</h2>"
-        if articles:
-            for article in articles:
-                content += f"""
-                <p>
-                    <strong>{article['title']}</strong><br>
-                    <em>{article['source']} - {article['published_at']}</em><br>
-                    {article['description']}<br>
-                    <a href="{article['url']}">Read more</a>
-                </p>
-                """
-        else:
-            content += "<p>No articles found for this category.</p>"
-    return content
-
-def send_email(subject, content):
-    sender_email = SENDER_EMAIL
-    recipient_email = RECIPIENT_EMAIL
+    timer = send_news.RunTimer()
+    feed_stats = send_news.new_feed_stats()
+    cutoff_date = datetime.now() - timedelta(days=7)
 
-    message = Mail(
-        from_email=sender_email,
-        to_emails=recipient_email,
-        subject=subject,
-        html_content=content
-    )
+    with send_news.NewsAPISource() as source:
+        news_data = source.fetch(cutoff_date, feed_stats, timer)
+    with timer.span('history'):
+        history_store = send_news.open_history_store()
+    digest = send_news.deliver_digest(news_data, feed_stats, timer, history_store)
 
-    try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
-        print(f"Email sent: {response.status_code}")
-    except Exception as e:
-        print(f"Error sending email: {e}")
+    delivery_results = digest['delivery_results']
+    delivered = sum(1 for result in delivery_results if result['status'] == 'sent')
+    if delivered == len(delivery_results):
+        message = "Email sent successfully!"
+    else:
+        message = f"Email sent to {delivered} of {len(delivery_results)} recipients"
+    return jsonify({
+        "message": message,
+        "stats": {
+            "articles_sent": feed_stats['total_articles'],
+            "duplicates_removed": feed_stats['duplicates_removed'],
+            "categories": feed_stats['total_feeds'],
+            "failed_categories": feed_stats['failed_feeds']
+        },
+        "newsapi": feed_stats['newsapi'],
+        "timings": timer.summary(),
+        "delivery": {
+            "sent": delivered,
+            "failed": [result for result in delivery_results if result['status'] != 'sent']
+        }
+    })
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000)
@@ -1,14 +1,43 @@
 import os
+import re
+import copy
+import sys
+import types
+import time
+import threading
+import io
+import gzip
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
 from http.server import BaseHTTPRequestHandler
 import json
+import sqlite3
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.charset import Charset, QP
+from email.utils import parsedate_to_datetime
 import feedparser
+import numpy as np
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, urljoin, parse_qs, parse_qsl, urlencode
+from xml.etree.ElementTree import XMLPullParser, ParseError
+from feedparser.datetimes import _parse_date as parse_feed_date
 import hashlib
+import html
+import math
+import mmap
+from collections import Counter
+import struct
 
 # Environment variables
 GMAIL_ADDRESS = os.getenv('GMAIL_ADDRESS')
@@ -16,6 +45,83 @@ GMAIL_APP_PASSWORD = os.getenv('GMAIL_APP_PASSWORD')
 RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')
 MY_SECRET_API_KEY = os.getenv('MY_SECRET_API_KEY')
 
+# Log verbosity: debug, info, warning or error
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+LOG_LEVEL = LOG_LEVELS.get(os.getenv('LOG_LEVEL', 'info').lower(), LOG_LEVELS['info'])
+
+# Email delivery. RECIPIENT_EMAIL may hold a comma-separated subscriber list; all
+# messages go over one authenticated SMTP connection, reopened after
+# SMTP_MESSAGES_PER_CONNECTION messages or on failure, at most SMTP_SEND_RATE
+# messages per second (0 = unthrottled).
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '465'))
+SMTP_USE_SSL = os.getenv('SMTP_USE_SSL', 'true').lower() not in ('0', 'false', 'no')
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+SMTP_MESSAGES_PER_CONNECTION = int(os.getenv('SMTP_MESSAGES_PER_CONNECTION', '50'))
+SMTP_SEND_RATE = float(os.getenv('SMTP_SEND_RATE', '5'))
+
+# Email size. Gmail clips messages whose HTML is over ~102KB, so the digest is
+# rendered to fit its HTML MIME part (as encoded) in EMAIL_SIZE_BUDGET bytes
+# (0 = no limit): past it, descriptions
+# are cut to EMAIL_SHORT_DESCRIPTION_LENGTH characters, then whole cards dropped,
+# lowest-ranked first. EMAIL_RENDER_MODE "compact" styles the repeated elements
+# from the <style> block and strips whitespace; "inline" repeats inline styles on
+# every element, for clients that drop <style>.
+EMAIL_SIZE_BUDGET = int(os.getenv('EMAIL_SIZE_BUDGET', '102000'))
+EMAIL_SHORT_DESCRIPTION_LENGTH = 120
+EMAIL_RENDER_MODE = os.getenv('EMAIL_RENDER_MODE', 'compact')
+
+# Feed fetching: how many feeds are downloaded at once, and how long each may take.
+# The connect timeout bounds the TCP/TLS handshake; the read timeout bounds the
+# whole body download, so a slow-dripping host can't hold the run hostage.
+FEED_FETCH_CONCURRENCY = int(os.getenv('FEED_FETCH_CONCURRENCY', '16'))
+FEED_CONNECT_TIMEOUT = float(os.getenv('FEED_CONNECT_TIMEOUT', '5'))
+FEED_READ_TIMEOUT = float(os.getenv('FEED_READ_TIMEOUT', '15'))
+
+# Time budget for the whole fetch stage, so the digest still gets rendered and
+# sent inside vercel.json's maxDuration (60s). Each host's feeds are started
+# most valuable first (fresh articles per second of latency); whatever hasn't
+# arrived when the budget runs out is dropped and the run is marked partial.
+FEED_FETCH_BUDGET = float(os.getenv('FEED_FETCH_BUDGET', '40'))
+
+# Feeds sharing a host (the BBC and CNN feeds, say) reuse that host's keep-alive
+# connections, at most FEED_HOST_CONCURRENCY requests at a time and starting
+# FEED_HOST_MIN_INTERVAL seconds apart. The hosts expected to take longest (by
+# their feeds' median latency, spread over the cap) start their first feeds
+# straight away, so they don't hold up the end of the fetch stage; the other
+# feeds start most valuable first, feeds of equal value slowest host first. A
+# streaming parse that stops early still reads the rest of a response of up to
+# FEED_KEEPALIVE_DRAIN bytes, so its connection can be reused.
+FEED_HOST_CONCURRENCY = int(os.getenv('FEED_HOST_CONCURRENCY', '4'))
+FEED_HOST_MIN_INTERVAL = float(os.getenv('FEED_HOST_MIN_INTERVAL', '0.1'))
+FEED_KEEPALIVE_DRAIN = 256 * 1024
+
+# Feed health: after CIRCUIT_BREAKER_THRESHOLD consecutive failures a feed is
+# skipped for CIRCUIT_BREAKER_COOLDOWN seconds (doubling on each failed probe, up to
+# CIRCUIT_BREAKER_MAX_COOLDOWN). Read timeouts adapt to each feed's observed p95
+# latency, between FEED_MIN_READ_TIMEOUT and FEED_READ_TIMEOUT.
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', '3'))
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', '3600'))
+CIRCUIT_BREAKER_MAX_COOLDOWN = 7 * 24 * 3600
+FEED_MIN_READ_TIMEOUT = float(os.getenv('FEED_MIN_READ_TIMEOUT', '3'))
+FEED_TIMEOUT_P95_MULTIPLIER = 3
+FEED_HEALTH_SAMPLES = 20
+
+# Number of entries taken from the top of each feed
+ENTRIES_PER_FEED = 5
+
+# "stream" parses feeds as they download and stops reading once ENTRIES_PER_FEED
+# entries are in (falling back to feedparser for anything it can't handle);
+# "full" always downloads the whole feed and parses it with feedparser
+FEED_PARSE_MODE = os.getenv('FEED_PARSE_MODE', 'stream')
+FEED_STREAM_CHUNK_SIZE = 16 * 1024
+
+# Worker processes for full feedparser parses, which are CPU-bound and would
+# otherwise serialize under the GIL; 0 parses in the fetch threads. Defaults to
+# the cores available, or 0 on a single core
+AVAILABLE_CORES = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+FEED_PARSE_WORKERS = int(os.getenv('FEED_PARSE_WORKERS', str(AVAILABLE_CORES if AVAILABLE_CORES > 1 else 0)))
+
 # RSS Feed URLs organized by category
 RSS_FEEDS = {
     "Top News": [
@@ -86,76 +192,2925 @@ RSS_FEEDS = {
     ]
 }
 
-# File to store sent articles history
-SENT_ARTICLES_FILE = Path("/tmp/sent_articles.json")
+# Article descriptions are cut to this many characters (at a word boundary)
+DESCRIPTION_MAX_LENGTH = 300
+
+# Tags whose content is never text, and tags that separate words
+NON_TEXT_TAGS = frozenset(['script', 'style', 'head', 'title', 'noscript', 'template'])
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption', 'figure',
+    'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'img', 'li', 'ol', 'p', 'pre',
+    'section', 'table', 'td', 'th', 'tr', 'ul'
+])
+
+# Near-duplicate detection: articles whose SimHash fingerprints (title + description
+# words) differ in at most this many of 64 bits are treated as the same story
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '3'))
+SIMHASH_MIN_TOKENS = 4
+
+# Words that say nothing about which story an article is about
+STOPWORDS = frozenset("""
+a about after all also an and are as at be been but by can could for from has have he her his
+how in into is it its just more new news not of on one or our out over said says she so than
+that the their them there they this to up was we were what when which who will with would you
+amp quot lt gt x27
+""".split())
+
+# URL canonicalization: query parameters that only track where a click came from,
+# on any site. Names that some sites also use for content (source, feed, ref,
+# amp, ...) are stripped per host instead, with URL_CANONICAL_RULES' strip_params.
+TRACKING_PARAMS = frozenset([
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'cmpid', 'ocid', 'icid', 'ncid',
+    '__source', 'guccounter', 'soc_src', 'soc_trk'
+])
+TRACKING_PARAM_PREFIXES = ('utm_', 'at_', 'pk_', 'mtm_')
+
+# Referral parameters feed links carry on sites where they never pick an article
+FEED_REFERRAL_PARAMS = ('ref', 'referrer', 'source', 'src', 'rss', 'feed', 'partner', 'amp', 'outputtype')
+
+# Host prefixes for mobile / AMP mirrors of the same site
+MIRROR_HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'amp.')
+
+# Per-host canonicalization rules, keyed by host without the www./m./amp. prefix:
+#   alias        - host the site's articles are canonically served from
+#   drop_query   - the query string never identifies an article on this host
+#   keep_params  - the only query parameters that identify an article
+#   strip_params - query parameters that only track clicks on this host, on top
+#                  of TRACKING_PARAMS
+URL_CANONICAL_RULES = {
+    'bbc.co.uk': {'alias': 'bbc.com', 'drop_query': True},
+    'bbc.com': {'drop_query': True},
+    'edition.cnn.com': {'alias': 'cnn.com', 'drop_query': True},
+    'cnn.com': {'drop_query': True},
+    'nytimes.com': {'drop_query': True},
+    'theguardian.com': {'drop_query': True},
+    'reuters.com': {'drop_query': True},
+    'washingtonpost.com': {'drop_query': True},
+    'cnbc.com': {'drop_query': True},
+    'bloomberg.com': {'drop_query': True},
+    'npr.org': {'drop_query': True},
+    'aljazeera.com': {'drop_query': True},
+    'webmd.com': {'keep_params': ('page',)},
+    'ft.com': {'strip_params': ('ftag', 'emc') + FEED_REFERRAL_PARAMS},
+    'techcrunch.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'theverge.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'arstechnica.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'wired.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'engadget.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'cnet.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'zdnet.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'technologyreview.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'venturebeat.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'variety.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'deadline.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'hollywoodreporter.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'rollingstone.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'space.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'forbes.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'marketwatch.com': {'strip_params': FEED_REFERRAL_PARAMS},
+    'wsj.com': {'strip_params': FEED_REFERRAL_PARAMS},
+}
+
+# Digest ranking: each category's top DIGEST_ARTICLES_PER_CATEGORY articles by a
+# relevance score computed for every candidate of the run in one NumPy pass:
+#   recency  - halves every RANKING_HALF_LIFE_HOURS after publication
+#   coverage - 1 - 1/n for a story carried by n feeds
+#   topic    - TF-IDF salience of the category's TOPIC_PROFILES keywords in the
+#              title (counting double) and description, between 0 and 1 and
+#              halfway at RANKING_TOPIC_SATURATION; document frequencies come
+#              from the run, so a word all of today's stories use weighs little
+# are added up with RANKING_WEIGHTS and multiplied by the SOURCE_WEIGHTS entry
+# for the article's source, the feed name shown in the digest (default 1).
+DIGEST_ARTICLES_PER_CATEGORY = 15
+RANKING_HALF_LIFE_HOURS = float(os.getenv('RANKING_HALF_LIFE_HOURS', '12'))
+RANKING_WEIGHTS = {'recency': 1.0, 'coverage': 0.6, 'topic': 0.6}
+RANKING_TOPIC_SATURATION = 4.0
+SOURCE_WEIGHTS = {
+    'Reuters': 1.2,
+    'BBC News': 1.1,
+    'NPR Topics: News': 1.1,
+    'Nature': 1.2,
+    'Techmeme': 0.8,
+    'MarkTechPost': 0.8,
+}
+TOPIC_PROFILES = {
+    "Top News": """
+        election president government minister parliament congress senate court supreme ruling war
+        ceasefire attack killed military troops sanctions summit talks protest crisis investigation
+        police earthquake hurricane storm flood wildfire refugees border treaty vote
+    """,
+    "Technology": """
+        apple google microsoft amazon meta samsung iphone android windows software hardware chip chips
+        semiconductor startup security hack breach privacy cloud app update launch smartphone laptop
+        antitrust regulation internet browser
+    """,
+    "AI": """
+        ai artificial intelligence model models llm gpt openai anthropic deepmind gemini claude chatgpt
+        training inference agents neural benchmark dataset safety alignment generative multimodal
+        robotics reasoning research open source
+    """,
+    "Arts and Entertainment": """
+        film movie box office album music tour concert festival award awards oscar grammy emmy series
+        season streaming netflix disney premiere trailer actor actress director broadway book novel
+        museum exhibition
+    """,
+    "Science": """
+        study research researchers scientists discovery species fossil climate planet mars moon space
+        nasa telescope galaxy asteroid physics quantum genome evolution ocean ecosystem experiment
+        particle spacecraft launch
+    """,
+    "Health": """
+        health study patients disease cancer vaccine virus outbreak covid treatment drug trial fda
+        hospital doctors diabetes heart obesity mental depression infection medicine clinical
+        symptoms diet sleep
+    """,
+    "Business": """
+        market markets stocks shares earnings profit revenue economy inflation rates fed bank banks
+        investors merger acquisition deal ipo tariffs trade jobs layoffs ceo oil prices dollar bonds
+        recession
+    """,
+}
+
+# Directory for all persisted state (history, feed cache, feed health). Vercel
+# only allows writes under /tmp.
+DATA_DIR = Path(os.getenv('NEWSMONITOR_DATA_DIR', '/tmp'))
+
+# Sent articles history: backend ("sqlite" or "json"), location and retention
+HISTORY_BACKEND = os.getenv('HISTORY_BACKEND', 'sqlite')
+SENT_ARTICLES_DB = DATA_DIR / "sent_articles.db"
+SENT_ARTICLES_FILE = DATA_DIR / "sent_articles.json"
+HISTORY_RETENTION_DAYS = 30
+
+# Bloom-filter front tier for the sent history: one filter per day, memory-
+# mapped from HISTORY_BLOOM_FILE, so only keys the filters might hold are
+# looked up in the history itself. Each day's filter is sized for
+# HISTORY_BLOOM_DAILY_ITEMS keys, for a false-positive rate of at most
+# HISTORY_BLOOM_FP_RATE across the whole window; the defaults take 65KB.
+HISTORY_BLOOM = os.getenv('HISTORY_BLOOM', 'true').lower() not in ('0', 'false', 'no')
+HISTORY_BLOOM_FILE = DATA_DIR / "sent_articles.bloom"
+HISTORY_BLOOM_DAILY_ITEMS = int(os.getenv('HISTORY_BLOOM_DAILY_ITEMS', '1000'))
+HISTORY_BLOOM_FP_RATE = float(os.getenv('HISTORY_BLOOM_FP_RATE', '0.01'))
+
+# Article store filled by the ingest route, and what the digest reads from:
+# "store", "live" (fetch feeds during the digest request), "newsapi" (NewsAPI
+# top headlines instead of feeds), or "auto" - the store if an ingest
+# finished within ARTICLE_STORE_MAX_AGE seconds, else live
+ARTICLE_STORE_DB = DATA_DIR / "articles.db"
+ARTICLE_RETENTION_DAYS = 7
+DIGEST_SOURCE = os.getenv('DIGEST_SOURCE', 'auto')
+ARTICLE_STORE_MAX_AGE = float(os.getenv('ARTICLE_STORE_MAX_AGE', '21600'))
+
+# Searchable archive of every article fetched, never pruned: SQLite with an FTS5
+# index on title and description, queried through the search route
+ARTICLE_ARCHIVE_DB = DATA_DIR / "article_archive.db"
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# Keyword searches rank about this many of the most recently archived matches,
+# so a common word costs the same at a million archived articles as at a
+# thousand. A query matching more than SEARCH_COMMON_SHARE of the articles
+# searched says little about relevance (and BM25 would have to scan its whole
+# posting list to weigh it), so those matches are listed newest first instead.
+SEARCH_RANK_WINDOW = 2000
+SEARCH_COMMON_SHARE = 0.1
+
+# Subscribers with their own digests: SUBSCRIBERS_FILE, when it exists, is a
+# JSON list of {"email", "categories", "include", "exclude", "blocked_sources"}
+# (all but email optional); without it every RECIPIENT_EMAIL address gets the
+# full digest. Each digest takes up to DIGEST_ARTICLES_PER_CATEGORY of the
+# subscriber's articles per category, from the SUBSCRIBER_POOL_PER_CATEGORY
+# best ranked, so filtering some out still leaves a full digest.
+SUBSCRIBERS_FILE = Path(os.getenv('SUBSCRIBERS_FILE', str(DATA_DIR / "subscribers.json")))
+SUBSCRIBER_POOL_PER_CATEGORY = 60
+
+# NewsAPI (newsapi.org) top headlines as an article source, for NewsMonitorApp.py
+# and DIGEST_SOURCE=newsapi: one request per NEWSAPI_CATEGORIES entry (digest
+# category -> NewsAPI category), NEWSAPI_CONCURRENCY at a time over one
+# keep-alive session. Connection errors and 5xx answers are retried up to
+# NEWSAPI_RETRIES times with backoff. A 429 holds every request until its
+# Retry-After has passed, unless that is more than NEWSAPI_MAX_RETRY_AFTER
+# seconds away, which fails the category instead.
+NEWS_API_KEY = os.getenv('NEWS_API_KEY')
+NEWSAPI_URL = os.getenv('NEWSAPI_URL', 'https://newsapi.org/v2/top-headlines')
+NEWSAPI_COUNTRY = os.getenv('NEWSAPI_COUNTRY', 'us')
+NEWSAPI_CATEGORIES = {
+    "Top News": "general",
+    "Technology": "technology",
+    "Arts and Entertainment": "entertainment",
+    "Science": "science",
+    "Health": "health",
+    "Business": "business",
+    "Sports": "sports"
+}
+NEWSAPI_PAGE_SIZE = SUBSCRIBER_POOL_PER_CATEGORY
+NEWSAPI_CONCURRENCY = int(os.getenv('NEWSAPI_CONCURRENCY', '4'))
+NEWSAPI_CONNECT_TIMEOUT = float(os.getenv('NEWSAPI_CONNECT_TIMEOUT', '5'))
+NEWSAPI_READ_TIMEOUT = float(os.getenv('NEWSAPI_READ_TIMEOUT', '10'))
+NEWSAPI_RETRIES = int(os.getenv('NEWSAPI_RETRIES', '3'))
+NEWSAPI_MAX_RETRY_AFTER = float(os.getenv('NEWSAPI_MAX_RETRY_AFTER', '30'))
+
+# File to store per-feed HTTP validators (ETag / Last-Modified), a fingerprint
+# of the last body and its entries
+FEED_CACHE_FILE = DATA_DIR / "feed_cache.json"
+
+# Breaking-news alerts (the alert route, meant to be polled every few minutes):
+# entries first seen by a poll, at most ALERT_MAX_AGE_HOURS old and scoring at
+# least ALERT_MIN_SCORE (on the ranking scale, where a fresh story carried by
+# two feeds scores about 1.3), are sent as a short alert of up to
+# ALERT_MAX_ARTICLES. ALERT_STATE_FILE keeps each feed's cache record and the
+# ids of its last ALERT_SEEN_PER_FEED entries, apart from the digest's cache.
+ALERT_STATE_FILE = DATA_DIR / "alert_state.json"
+ALERT_MIN_SCORE = float(os.getenv('ALERT_MIN_SCORE', '1.3'))
+ALERT_MAX_AGE_HOURS = float(os.getenv('ALERT_MAX_AGE_HOURS', '3'))
+ALERT_MAX_ARTICLES = 5
+ALERT_SEEN_PER_FEED = 4 * ENTRIES_PER_FEED
+
+# File to store per-feed health records (latency, error streaks, yield)
+FEED_HEALTH_FILE = DATA_DIR / "feed_health.json"
+
+# Record/replay of raw feed responses, for reproducing a run offline. With
+# FEED_ARCHIVE_MODE=record (or ?archive=record) every feed response is saved
+# under FEED_ARCHIVE_DIR; with replay (or ?archive=replay&run=<id>) a digest is
+# rebuilt from run FEED_REPLAY_RUN ("latest" by default), with each feed's
+# original download time or, with FEED_REPLAY_LATENCY=zero, none.
+FEED_ARCHIVE_DIR = Path(os.getenv('FEED_ARCHIVE_DIR', str(DATA_DIR / "feed_archive")))
+FEED_ARCHIVE_MODE = os.getenv('FEED_ARCHIVE_MODE', '')
+FEED_REPLAY_RUN = os.getenv('FEED_REPLAY_RUN', 'latest')
+FEED_REPLAY_LATENCY = os.getenv('FEED_REPLAY_LATENCY', 'original')
+
+# Entry fields kept in the feed cache - everything extract_feed_articles() reads
+CACHED_ENTRY_FIELDS = ('id', 'title', 'link', 'summary', 'description', 'published', 'updated',
+                       'published_parsed', 'updated_parsed')
+
+def log(message, level='info'):
+    """Print a log line if its level is at or above LOG_LEVEL."""
+    if LOG_LEVELS[level] >= LOG_LEVEL:
+        print(message)
+
+class Metrics:
+    """Process-wide counters, exposed in Prometheus text format.
+
+    Counters live as long as the (warm) serverless instance does.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.help = {}
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+        current_name = None
+        for (name, labels), value in counters:
+            if name != current_name:
+                current_name = name
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+            label_text = ','.join(
+                '{}="{}"'.format(key, str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                for key, label in labels
+            )
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+METRICS.describe('newsmonitor_requests_total', 'Requests handled, by route and status.')
+METRICS.describe('newsmonitor_stage_seconds_total', 'Time spent in each pipeline stage.')
+METRICS.describe('newsmonitor_stage_calls_total', 'Number of times each pipeline stage ran.')
+METRICS.describe('newsmonitor_feed_fetch_seconds_total', 'Time spent fetching each feed.')
+METRICS.describe('newsmonitor_feed_fetches_total', 'Feed fetches, by outcome.')
+METRICS.describe('newsmonitor_feed_bytes_total', 'Feed body bytes downloaded.')
+METRICS.describe('newsmonitor_feed_parses_total', 'Feeds parsed, by parser and whether reading stopped early.')
+METRICS.describe('newsmonitor_feed_connections_total', 'Connections opened to feed hosts, by host.')
+METRICS.describe('newsmonitor_feed_handshakes_saved_total',
+                 'Feed requests sent over a reused keep-alive connection, by host.')
+METRICS.describe('newsmonitor_articles_ingested_total', 'New articles added to the article store.')
+METRICS.describe('newsmonitor_articles_sent_total', 'Articles included in sent digests.')
+METRICS.describe('newsmonitor_emails_sent_total', 'Digest and alert emails delivered, by outcome.')
+METRICS.describe('newsmonitor_alerts_sent_total', 'Articles sent as breaking-news alerts.')
+METRICS.describe('newsmonitor_history_lookups_total',
+                 'Sent-history lookups, by result: ruled out by the Bloom filter, sent, or a false positive.')
+
+class RunTimer:
+    """Timing spans for one request.
+
+    Spans with the same name accumulate, so a stage that runs per feed or per
+    category reports its total. Every span is also added to METRICS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        with self._lock:
+            total = self.spans.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        METRICS.inc('newsmonitor_stage_seconds_total', seconds, stage=name)
+        METRICS.inc('newsmonitor_stage_calls_total', stage=name)
+
+    def summary(self):
+        with self._lock:
+            return {name: {'seconds': round(seconds, 4), 'calls': calls}
+                    for name, (seconds, calls) in self.spans.items()}
+
+@lru_cache(maxsize=8192)
+def canonicalize_url(url):
+    """Normalize an article URL so trivially different links compare equal.
+
+    Forces https (unless the URL names a non-default port, which is kept),
+    drops www./m./amp. host prefixes, tracking parameters, fragments, AMP path
+    suffixes and trailing slashes, then applies the per-host rules in
+    URL_CANONICAL_RULES.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return url
+
+    host = parts.hostname
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in MIRROR_HOST_PREFIXES:
+            if host.startswith(prefix) and host.count('.') > 1:
+                host = host[len(prefix):]
+                stripped = True
+    rules = URL_CANONICAL_RULES.get(host, {})
+    host = rules.get('alias', host)
+
+    path = parts.path or '/'
+    for amp_suffix in ('/amp', '/amp/', '.amp'):
+        if path.endswith(amp_suffix):
+            path = path[:-len(amp_suffix)] or '/'
+    path = path.replace('.amp.html', '.html')
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = ''
+    if not rules.get('drop_query'):
+        keep_params = rules.get('keep_params')
+        strip_params = rules.get('strip_params', ())
+        params = []
+        for key, value in parse_qsl(parts.query, keep_blank_values=True):
+            name = key.lower()
+            if keep_params is not None:
+                if name in keep_params:
+                    params.append((key, value))
+            elif (name not in TRACKING_PARAMS and name not in strip_params
+                  and not name.startswith(TRACKING_PARAM_PREFIXES)):
+                params.append((key, value))
+        query = urlencode(sorted(params))
+
+    scheme = 'https'
+    if ':' in host:
+        host = f"[{host}]"
+    if port is not None and port != {'http': 80, 'https': 443}[parts.scheme]:
+        scheme, host = parts.scheme, f"{host}:{port}"
+    return urlunsplit((scheme, host, path, query, ''))
+
+def get_url_key(url):
+    """Compact, fixed-size key for a URL: 16-byte digest of its canonical form."""
+    return hashlib.blake2b(canonicalize_url(url).encode(), digest_size=16).digest()
+
+class Article:
+    """One news article as it moves through dedup, ranking and rendering.
+
+    Slotted rather than a dict: the source name is interned, so articles from
+    the same feed share one string; the publication time is parsed once into
+    epoch seconds (published_at keeps the feed's own date text for display);
+    and the canonical URL and its digest are computed up front; its word counts
+    when first needed, shared by dedup and ranking. The description is the
+    HTML-escaped summary from summarize_html(). Other
+    sources carrying the same story are collected in `alternates` (also
+    Articles).
+    """
+
+    __slots__ = ('title', 'source', 'published_at', 'published_ts', 'url', 'canonical_url', 'url_key',
+                 'description', 'alternates', '_terms')
+
+    def __init__(self, title, source, url, published_at='', published_ts=0.0, description='',
+                 canonical_url=None, url_key=None):
+        self.title = title
+        self.source = sys.intern(source)
+        self.published_at = published_at
+        self.published_ts = published_ts
+        self.url = url
+        self.canonical_url = canonical_url if canonical_url is not None else canonicalize_url(url)
+        self.url_key = url_key if url_key is not None else get_url_key(url)
+        self.description = description
+        self.alternates = ()
+        self._terms = None
+
+    @property
+    def published_display(self):
+        return format_published_at(self.published_at)
+
+    @property
+    def terms(self):
+        """Counts of the title and description words (see article_terms()), computed once."""
+        if self._terms is None:
+            self._terms = article_terms(self.title, self.description)
+        return self._terms
+
+    def add_alternate(self, article):
+        if not self.alternates:
+            self.alternates = []
+        self.alternates.append(article)
+
+    def __repr__(self):
+        return f"Article({self.title!r}, {self.source!r}, {self.url!r})"
+
+def case_insensitive(word):
+    """A regex matching word in any case, by character classes: unlike re.IGNORECASE,
+    these keep the engine's fast scan for the pattern's leading literal."""
+    return ''.join(f'[{c}{c.upper()}]' if c.isalpha() else c for c in word)
+
+HTML_TAG_PATTERN = re.compile(r"</?(\w*)[^>]*>")
+# A script/style/... element and its content; group 2 is empty when it isn't closed
+HTML_NON_TEXT_PATTERN = re.compile(r"<(%s)\b[^>]*>.*?(?:(</\1\s*>)|\Z)" % '|'.join(sorted(NON_TEXT_TAGS)),
+                                   re.IGNORECASE | re.DOTALL)
+# What a tag becomes in the text: block tags separate words, others vanish
+HTML_TAG_SEPARATORS = dict.fromkeys(BLOCK_TAGS, ' ')
+# ASCII whitespace that str.split() collapses, besides single spaces
+HTML_COLLAPSIBLE_SPACE = ('  ', '\n', '\t', '\r', '\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x1f')
+
+def summarize_html(text, limit=DESCRIPTION_MAX_LENGTH):
+    """Plain-text summary of an HTML fragment, at most `limit` characters, HTML-escaped.
+
+    Tags are dropped (script/style content too, block tags become spaces),
+    entities are decoded and whitespace is collapsed. The text is cleaned
+    in one pass, segment by segment from the start, until there are more
+    than `limit` characters: the first segment is half again as long as
+    `limit`, later ones sized by the share of text so far. So a whole article
+    costs about as much as a short summary. Steps with nothing to do (no
+    tags, no script/style, no entities, no runs of whitespace) are skipped.
+    Cut text ends at a word boundary with "…".
+    """
+    cleaned = []
+    position = 0
+    size = limit * 3 // 2 + 1
+    while True:
+        start = position
+        chunk = text[position:position + size]
+        complete = position + size >= len(text)
+        if not complete:
+            # Don't end the segment inside an entity, a tag or a script/style/... element
+            entity_start = chunk.rfind('&')
+            if entity_start > chunk.rfind(';') and entity_start > len(chunk) - 12:
+                chunk = chunk[:entity_start]
+            tag_start = chunk.rfind('<')
+            if tag_start > chunk.rfind('>'):
+                chunk = chunk[:tag_start]
+        if '<' in chunk:
+            # split() leaves the text between tags at even indices, tag names at odd ones
+            pieces = HTML_TAG_PATTERN.split(chunk)
+            names = [name.lower() for name in pieces[1::2]]
+            if not NON_TEXT_TAGS.isdisjoint(names):
+                for element in HTML_NON_TEXT_PATTERN.finditer(chunk):
+                    if element.group(2) is None and not complete:
+                        # Leave an element that doesn't close in this segment for the next one
+                        chunk = chunk[:element.start()]
+                        break
+                position += len(chunk)
+                pieces = HTML_TAG_PATTERN.split(HTML_NON_TEXT_PATTERN.sub(' ', chunk))
+                names = [name.lower() for name in pieces[1::2]]
+            else:
+                position += len(chunk)
+            pieces[1::2] = [HTML_TAG_SEPARATORS.get(name, '') for name in names]
+            chunk = ''.join(pieces)
+        else:
+            position += len(chunk)
+        if '&' in chunk:
+            chunk = html.unescape(chunk)
+        cleaned.append(chunk)
+
+        summary = cleaned[0] if len(cleaned) == 1 else ''.join(cleaned)
+        if summary.isascii():
+            summary = summary.strip(' ')
+            for space in HTML_COLLAPSIBLE_SPACE:
+                if space in summary:
+                    summary = ' '.join(summary.split())
+                    break
+        else:
+            summary = ' '.join(summary.split())
+        if complete or len(summary) > limit:
+            break
+        if position > start and summary:
+            # Enough for the rest at the share of text so far, and some
+            size = (limit + 1 - len(summary)) * position // len(summary) * 5 // 4 + 16
+        else:
+            size *= 4
+
+    if len(summary) > limit:
+        cut = summary[:limit]
+        if summary[limit] != ' ' and ' ' in cut:
+            cut = cut.rsplit(' ', 1)[0]
+        summary = cut.rstrip(' ,;:-') + '…'
+    return html.escape(summary)
+
+class SQLiteHistoryStore:
+    """Sent-article history in SQLite, indexed by URL key (see get_url_key).
+
+    Lookups are single primary-key probes, writes happen in one transaction,
+    and expiry deletes only the rows that have aged out (via the sent_at index).
+    """
+
+    def __init__(self, path=SENT_ARTICLES_DB, retention_days=HISTORY_RETENTION_DAYS):
+        self.retention = timedelta(days=retention_days).total_seconds()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sent_articles ("
+                "url_hash BLOB PRIMARY KEY, sent_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sent_at ON sent_articles (sent_at)")
+        self._import_legacy_json()
+
+    def _import_legacy_json(self):
+        """One-time migration of the old /tmp/sent_articles.json history."""
+        if not SENT_ARTICLES_FILE.exists():
+            return
+        try:
+            with open(SENT_ARTICLES_FILE, 'r') as f:
+                data = json.load(f)
+            rows = []
+            for url, timestamp in data.get('articles', {}).items():
+                rows.append((get_url_key(url), datetime.fromisoformat(timestamp).timestamp()))
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO sent_articles VALUES (?, ?)", rows)
+            SENT_ARTICLES_FILE.rename(SENT_ARTICLES_FILE.with_suffix('.json.migrated'))
+            log(f"Imported {len(rows)} article URLs from {SENT_ARTICLES_FILE}")
+        except Exception as e:
+            log(f"Error importing legacy sent articles: {e}", 'error')
+
+    def was_sent(self, url_key):
+        cutoff = time.time() - self.retention
+        row = self.conn.execute(
+            "SELECT 1 FROM sent_articles WHERE url_hash = ? AND sent_at > ?",
+            (url_key, cutoff)
+        ).fetchone()
+        return row is not None
+
+    def sent_among(self, url_keys):
+        """The URL keys that were sent, a few hundred per query."""
+        cutoff = time.time() - self.retention
+        url_keys = list(url_keys)
+        sent = set()
+        for start in range(0, len(url_keys), 500):
+            batch = url_keys[start:start + 500]
+            sent.update(row[0] for row in self.conn.execute(
+                f"SELECT url_hash FROM sent_articles WHERE url_hash IN ({','.join('?' * len(batch))}) "
+                f"AND sent_at > ?", batch + [cutoff]
+            ))
+        return sent
+
+    def mark_sent(self, url_keys):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sent_articles VALUES (?, ?)",
+                [(url_key, now) for url_key in url_keys]
+            )
+            expired = self.conn.execute(
+                "DELETE FROM sent_articles WHERE sent_at <= ?", (now - self.retention,)
+            ).rowcount
+        log(f"Saved {len(url_keys)} article URLs to history ({expired} expired)")
+
+    def sent_keys(self):
+        """(url_key, sent_at) for every article sent within the retention window."""
+        return self.conn.execute(
+            "SELECT url_hash, sent_at FROM sent_articles WHERE sent_at > ?", (time.time() - self.retention,)
+        )
+
+    def close(self):
+        self.conn.close()
+
+class JSONHistoryStore:
+    """Sent-article history in a single JSON file (the original format).
+
+    The whole file is loaded on first use and rewritten on save, so this is
+    only suitable for small histories; writes go through a temp file and rename.
+    """
+
+    def __init__(self, path=SENT_ARTICLES_FILE, retention_days=HISTORY_RETENTION_DAYS):
+        self.path = Path(path)
+        self.retention_days = retention_days
+        self._articles = None
+
+    @property
+    def articles(self):
+        if self._articles is None:
+            self._articles = self._load()
+        return self._articles
+
+    def _load(self):
+        articles = {}
+        try:
+            if self.path.exists():
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                # Clean up old entries (older than the retention window)
+                cutoff_date = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+                for key, timestamp in data.get('articles', {}).items():
+                    if timestamp > cutoff_date:
+                        # Older files are keyed on raw URLs rather than hex URL keys
+                        if '://' in key:
+                            key = get_url_key(key).hex()
+                        articles[key] = timestamp
+        except Exception as e:
+            log(f"Error loading sent articles: {e}", 'error')
+        return articles
+
+    def was_sent(self, url_key):
+        return url_key.hex() in self.articles
+
+    def sent_among(self, url_keys):
+        return {url_key for url_key in url_keys if url_key.hex() in self.articles}
+
+    def mark_sent(self, url_keys):
+        now = datetime.now().isoformat()
+        for url_key in url_keys:
+            self.articles[url_key.hex()] = now
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.path.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump({'articles': self.articles, 'last_updated': now}, f)
+            os.replace(tmp_file, self.path)
+            log(f"Saved {len(self.articles)} article URLs to history")
+        except Exception as e:
+            log(f"Error saving sent articles: {e}", 'error')
+
+    def sent_keys(self):
+        """(url_key, sent_at) for every article sent within the retention window."""
+        return [(bytes.fromhex(key), datetime.fromisoformat(timestamp).timestamp())
+                for key, timestamp in self.articles.items()]
+
+    def close(self):
+        pass
+
+class MemoryHistoryStore:
+    """Sent-article history that starts empty and is never saved (for replays)."""
+
+    def __init__(self):
+        self.url_keys = set()
+
+    def was_sent(self, url_key):
+        return url_key in self.url_keys
+
+    def sent_among(self, url_keys):
+        return self.url_keys.intersection(url_keys)
+
+    def mark_sent(self, url_keys):
+        self.url_keys.update(url_keys)
+
+    def close(self):
+        pass
+
+class DailyBloomFilter:
+    """One Bloom filter per day of sent history, memory-mapped from a single file.
+
+    The filters are bit-sliced: bit i of every day's filter sits in the same
+    32-bit word, day d's in bit d % 32. A lookup reads its `hashes` words,
+    stopping at the first that rules every day out, and ANDs them with the
+    bits of the days still in the window; a day is dropped by clearing its
+    bit in every word before the slot is reused. Opening the file maps it
+    without reading it, so a run only pages in the header and the words its
+    lookups touch.
+    """
+
+    MAGIC = b'NMBLOOM1'
+    HEADER = struct.Struct('<8sII32i')  # magic, bits, hashes, the day held in each slot (-1: none)
+    HEADER_SIZE = 256
+    SLOTS = 32
+
+    def __init__(self, path=HISTORY_BLOOM_FILE, daily_items=HISTORY_BLOOM_DAILY_ITEMS,
+                 fp_rate=HISTORY_BLOOM_FP_RATE, days=HISTORY_RETENTION_DAYS):
+        if days + 1 > self.SLOTS:
+            raise ValueError(f"At most {self.SLOTS - 1} days of history fit in a DailyBloomFilter")
+        self.days = days
+        # A lookup can hit any of the days + 1 filters, so each gets that share of the rate
+        day_rate = fp_rate / (days + 1)
+        self.bits = max(64, math.ceil(-daily_items * math.log(day_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / daily_items * math.log(2)))
+        self.path = Path(path)
+        self.size = self.HEADER_SIZE + 4 * self.bits
+
+        # A missing file, or one sized for other settings, starts over (created tells the caller to refill it)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header = os.pread(fd, self.HEADER.size, 0)
+            self.created = (
+                os.fstat(fd).st_size != self.size
+                or self.HEADER.unpack(header)[:3] != (self.MAGIC, self.bits, self.hashes)
+            )
+            if self.created:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        if self.created:
+            self.HEADER.pack_into(self._map, 0, self.MAGIC, self.bits, self.hashes, *[-1] * self.SLOTS)
+        self._words = memoryview(self._map)[self.HEADER_SIZE:].cast('I')
+        self._live_day = int(time.time() // 86400)
+        self._live = self._live_slots(self._live_day)
+
+    def _slot_days(self):
+        return list(self.HEADER.unpack_from(self._map, 0)[3:])
+
+    def _live_slots(self, today=None):
+        """Bit mask of the slots holding a day within the window."""
+        today = int(time.time() // 86400) if today is None else today
+        mask = 0
+        for slot, day in enumerate(self._slot_days()):
+            if day >= 0 and today - self.days <= day <= today:
+                mask |= 1 << slot
+        return mask
+
+    def _live_mask(self):
+        """The live slots, worked out again when the day has turned since they last were.
+
+        A filter kept open across midnight would otherwise go on matching the
+        day that has just left the window.
+        """
+        today = int(time.time() // 86400)
+        if today != self._live_day:
+            self._live_day, self._live = today, self._live_slots(today)
+        return self._live
+
+    def _positions(self, keys):
+        """Each key's word indexes, one row per key (double hashing on the key's two halves)."""
+        bits = np.uint64(self.bits)
+        halves = np.frombuffer(b''.join(key[:16] for key in keys), dtype='<u8').reshape(-1, 2)
+        h1 = halves[:, 0] % bits
+        h2 = (halves[:, 1] | np.uint64(1)) % bits
+        return (h1[:, None] + np.arange(self.hashes, dtype=np.uint64) * h2[:, None]) % bits
+
+    def _word_array(self):
+        return np.frombuffer(self._map, dtype='<u4', count=self.bits, offset=self.HEADER_SIZE)
+
+    def might_contain_many(self, keys):
+        """might_contain() for many keys at once, as a boolean array."""
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        hits = np.bitwise_and.reduce(self._word_array()[self._positions(keys)], axis=1)
+        return (hits & np.uint32(self._live_mask())) != 0
+
+    def might_contain(self, key):
+        """False if key (a URL key) was certainly not added within the window."""
+        h1 = int.from_bytes(key[:8], 'little')
+        h2 = int.from_bytes(key[8:16], 'little') | 1
+        bits, words = self.bits, self._words
+        live = self._live_mask()
+        for i in range(self.hashes):
+            live &= words[(h1 + i * h2) % bits]
+            if not live:
+                return False
+        return True
+
+    def add(self, keys, day=None):
+        """Add URL keys to the filter of `day` (days since the epoch; default today)."""
+        today = int(time.time() // 86400)
+        day = today if day is None else int(day)
+        if not keys or day < today - self.days:
+            return
+        slot = day % self.SLOTS
+        bit = 1 << slot
+        words = self._word_array()
+        slot_days = self._slot_days()
+        if slot_days[slot] != day:
+            # The slot last held a day that has left the window: empty it first
+            words &= np.uint32(~bit & 0xFFFFFFFF)
+            slot_days[slot] = day
+            self.HEADER.pack_into(self._map, 0, self.MAGIC, self.bits, self.hashes, *slot_days)
+
+        words[self._positions(keys).ravel()] |= np.uint32(bit)
+        del words
+        self._live_day, self._live = today, self._live_slots(today)
+
+    def fill(self, sent_keys):
+        """Add (url_key, sent_at) pairs, each to its day's filter."""
+        by_day = {}
+        for url_key, sent_at in sent_keys:
+            by_day.setdefault(int(sent_at // 86400), []).append(bytes(url_key))
+        for day in sorted(by_day):
+            self.add(by_day[day], day)
+        return sum(len(keys) for keys in by_day.values())
+
+    def close(self):
+        self._words.release()
+        self._map.close()
+
+class BloomHistoryStore:
+    """A sent-article history behind a DailyBloomFilter.
+
+    was_sent() and sent_among() ask the history only about keys the filter
+    says might be there. mark_sent() adds to the filter before the history, so the filter
+    never misses a key the history has; a new (or resized) filter is filled
+    from the history. `stats` counts lookups, the exact lookups made and
+    avoided, and the filter's false positives.
+    """
+
+    def __init__(self, store, bloom=None):
+        self.store = store
+        self.bloom = bloom if bloom is not None else DailyBloomFilter()
+        if self.bloom.created:
+            filled = self.bloom.fill(store.sent_keys())
+            log(f"Built the sent-history Bloom filter from {filled} article URLs")
+        self.stats = {'lookups': 0, 'exact_lookups': 0, 'exact_lookups_avoided': 0, 'false_positives': 0}
+
+    def was_sent(self, url_key):
+        self.stats['lookups'] += 1
+        if not self.bloom.might_contain(url_key):
+            self.stats['exact_lookups_avoided'] += 1
+            return False
+        self.stats['exact_lookups'] += 1
+        sent = self.store.was_sent(url_key)
+        if not sent:
+            self.stats['false_positives'] += 1
+        return sent
+
+    def sent_among(self, url_keys):
+        url_keys = list(url_keys)
+        possible = [key for key, maybe in zip(url_keys, self.bloom.might_contain_many(url_keys)) if maybe]
+        sent = self.store.sent_among(possible)
+        self.stats['lookups'] += len(url_keys)
+        self.stats['exact_lookups'] += len(possible)
+        self.stats['exact_lookups_avoided'] += len(url_keys) - len(possible)
+        self.stats['false_positives'] += len(possible) - len(sent)
+        return sent
+
+    def mark_sent(self, url_keys):
+        self.bloom.add(url_keys)
+        self.store.mark_sent(url_keys)
+
+    def close(self):
+        stats = self.stats
+        METRICS.inc('newsmonitor_history_lookups_total', stats['exact_lookups_avoided'], result='avoided')
+        METRICS.inc('newsmonitor_history_lookups_total', stats['exact_lookups'] - stats['false_positives'],
+                    result='sent')
+        METRICS.inc('newsmonitor_history_lookups_total', stats['false_positives'], result='false_positive')
+        self.bloom.close()
+        self.store.close()
+
+HISTORY_BACKENDS = {
+    'sqlite': SQLiteHistoryStore,
+    'json': JSONHistoryStore,
+    'memory': MemoryHistoryStore
+}
+
+def open_history_store(backend=None):
+    """Open the configured sent-articles history backend, behind the Bloom filter
+    tier if HISTORY_BLOOM is on (never for the unsaved memory backend)."""
+    backend = backend or HISTORY_BACKEND
+    store = HISTORY_BACKENDS[backend]()
+    if HISTORY_BLOOM and backend != 'memory':
+        store = BloomHistoryStore(store)
+    return store
+
+SEARCH_TERM_PATTERN = re.compile(r'\w+\*?')
+
+def fts_query(text):
+    """A safe FTS5 MATCH expression for free text: every word must match
+    (a trailing * matches it as a prefix), and quotes and operators are inert.
+
+    Stopwords are dropped unless that would leave nothing: they match most
+    articles, which makes ranking slow and adds nothing to it.
+    """
+    words = SEARCH_TERM_PATTERN.findall(text or '')
+    keywords = [word for word in words if word.rstrip('*').lower() not in STOPWORDS]
+    terms = []
+    for word in keywords or words:
+        prefix = word.endswith('*')
+        terms.append('"%s"%s' % (word.rstrip('*'), '*' if prefix else ''))
+    return ' '.join(terms)
+
+def search_tag(kind, value):
+    """A single FTS token standing for a category ("c") or source ("s") value."""
+    return kind + hashlib.sha1(value.lower().encode()).hexdigest()[:12]
+
+class ArticleArchive:
+    """Every normalized article ever fetched, in SQLite with an FTS5 index.
+
+    Articles are added once, by URL key, in one transaction per run, and are
+    never pruned. The FTS5 table indexes title (weighted double) and
+    description, plus a tags column of category and source tokens, so those
+    filters are matched inside the index; a trigger keeps it in step with the
+    articles table. search() combines ranked keyword matching with category,
+    source and date filters.
+    """
+
+    COLUMNS = ('title', 'source', 'category', 'published_at', 'published_ts', 'url', 'description')
+
+    def __init__(self, path=ARTICLE_ARCHIVE_DB):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS archived_articles ("
+                "id INTEGER PRIMARY KEY, url_key BLOB NOT NULL UNIQUE, category TEXT NOT NULL, title TEXT, "
+                "source TEXT, published_at TEXT, published_ts REAL NOT NULL, url TEXT, description TEXT, "
+                "tags TEXT NOT NULL, archived_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_published_ts "
+                              "ON archived_articles (published_ts)")
+            # Category and source match regardless of case, as their FTS tags do
+            self.conn.execute("DROP INDEX IF EXISTS idx_archive_category")
+            self.conn.execute("DROP INDEX IF EXISTS idx_archive_source")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_category_nocase "
+                              "ON archived_articles (category COLLATE NOCASE, published_ts)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_source_nocase "
+                              "ON archived_articles (source COLLATE NOCASE, published_ts)")
+            exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archive_fts'"
+            ).fetchone()
+            if not exists:
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE archive_fts USING fts5("
+                    "title, description, tags, content='archived_articles', content_rowid='id')"
+                )
+                self.conn.execute(
+                    "CREATE TRIGGER archive_fts_insert AFTER INSERT ON archived_articles BEGIN "
+                    "INSERT INTO archive_fts (rowid, title, description, tags) "
+                    "VALUES (new.id, new.title, new.description, new.tags); END"
+                )
+
+    def add(self, articles_by_category):
+        """Archive the articles not seen before; returns how many were new."""
+        now = time.time()
+        rows = [
+            (article.url_key, category, article.title, article.source, article.published_at,
+             article.published_ts, article.url, article.description,
+             f"{search_tag('c', category)} {search_tag('s', article.source)}", now)
+            for category, articles in articles_by_category.items()
+            for article in articles
+        ]
+        with self.conn:
+            inserted = self.conn.executemany(
+                "INSERT OR IGNORE INTO archived_articles (url_key, category, title, source, published_at, "
+                "published_ts, url, description, tags, archived_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            ).rowcount
+        log(f"Archived {inserted} new articles")
+        return inserted
+
+    def search(self, query='', category=None, source=None, since=None, until=None, page=1,
+               per_page=SEARCH_PAGE_SIZE, rank_window=SEARCH_RANK_WINDOW):
+        """One page of matching articles, best match first (newest first without a query).
+
+        Keyword matches are ranked by BM25 among the most recently archived
+        articles: the window starts at the newest rank_window articles and
+        grows fourfold until it holds rank_window matches (or is the whole
+        archive), so the cost tracks rank_window, not the archive size.
+        Queries filling the window with matches to more than
+        SEARCH_COMMON_SHARE of it come back newest first. Pages past the
+        window's matches go on with the older matches, newest first and
+        unscored. category and source ignore case. since/until are epoch
+        seconds bounding the publication date. Returns (results as dicts,
+        whether there are more pages).
+        """
+        columns = ', '.join(f'a.{column}' for column in self.COLUMNS)
+        offset = (page - 1) * per_page
+        page_params = [per_page + 1, offset]  # one extra row tells if there's a next page
+        match = fts_query(query)
+
+        if not match:
+            sql = f"SELECT {columns}, NULL FROM archived_articles a WHERE 1"
+            params = []
+            for condition, value in (('a.category = ? COLLATE NOCASE', category),
+                                     ('a.source = ? COLLATE NOCASE', source),
+                                     ('a.published_ts >= ?', since), ('a.published_ts < ?', until)):
+                if value is not None:
+                    sql += f" AND {condition}"
+                    params.append(value)
+            rows = self.conn.execute(f"{sql} ORDER BY a.published_ts DESC LIMIT ? OFFSET ?",
+                                     params + page_params).fetchall()
+        else:
+            tags = [search_tag(kind, value) for kind, value in (('c', category), ('s', source)) if value]
+            if tags:
+                match = f"({match}) AND tags : ({' '.join(tags)})"
+            # Dates aren't in the index: only then join the articles while matching
+            source_table = "archive_fts"
+            where = "archive_fts MATCH ?"
+            params = [match]
+            if since is not None or until is not None:
+                source_table += " JOIN archived_articles a ON a.id = archive_fts.rowid"
+                for condition, value in (('a.published_ts >= ?', since), ('a.published_ts < ?', until)):
+                    if value is not None:
+                        where += f" AND {condition}"
+                        params.append(value)
+
+            newest = self.conn.execute("SELECT MAX(id) FROM archived_articles").fetchone()[0] or 0
+            # Nothing archived before the first article published since `since` can match.
+            # Scanning the date index costs one step per article published since then;
+            # left to itself, SQLite walks the ids up from the oldest instead
+            floor = 0
+            if since is not None:
+                first = self.conn.execute(
+                    "SELECT MIN(id) FROM archived_articles INDEXED BY idx_archive_published_ts "
+                    "WHERE published_ts >= ?", (since,)
+                ).fetchone()[0]
+                floor = first - 1 if first is not None else newest
+            span = rank_window
+            while True:
+                lowest = max(floor, newest - span)
+                count = self.conn.execute(
+                    f"SELECT COUNT(*) FROM {source_table} WHERE {where} AND archive_fts.rowid > ?",
+                    params + [lowest]
+                ).fetchone()[0]
+                if count >= rank_window or lowest == floor:
+                    break
+                span *= 4
+            # Matches older than the window, listed after its own
+            older_where = where + " AND archive_fts.rowid > ? AND archive_fts.rowid <= ?"
+            older_params = params + [floor, lowest]
+            where += " AND archive_fts.rowid > ?"
+            params.append(lowest)
+
+            if count >= rank_window and count > SEARCH_COMMON_SHARE * (newest - lowest):
+                score, inner_order, outer_order = "NULL", "archive_fts.rowid DESC", "ranked.id DESC"
+            else:
+                score, inner_order, outer_order = "bm25(archive_fts, 2.0, 1.0, 0.0)", "score", "ranked.score"
+            rows = self.conn.execute(
+                f"SELECT {columns}, ranked.score FROM ("
+                f"SELECT archive_fts.rowid AS id, {score} AS score FROM {source_table} WHERE {where} "
+                f"ORDER BY {inner_order} LIMIT ? OFFSET ?) ranked "
+                f"JOIN archived_articles a ON a.id = ranked.id ORDER BY {outer_order}",
+                params + page_params
+            ).fetchall()
+            if len(rows) <= per_page and lowest > floor:
+                rows += self.conn.execute(
+                    f"SELECT {columns}, NULL FROM ("
+                    f"SELECT archive_fts.rowid AS id FROM {source_table} WHERE {older_where} "
+                    f"ORDER BY archive_fts.rowid DESC LIMIT ? OFFSET ?) older "
+                    f"JOIN archived_articles a ON a.id = older.id ORDER BY older.id DESC",
+                    older_params + [per_page + 1 - len(rows), max(0, offset - count)]
+                ).fetchall()
+
+        results = []
+        for row in rows[:per_page]:
+            result = dict(zip(self.COLUMNS, row))
+            result['score'] = round(-row[-1], 3) if row[-1] is not None else None
+            results.append(result)
+        return results, len(rows) > per_page
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM archived_articles").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+class ArticleStore:
+    """Normalized articles from recent ingests, in SQLite, keyed by URL key.
+
+    The ingest route upserts into it; the digest reads the last window back
+    out instead of fetching feeds. Rows are pruned once their publication
+    date falls outside the retention window. The stats of the last ingest are
+    kept alongside, so a digest built from the store can report feed health.
+    """
+
+    def __init__(self, path=ARTICLE_STORE_DB, retention_days=ARTICLE_RETENTION_DAYS):
+        self.retention = timedelta(days=retention_days).total_seconds()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles ("
+                "url_key BLOB PRIMARY KEY, category TEXT NOT NULL, title TEXT, source TEXT, "
+                "published_at TEXT, published_ts REAL NOT NULL, url TEXT, canonical_url TEXT, "
+                "description TEXT, first_seen REAL NOT NULL, last_seen REAL NOT NULL) WITHOUT ROWID"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_published_ts ON articles (published_ts)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS ingest_runs (finished_at REAL NOT NULL, stats TEXT)")
+
+    def upsert(self, articles_by_category):
+        """Insert new articles and refresh ones already stored; returns how many were new."""
+        now = time.time()
+        rows = [
+            (article.url_key, category, article.title, article.source, article.published_at,
+             article.published_ts, article.url, article.canonical_url, article.description, now, now)
+            for category, articles in articles_by_category.items()
+            for article in articles
+        ]
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            inserted = self.conn.total_changes - before
+            self.conn.executemany(
+                "UPDATE articles SET title = ?, description = ?, last_seen = ? WHERE url_key = ?",
+                [(row[2], row[8], now, row[0]) for row in rows]
+            )
+            expired = self.conn.execute(
+                "DELETE FROM articles WHERE published_ts <= ?", (now - self.retention,)
+            ).rowcount
+        log(f"Stored {len(rows)} articles ({inserted} new, {expired} expired)")
+        return inserted
+
+    def recent_articles(self, cutoff_date):
+        """Articles published after cutoff_date, newest first, grouped by category."""
+        articles_by_category = {category: [] for category in RSS_FEEDS}
+        rows = self.conn.execute(
+            "SELECT url_key, category, title, source, published_at, published_ts, url, canonical_url, description "
+            "FROM articles WHERE published_ts > ? ORDER BY published_ts DESC",
+            (cutoff_date.timestamp(),)
+        )
+        for url_key, category, title, source, published_at, published_ts, url, canonical_url, description in rows:
+            articles_by_category.setdefault(category, []).append(Article(
+                title, source, url, published_at, published_ts, description,
+                canonical_url=canonical_url, url_key=url_key
+            ))
+        return articles_by_category
+
+    def record_ingest(self, feed_stats):
+        with self.conn:
+            self.conn.execute("DELETE FROM ingest_runs")
+            self.conn.execute("INSERT INTO ingest_runs VALUES (?, ?)", (time.time(), json.dumps(feed_stats)))
+
+    def last_ingest(self):
+        """(finished_at epoch seconds, feed_stats) of the last ingest, or (None, None)."""
+        row = self.conn.execute("SELECT finished_at, stats FROM ingest_runs").fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def close(self):
+        self.conn.close()
+
+def get_article_hash(article):
+    """Generate a unique hash for an article based on URL or title."""
+    # Use canonical URL as primary identifier, fallback to title
+    identifier = article.canonical_url or article.url or article.title
+    return hashlib.md5(identifier.encode()).hexdigest()
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# TOKEN_PATTERN as a byte table: in UTF-8, every byte of a non-ASCII character
+# is >= 0x80, so blanking the bytes outside [a-z0-9] and splitting finds the
+# same tokens, without a regex match per token
+TOKEN_BYTES = bytes(byte if 0x30 <= byte <= 0x39 or 0x61 <= byte <= 0x7a else 0x20 for byte in range(256))
+
+def article_terms(title, description):
+    """Lowercase non-stopword tokens of an article with their counts, title words counting double."""
+    text = f"{title} {title} {description}".lower().encode(errors='surrogatepass')
+    weights = Counter(text.translate(TOKEN_BYTES).decode().split())
+    for token in STOPWORDS.intersection(weights):
+        del weights[token]
+    return weights
+
+# For each byte value, its 8 bits spread into 8 separate 16-bit counter lanes,
+# so summing spreads adds up per-bit votes for all 64 bits at once
+BYTE_SPREAD = [sum(1 << (bit * 16) for bit in range(8) if value >> bit & 1) for value in range(256)]
+_token_spreads = {}
+
+def _token_spread(token):
+    """Lane-packed bit pattern of a token's 64-bit hash (memoized)."""
+    spread = _token_spreads.get(token)
+    if spread is None:
+        token_hash = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little')
+        spread = 0
+        for i in range(8):
+            spread |= BYTE_SPREAD[(token_hash >> (8 * i)) & 0xff] << (128 * i)
+        if len(_token_spreads) > 200000:
+            _token_spreads.clear()
+        _token_spreads[token] = spread
+    return spread
+
+def simhash_fingerprint(article):
+    """64-bit SimHash of an article's title and description words.
+
+    Title words count double. Returns None when there are too few words to
+    fingerprint reliably.
+    """
+    weights = article.terms
+    if len(weights) < SIMHASH_MIN_TOKENS:
+        return None
+
+    votes = 0
+    total_weight = 0
+    for token, weight in weights.items():
+        votes += weight * _token_spread(token)
+        total_weight += weight
+
+    fingerprint = 0
+    for bit in range(64):
+        if ((votes >> (bit * 16)) & 0xffff) * 2 > total_weight:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def simhash_bands(max_distance):
+    """Split 64 bits into max_distance + 1 band masks.
+
+    Two fingerprints within max_distance bits of each other must agree on at
+    least one whole band, so bucketing by band finds every candidate pair
+    without comparing all pairs.
+    """
+    band_count = max_distance + 1
+    width = 64 // band_count
+    masks = []
+    for band in range(band_count):
+        start = band * width
+        end = 64 if band == band_count - 1 else start + width
+        masks.append(((1 << (end - start)) - 1) << start)
+    return masks
+
+def cluster_near_duplicates(articles_by_category, max_distance=NEAR_DUPLICATE_MAX_DISTANCE, feed_stats=None):
+    """Collapse near-duplicate stories across all categories in one pass.
+
+    The first article seen for a story (in RSS_FEEDS order) is kept as the
+    representative; later copies from other feeds or categories - the same
+    canonical URL, or a SimHash within max_distance bits - are dropped and
+    listed on it as `alternates`. Returns (clustered articles_by_category,
+    number of articles removed).
+    """
+    band_masks = simhash_bands(max_distance)
+    buckets = {}
+    by_url_key = {}
+    clustered = {}
+    removed = 0
+
+    for category, articles in articles_by_category.items():
+        kept = []
+        for article in articles:
+            url_key = article.url_key
+            representative = by_url_key.get(url_key)
+            fingerprint = None
+
+            if representative is not None:
+                if article.url != representative.url and feed_stats is not None:
+                    feed_stats['canonical_duplicates'] = feed_stats.get('canonical_duplicates', 0) + 1
+            else:
+                fingerprint = simhash_fingerprint(article)
+
+            if fingerprint is not None:
+                band_keys = [(band, fingerprint & mask) for band, mask in enumerate(band_masks)]
+                for band_key in band_keys:
+                    for other_fingerprint, other in buckets.get(band_key, ()):
+                        if bin(fingerprint ^ other_fingerprint).count('1') <= max_distance:
+                            representative = other
+                            break
+                    if representative is not None:
+                        break
+
+            if representative is not None:
+                removed += 1
+                known_sources = {representative.source} | {alt.source for alt in representative.alternates}
+                if article.source not in known_sources:
+                    representative.add_alternate(article)
+                continue
+
+            by_url_key[url_key] = article
+            if fingerprint is not None:
+                for band_key in band_keys:
+                    buckets.setdefault(band_key, []).append((fingerprint, article))
+            kept.append(article)
+
+        clustered[category] = kept
+
+    return clustered, removed
+
+def deduplicate_articles(articles, history_store, feed_stats=None):
+    """Remove duplicate articles and filter out previously sent ones.
+
+    Articles are compared by their canonical URL key. Duplicates that only
+    match once canonicalized are counted in feed_stats['canonical_duplicates'].
+    """
+    seen_keys = set()
+    seen_urls = set()
+    seen_hashes = set()
+    deduplicated = []
+    # One batched history lookup for the whole list
+    previously_sent = history_store.sent_among([article.url_key for article in articles])
+    # Checked once, so the per-article messages aren't formatted when they won't print
+    debug = LOG_LEVELS['debug'] >= LOG_LEVEL
+
+    for article in articles:
+        url_key = article.url_key
+        article_hash = get_article_hash(article)
+
+        # Skip if we've seen this URL in current batch
+        if url_key in seen_keys:
+            if article.url not in seen_urls and feed_stats is not None:
+                feed_stats['canonical_duplicates'] = feed_stats.get('canonical_duplicates', 0) + 1
+            if debug:
+                log(f"  Skipping duplicate in current batch: {article.title[:50]}", 'debug')
+            continue
+
+        # Skip if we've seen this article hash in current batch
+        if article_hash in seen_hashes:
+            if debug:
+                log(f"  Skipping duplicate by hash: {article.title[:50]}", 'debug')
+            continue
+
+        # Skip if we've sent this article before (within last 30 days)
+        if url_key in previously_sent:
+            if debug:
+                log(f"  Skipping previously sent: {article.title[:50]}", 'debug')
+            continue
+
+        # This is a new, unique article
+        seen_keys.add(url_key)
+        seen_urls.add(article.url)
+        seen_hashes.add(article_hash)
+        deduplicated.append(article)
+
+    return deduplicated
+
+def load_feed_cache(path=FEED_CACHE_FILE):
+    """Load the per-feed conditional-GET cache from file."""
+    try:
+        if path.exists():
+            with open(path, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        log(f"Error loading feed cache: {e}", 'error')
+
+    return {'feeds': {}}
+
+def save_feed_cache(feed_cache, path=FEED_CACHE_FILE):
+    """Atomically write the feed cache, so a crash mid-write keeps the old copy."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(feed_cache, f)
+        os.replace(tmp_file, path)
+    except Exception as e:
+        log(f"Error saving feed cache: {e}", 'error')
+
+def build_feed_cache_record(feed):
+    """Keep a freshly parsed feed's validators, fingerprint and top entries for the next run."""
+    entries = []
+    for entry in feed.entries[:ENTRIES_PER_FEED]:
+        cached_entry = {}
+        for field in CACHED_ENTRY_FIELDS:
+            value = entry.get(field)
+            if value is not None:
+                cached_entry[field] = list(value) if field.endswith('_parsed') else value
+        entries.append(cached_entry)
+
+    return {
+        'etag': feed.get('etag'),
+        'last_modified': feed.get('modified'),
+        'content_length': feed.get('bytes_read', 0),
+        'fingerprint': feed.get('fingerprint'),
+        'feed_title': feed.feed.get('title'),
+        'entries': entries
+    }
+
+def feed_from_record(feed_title, entries, **fields):
+    """Build a feedparser-style result from a feed title and compact entry dicts."""
+    feed_info = feedparser.FeedParserDict()
+    if feed_title is not None:
+        feed_info['title'] = feed_title
+
+    return feedparser.FeedParserDict(
+        feed=feed_info,
+        entries=[feedparser.FeedParserDict(entry) for entry in entries],
+        **fields
+    )
+
+def feed_from_cache(cache_record):
+    """Rebuild a feedparser-style result from a cache record, without parsing."""
+    return feed_from_record(cache_record.get('feed_title'), cache_record.get('entries', []),
+                            status=304, bytes_read=0)
+
+def parse_feed_body(body, response_headers):
+    """Parse a whole feed with feedparser, keeping only what extract_feed_articles() reads.
+
+    Returns (feed title, top entries as compact dicts, seconds spent). Runs in
+    FeedParsePool workers, so the result is kept small to pickle back.
+    """
+    started = time.perf_counter()
+    record = build_feed_cache_record(feedparser.parse(body, response_headers=response_headers))
+    return record['feed_title'], record['entries'], time.perf_counter() - started
+
+def _register_module():
+    """Make this module importable by name, so functions sent to worker processes pickle by reference."""
+    module = sys.modules.get(__name__)
+    if module is None or getattr(module, 'parse_feed_body', None) is not parse_feed_body:
+        module = types.ModuleType(__name__)
+        module.__dict__.update(globals())
+        sys.modules[__name__] = module
+
+class FeedParsePool:
+    """Process pool for full feed parses, so they use every core instead of one.
+
+    Fetch threads hand raw bodies to parse() and get compact records back.
+    Workers are forked up front, before any fetch threads exist. If they can't
+    be started (e.g. no /dev/shm for semaphores) or the pool breaks, parsing
+    falls back to the calling thread.
+    """
+
+    def __init__(self, workers=FEED_PARSE_WORKERS):
+        self.workers = workers
+        self.executor = None
+        if workers > 0:
+            try:
+                _register_module()
+                self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+                # With fork, the first submit starts all workers
+                self.executor.submit(os.getpid).result()
+            except (OSError, ValueError) as e:
+                log(f"Parse pool unavailable, parsing in-process: {e}", 'warning')
+                self.executor = None
+
+    def parse(self, body, response_headers):
+        if self.executor is not None:
+            try:
+                return self.executor.submit(parse_feed_body, body, response_headers).result()
+            except (OSError, BrokenProcessPool) as e:
+                log(f"Parse pool failed, parsing in-process: {e}", 'warning')
+                self.executor = None
+        return parse_feed_body(body, response_headers)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+# Kept for the life of the (warm) instance, so workers are forked once
+_parse_pool = None
+
+def get_parse_pool():
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = FeedParsePool()
+    return _parse_pool
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class CircuitOpenError(Exception):
+    """Raised for a feed that is being skipped because it keeps failing."""
+
+class DeadlineExceededError(Exception):
+    """Raised for a feed that was dropped because the fetch time budget ran out."""
+
+class FeedHealthTracker:
+    """Persistent per-feed health: recent latencies, error streaks, yield.
+
+    Drives a circuit breaker (feeds that keep failing are skipped and probed
+    again after a cooldown) and per-feed adaptive read timeouts. With path
+    None, health starts empty and isn't saved.
+    """
+
+    def __init__(self, path=FEED_HEALTH_FILE):
+        self.path = Path(path) if path is not None else None
+        self.feeds = {}
+        try:
+            if self.path is not None and self.path.exists():
+                with open(self.path, 'r') as f:
+                    self.feeds = json.load(f).get('feeds', {})
+        except Exception as e:
+            log(f"Error loading feed health: {e}", 'error')
+
+    def _record(self, feed_url):
+        return self.feeds.setdefault(feed_url, {
+            'latencies': [],
+            'yields': [],
+            'error_streak': 0,
+            'last_success': None,
+            'last_error': None,
+            'open_until': 0
+        })
+
+    def is_open(self, feed_url, now=None):
+        """True while a failing feed's circuit is open and it should be skipped."""
+        record = self.feeds.get(feed_url)
+        return bool(record) and record['open_until'] > (now or time.time())
+
+    def read_timeout(self, feed_url):
+        """Read timeout scaled to the feed's p95 latency (default until sampled)."""
+        latencies = self.feeds.get(feed_url, {}).get('latencies', [])
+        if len(latencies) < 3:
+            return FEED_READ_TIMEOUT
+        adaptive = percentile(latencies, 0.95) * FEED_TIMEOUT_P95_MULTIPLIER
+        return max(FEED_MIN_READ_TIMEOUT, min(FEED_READ_TIMEOUT, adaptive))
+
+    def value(self, feed_url):
+        """Average fresh articles per second of median latency; feeds never timed rank first."""
+        record = self.feeds.get(feed_url)
+        if not record or not record['latencies']:
+            return float('inf')
+        average_yield = sum(record['yields']) / len(record['yields']) if record['yields'] else 0
+        return average_yield / max(percentile(record['latencies'], 0.5), 0.05)
+
+    def median_latency(self, feed_url):
+        """The feed's median recent latency, or None before it has been timed."""
+        latencies = self.feeds.get(feed_url, {}).get('latencies')
+        return percentile(latencies, 0.5) if latencies else None
+
+    def record_latency(self, feed_url, latency):
+        """A latency sample (or lower bound) from a fetch that was cut off, not a failure."""
+        record = self._record(feed_url)
+        record['latencies'] = (record['latencies'] + [round(latency, 3)])[-FEED_HEALTH_SAMPLES:]
+
+    def record_success(self, feed_url, latency):
+        record = self._record(feed_url)
+        record['latencies'] = (record['latencies'] + [round(latency, 3)])[-FEED_HEALTH_SAMPLES:]
+        record['error_streak'] = 0
+        record['open_until'] = 0
+        record['last_success'] = time.time()
+
+    def record_failure(self, feed_url, error):
+        record = self._record(feed_url)
+        record['error_streak'] += 1
+        record['last_error'] = str(error)[:200]
+        if record['error_streak'] >= CIRCUIT_BREAKER_THRESHOLD:
+            failed_probes = record['error_streak'] - CIRCUIT_BREAKER_THRESHOLD
+            cooldown = min(CIRCUIT_BREAKER_MAX_COOLDOWN, CIRCUIT_BREAKER_COOLDOWN * 2 ** failed_probes)
+            record['open_until'] = time.time() + cooldown
+
+    def record_yield(self, feed_url, fresh_articles):
+        record = self._record(feed_url)
+        record['yields'] = (record['yields'] + [fresh_articles])[-FEED_HEALTH_SAMPLES:]
+
+    def summary(self, feed_urls):
+        """Health of the given feeds, for the email footer and JSON response."""
+        now = time.time()
+        feeds = []
+        for feed_url in feed_urls:
+            record = self.feeds.get(feed_url)
+            if not record:
+                continue
+            latencies = record['latencies']
+            yields = record['yields']
+            feeds.append({
+                'url': feed_url,
+                'circuit': 'open' if record['open_until'] > now else 'closed',
+                'error_streak': record['error_streak'],
+                'last_success': record['last_success'],
+                'last_error': record['last_error'],
+                'latency_p50': percentile(latencies, 0.5) if latencies else None,
+                'latency_p95': percentile(latencies, 0.95) if latencies else None,
+                'read_timeout': round(self.read_timeout(feed_url), 1),
+                'avg_fresh_articles': round(sum(yields) / len(yields), 1) if yields else None
+            })
+
+        all_latencies = [feed['latency_p50'] for feed in feeds if feed['latency_p50'] is not None]
+        return {
+            'circuit_open': sum(1 for feed in feeds if feed['circuit'] == 'open'),
+            'degraded': sum(1 for feed in feeds if feed['circuit'] == 'closed' and feed['error_streak'] > 0),
+            'median_latency': percentile(all_latencies, 0.5) if all_latencies else None,
+            'feeds': feeds
+        }
+
+    def save(self):
+        """Atomically write the health records."""
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.path.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump({'feeds': self.feeds}, f)
+            os.replace(tmp_file, self.path)
+        except Exception as e:
+            log(f"Error saving feed health: {e}", 'error')
+
+class FeedHostPool:
+    """Keep-alive connections and politeness limits for the hosts of a run's feeds.
+
+    Requests go through one requests.Session whose adapter keeps up to
+    `concurrency` connections open to each host, so feeds sharing a host
+    reuse its connections rather than each paying for DNS, TCP and TLS
+    handshakes. slot() holds one of the host's `concurrency` slots (0 = no
+    cap), starting requests to a host at least `min_interval` seconds
+    apart. summary() reports requests, connections opened, handshakes saved
+    and latency per host.
+    """
+
+    def __init__(self, feed_urls, concurrency=FEED_HOST_CONCURRENCY, min_interval=FEED_HOST_MIN_INTERVAL):
+        self.concurrency = concurrency if concurrency > 0 else None
+        self.min_interval = min_interval
+        hosts = {self.host_of(feed_url) for feed_url in feed_urls}
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=max(10, len(hosts)),
+                                   pool_maxsize=self.concurrency or FEED_FETCH_CONCURRENCY)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._next_start = {}
+        self.stats = {}
+
+    @staticmethod
+    def host_of(feed_url):
+        """The host (with its port, if not the scheme's default) a feed is fetched from."""
+        parts = urlsplit(feed_url)
+        host = (parts.hostname or '').lower()
+        if parts.port and parts.port != {'http': 80, 'https': 443}.get(parts.scheme):
+            host = f"{host}:{parts.port}"
+        return host
+
+    def schedule(self, feed_urls, health=None):
+        """Order feeds for starting: critical hosts first, then most valuable first, in rounds of `concurrency` feeds per host.
+
+        A host's expected time is its feeds' median latencies
+        (FEED_READ_TIMEOUT for feeds not yet timed) spread over its slots.
+        Hosts expected to take at least half as long as the slowest are on
+        the critical path, so their first round of feeds goes first, slowest
+        host first, whatever their value. The rest go in rounds by
+        health.value() (fresh articles per second of latency, see
+        fetch_feeds()), and feeds of equal value by their host's expected
+        time, slowest first. Each host's feeds keep their order, and a
+        host's later feeds wait for the next round, so the feeds handed to
+        workers can mostly start at once.
+        """
+        by_host = {}
+        for feed_url in feed_urls:
+            by_host.setdefault(self.host_of(feed_url), []).append(feed_url)
+
+        def expected_seconds(urls):
+            latencies = [health.median_latency(url) if health is not None else None for url in urls]
+            total = sum(FEED_READ_TIMEOUT if latency is None else latency for latency in latencies)
+            return total / min(self.concurrency or len(urls), len(urls))
+
+        host_seconds = {host: expected_seconds(urls) for host, urls in by_host.items()}
+        per_round = self.concurrency or max(len(urls) for urls in by_host.values())
+        longest = max(host_seconds.values())
+        critical = sorted((host for host in by_host if host_seconds[host] * 2 >= longest),
+                          key=host_seconds.get, reverse=True)
+        order = [url for host in critical for url in by_host[host][:per_round]]
+        for start in range(0, max(len(urls) for urls in by_host.values()), per_round):
+            batch = [(health.value(url) if health is not None else 0.0, host_seconds[host], url)
+                     for host, urls in by_host.items() for url in urls[start:start + per_round]
+                     if start or host not in critical]
+            batch.sort(key=lambda item: item[:2], reverse=True)
+            order += [url for _, _, url in batch]
+        return order
+
+    @contextmanager
+    def slot(self, feed_url, deadline=None):
+        """Hold a slot on the feed's host, yielding the session to fetch it with.
+
+        Waits for a free slot and for the host's minimum interval; raises
+        DeadlineExceededError if either would outlast the deadline (a
+        time.monotonic() value).
+        """
+        host = self.host_of(feed_url)
+        waiting_since = time.monotonic()
+        with self._lock:
+            if host not in self.stats:
+                self._slots[host] = threading.Semaphore(self.concurrency) if self.concurrency else None
+                self._next_start[host] = 0.0
+                self.stats[host] = {'requests': 0, 'latencies': [], 'waited': 0.0}
+        slots = self._slots[host]
+        if slots is not None:
+            timeout = None if deadline is None else max(0.0, deadline - waiting_since)
+            if not slots.acquire(timeout=timeout):
+                raise DeadlineExceededError("Not fetched: time budget used up")
+        try:
+            with self._lock:
+                now = time.monotonic()
+                start_at = max(now, self._next_start[host])
+                if deadline is not None and start_at >= deadline:
+                    raise DeadlineExceededError("Not fetched: time budget used up")
+                self._next_start[host] = start_at + self.min_interval
+                self.stats[host]['requests'] += 1
+                self.stats[host]['waited'] += start_at - waiting_since
+            time.sleep(start_at - now)
+            yield self.session
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def record_latency(self, feed_url, latency):
+        with self._lock:
+            self.stats[self.host_of(feed_url)]['latencies'].append(latency)
+
+    def connections(self):
+        """Connections opened so far to each host, from the adapter's connection pools."""
+        pools = self.adapter.poolmanager.pools
+        opened = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = self.host_of(f"{key.key_scheme}://{key.key_host}:{key.key_port}")
+            opened[host] = opened.get(host, 0) + pool.num_connections
+        return opened
+
+    def summary(self):
+        """Requests, connections and latency for each host used, slowest first, with totals."""
+        opened = self.connections()
+        hosts = []
+        with self._lock:
+            for host, stats in self.stats.items():
+                latencies = stats['latencies']
+                hosts.append({
+                    'host': host,
+                    'requests': stats['requests'],
+                    'connections': opened.get(host, 0),
+                    'handshakes_saved': max(0, stats['requests'] - opened.get(host, 0)),
+                    'latency_p50': round(percentile(latencies, 0.5), 3) if latencies else None,
+                    'latency_max': round(max(latencies), 3) if latencies else None,
+                    'waited': round(stats['waited'], 3)
+                })
+        hosts.sort(key=lambda host: host['latency_p50'] or 0, reverse=True)
+        return {
+            'hosts': len(hosts),
+            'requests': sum(host['requests'] for host in hosts),
+            'connections': sum(host['connections'] for host in hosts),
+            'handshakes_saved': sum(host['handshakes_saved'] for host in hosts),
+            'per_host': hosts
+        }
+
+    def close(self):
+        """Count the connections and reuses in METRICS, and close the connections."""
+        for host in self.summary()['per_host']:
+            METRICS.inc('newsmonitor_feed_connections_total', host['connections'], host=host['host'])
+            METRICS.inc('newsmonitor_feed_handshakes_saved_total', host['handshakes_saved'], host=host['host'])
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+RSS10_NS = '{http://purl.org/rss/1.0/}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+
+STREAM_ROOT_TAGS = frozenset(['rss', ATOM_NS + 'feed', '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}RDF'])
+STREAM_CHANNEL_TAGS = frozenset(['channel', ATOM_NS + 'feed', RSS10_NS + 'channel'])
+STREAM_ENTRY_TAGS = frozenset(['item', ATOM_NS + 'entry', RSS10_NS + 'item'])
+
+# Entry child element -> feedparser field name (the first match wins)
+STREAM_ENTRY_FIELDS = {
+    'title': 'title',
+    RSS10_NS + 'title': 'title',
+    ATOM_NS + 'title': 'title',
+    'link': 'link',
+    RSS10_NS + 'link': 'link',
+    ATOM_NS + 'link': 'link',
+    'guid': 'id',
+    ATOM_NS + 'id': 'id',
+    'description': 'summary',
+    RSS10_NS + 'description': 'summary',
+    ATOM_NS + 'summary': 'summary',
+    ATOM_NS + 'content': 'content',
+    'pubDate': 'published',
+    ATOM_NS + 'published': 'published',
+    ATOM_NS + 'updated': 'updated',
+    DC_NS + 'date': 'updated'
+}
+
+class StreamingFeedParser:
+    """Incremental RSS/Atom parser that stops after the first `limit` entries.
+
+    Chunks are fed as they download; feed() returns True once enough entries
+    are in, so the caller can stop reading. Only the fields extract_feed_articles()
+    needs are kept. Anything it can't handle (broken XML, encodings expat
+    doesn't know, unknown formats) sets `failed`, and close() returns None so
+    the caller falls back to feedparser.
+    """
+
+    def __init__(self, limit=ENTRIES_PER_FEED, base_url=''):
+        self.limit = limit
+        self.base_url = base_url
+        self.entries = []
+        self.feed_title = None
+        self.done = False
+        self.failed = False
+        self.seconds = 0.0
+        self._parser = XMLPullParser(events=('start', 'end'))
+        self._path = []
+
+    def feed(self, chunk):
+        if self.done or self.failed:
+            return self.done
+        started = time.perf_counter()
+        try:
+            self._parser.feed(chunk)
+            self._read_events()
+        except ParseError:
+            self.failed = True
+        self.seconds += time.perf_counter() - started
+        return self.done
+
+    def _read_events(self):
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                if not self._path and element.tag not in STREAM_ROOT_TAGS:
+                    raise ParseError(f"not a feed: {element.tag}")
+                self._path.append(element.tag)
+                continue
+
+            self._path.pop()
+            if element.tag in STREAM_ENTRY_TAGS:
+                self.entries.append(self._entry_from_element(element))
+                element.clear()
+                if len(self.entries) >= self.limit:
+                    self.done = True
+                    return
+            elif (self.feed_title is None and element.tag in ('title', ATOM_NS + 'title', RSS10_NS + 'title')
+                  and self._path and self._path[-1] in STREAM_CHANNEL_TAGS):
+                self.feed_title = ''.join(element.itertext()).strip()
+
+    def _entry_from_element(self, element):
+        entry = feedparser.FeedParserDict()
+        guid_is_link = False
+        for child in element:
+            field = STREAM_ENTRY_FIELDS.get(child.tag)
+            if field is None or field in entry:
+                continue
+            if child.tag == ATOM_NS + 'link':
+                if child.get('rel', 'alternate') != 'alternate':
+                    continue
+                value = child.get('href', '')
+            else:
+                value = ''.join(child.itertext()).strip()
+            if child.tag == 'guid':
+                guid_is_link = child.get('isPermaLink', 'true') != 'false'
+            entry[field] = value
+
+        # Same conventions as feedparser: Atom content doubles as the summary,
+        # a permalink guid doubles as the link, and links are made absolute
+        content = entry.pop('content', None)
+        if content is not None:
+            entry.setdefault('summary', content)
+        if 'link' not in entry and guid_is_link and entry.get('id', '').startswith(('http://', 'https://')):
+            entry['link'] = entry['id']
+        if entry.get('link'):
+            entry['link'] = urljoin(self.base_url, entry['link'])
+        for field in ('published', 'updated'):
+            if field in entry:
+                entry[field + '_parsed'] = parse_feed_date(entry[field])
+        return entry
+
+    def close(self):
+        """The parsed feed as a feedparser-style result, or None if it must be re-parsed."""
+        if not self.done and not self.failed:
+            started = time.perf_counter()
+            try:
+                self._parser.close()
+                self._read_events()
+            except ParseError:
+                self.failed = True
+            self.seconds += time.perf_counter() - started
+        if self.failed or not self.entries:
+            return None
+
+        feed_info = feedparser.FeedParserDict()
+        if self.feed_title is not None:
+            feed_info['title'] = self.feed_title
+        return feedparser.FeedParserDict(feed=feed_info, entries=self.entries, bozo=0)
+
+# Run ids as record() makes them, e.g. 20240105T102000Z-3f9a
+FEED_ARCHIVE_RUN_PATTERN = re.compile(r'^\d{8}T\d{6}Z-[0-9a-f]{4}$')
+
+class FeedArchive:
+    """Raw feed responses from one run, recorded to disk for replaying it offline.
+
+    Bodies (as read, after any gzip transfer decoding) are stored gzipped in
+    objects/, named by their SHA-256, so a body seen in several runs is kept
+    once. runs/<run id>.json holds the feeds by category and, per feed URL,
+    the response's status, final URL, headers, body object and download time,
+    or the error the fetch raised. Recording is thread-safe; call save() at
+    the end of the run. Replaying a run id that isn't 'latest' or in the
+    record() format raises ValueError.
+    """
+
+    def __init__(self, mode, run_id, path=FEED_ARCHIVE_DIR, latency='original'):
+        self.mode = mode
+        self.path = Path(path)
+        self.latency = latency
+        self._lock = threading.Lock()
+        if mode == 'replay':
+            if run_id == 'latest':
+                runs = sorted((self.path / 'runs').glob('*.json'))
+                if not runs:
+                    raise FileNotFoundError(f"No recorded runs in {self.path}")
+                run_id = runs[-1].stem
+            elif not FEED_ARCHIVE_RUN_PATTERN.match(run_id):
+                raise ValueError(f"Not a recorded run id: {run_id!r}")
+            manifest_path = self.path / 'runs' / f'{run_id}.json'
+            if not manifest_path.exists():
+                raise FileNotFoundError(f"No recorded run {run_id}")
+            with open(manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {
+                'run': run_id,
+                'recorded_at': time.time(),
+                'parse_mode': FEED_PARSE_MODE,
+                'rss_feeds': RSS_FEEDS,
+                'feeds': {}
+            }
+        self.run_id = run_id
+
+    @classmethod
+    def record(cls, path=FEED_ARCHIVE_DIR):
+        run_id = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime()) + '-' + os.urandom(2).hex()
+        return cls('record', run_id, path)
+
+    @classmethod
+    def replay(cls, run_id='latest', latency='original', path=FEED_ARCHIVE_DIR):
+        return cls('replay', run_id, path, latency)
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    @property
+    def rss_feeds(self):
+        return self.manifest['rss_feeds']
+
+    @property
+    def recorded_at(self):
+        return datetime.fromtimestamp(self.manifest['recorded_at'])
+
+    def _object_path(self, digest):
+        return self.path / 'objects' / digest[:2] / f'{digest}.gz'
+
+    def record_response(self, feed_url, response, body, seconds):
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = object_path.with_suffix(f'.{threading.get_ident()}.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(gzip.compress(body, compresslevel=6))
+            os.replace(tmp_file, object_path)
+        with self._lock:
+            self.manifest['feeds'][feed_url] = {
+                'status': response.status_code,
+                'reason': response.reason,
+                'url': response.url,
+                'headers': dict(response.headers),
+                'object': digest,
+                'bytes': len(body),
+                'seconds': round(seconds, 4)
+            }
+
+    def record_error(self, feed_url, error, seconds):
+        with self._lock:
+            self.manifest['feeds'][feed_url] = {
+                'error': type(error).__name__,
+                'message': str(error),
+                'seconds': round(seconds, 4)
+            }
+
+    def save(self):
+        """Atomically write the run's manifest; returns the run id."""
+        runs_dir = self.path / 'runs'
+        runs_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = runs_dir / f'{self.run_id}.tmp'
+        with self._lock, open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_file, runs_dir / f'{self.run_id}.json')
+        log(f"Recorded {len(self.manifest['feeds'])} feed responses as run {self.run_id}")
+        return self.run_id
+
+    def open_response(self, feed_url, read_timeout):
+        """The recorded response for a feed, after its original download time
+        (unless replaying with zero latency); raises what the fetch raised."""
+        entry = self.manifest['feeds'].get(feed_url)
+        if entry is None:
+            raise requests.ConnectionError(f"{feed_url} is not in recorded run {self.run_id}")
+        if self.latency != 'zero':
+            if entry['seconds'] > read_timeout:
+                time.sleep(read_timeout)
+                raise requests.Timeout(f"Read timed out after {read_timeout:.0f}s")
+            time.sleep(entry['seconds'])
+        if 'error' in entry:
+            error_class = getattr(requests.exceptions, entry['error'], requests.RequestException)
+            raise error_class(entry['message'])
+
+        with open(self._object_path(entry['object']), 'rb') as f:
+            body = gzip.decompress(f.read())
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.raw = io.BytesIO(body)
+        return response
+
+def open_feed_archive(request_path):
+    """The FeedArchive a request records to or replays from, or None.
+
+    ?archive=record or ?archive=replay (with &run=<id> and &latency=zero)
+    override FEED_ARCHIVE_MODE, FEED_REPLAY_RUN and FEED_REPLAY_LATENCY.
+    Raises ValueError for a malformed run id and FileNotFoundError for a
+    run that wasn't recorded.
+    """
+    query = parse_qs(urlsplit(request_path or '/').query)
+    mode = query.get('archive', [FEED_ARCHIVE_MODE])[0]
+    if mode == 'record':
+        return FeedArchive.record()
+    if mode == 'replay':
+        return FeedArchive.replay(query.get('run', [FEED_REPLAY_RUN])[0],
+                                  query.get('latency', [FEED_REPLAY_LATENCY])[0])
+    return None
+
+def fetch_feed(feed_url, cache_record=None, connect_timeout=FEED_CONNECT_TIMEOUT, read_timeout=FEED_READ_TIMEOUT,
+               parse_pool=None, archive=None, session=None):
+    """Download and parse a single RSS feed within the given timeouts.
+
+    When a cache record with validators is given, the request is conditional and
+    a 304 Not Modified answer is served from the cached entries; so is a body
+    matching the record's fingerprint (marked 'unchanged'), unparsed. Full feedparser
+    parses go to parse_pool (a FeedParsePool) if given. With a FeedArchive, the
+    response is recorded to it or, when replaying, read back from it. The request
+    goes through session (a requests.Session) if given, and then leaves the
+    connection fit for reuse where it can.
+    """
+    started = time.monotonic()
+    deadline = started + read_timeout
+    headers = {'User-Agent': feedparser.USER_AGENT}
+    if cache_record:
+        if cache_record.get('etag'):
+            headers['If-None-Match'] = cache_record['etag']
+        if cache_record.get('last_modified'):
+            headers['If-Modified-Since'] = cache_record['last_modified']
+
+    stream_parser = None
+    drained = 0
+    recording = archive is not None and archive.recording
+    try:
+        if archive is not None and archive.replaying:
+            response = archive.open_response(feed_url, read_timeout)
+        else:
+            response = (session or requests).get(feed_url, headers=headers, timeout=(connect_timeout, read_timeout),
+                                                 stream=True)
+        with response:
+            if response.status_code == 304 and cache_record:
+                if session is not None:
+                    response.content  # Reading the (empty) body hands the connection back to the pool
+                return feed_from_cache(cache_record)
+            response.raise_for_status()
+            chunk_size = 64 * 1024
+            if FEED_PARSE_MODE == 'stream':
+                stream_parser = StreamingFeedParser(ENTRIES_PER_FEED, base_url=response.url)
+                chunk_size = FEED_STREAM_CHUNK_SIZE
+            chunks = []
+            body_chunks = response.iter_content(chunk_size=chunk_size)
+            for chunk in body_chunks:
+                chunks.append(chunk)
+                # Stop downloading as soon as the entries we use are parsed
+                if stream_parser is not None and stream_parser.feed(chunk):
+                    break
+                if time.monotonic() > deadline:
+                    raise requests.Timeout(f"Read timed out after {read_timeout:.0f}s")
+            # The archive keeps whole responses, so replays can be parsed any way
+            if recording and stream_parser is not None and stream_parser.done:
+                for chunk in body_chunks:
+                    chunks.append(chunk)
+                    if time.monotonic() > deadline:
+                        raise requests.Timeout(f"Read timed out after {read_timeout:.0f}s")
+            body = b''.join(chunks)
+            # A connection closed with part of the body unread can't be reused, so a short rest is read anyway
+            content_length = response.headers.get('Content-Length', '')
+            if (session is not None and not recording and stream_parser is not None and stream_parser.done
+                    and content_length.isdigit()
+                    and int(content_length) - response.raw.tell() <= FEED_KEEPALIVE_DRAIN):
+                for chunk in body_chunks:
+                    drained += len(chunk)
+                    if time.monotonic() > deadline:
+                        break
+            response_headers = {key.lower(): value for key, value in response.headers.items()}
+            response_headers.setdefault('content-location', response.url)
+    except requests.RequestException as e:
+        if recording:
+            archive.record_error(feed_url, e, time.monotonic() - started)
+        raise
+    if recording:
+        # Download time only: streaming parse time is measured separately
+        download_seconds = time.monotonic() - started - (stream_parser.seconds if stream_parser else 0.0)
+        archive.record_response(feed_url, response, body, download_seconds)
+
+    # Servers without validators often send the same bytes again; only a changed body needs parsing
+    fingerprint = hashlib.blake2b(body, digest_size=16).hexdigest()
+    unchanged = bool(cache_record) and cache_record.get('fingerprint') == fingerprint
+    feed = stream_parser.close() if stream_parser is not None and not unchanged else None
+    parse_seconds = stream_parser.seconds if stream_parser is not None else 0.0
+    if unchanged:
+        feed = feed_from_cache(cache_record)
+    elif feed is not None:
+        feed['parser'] = 'stream'
+        feed['truncated'] = stream_parser.done
+    else:
+        if parse_pool is not None:
+            feed_title, entries, seconds = parse_pool.parse(body, response_headers)
+        else:
+            feed_title, entries, seconds = parse_feed_body(body, response_headers)
+        feed = feed_from_record(feed_title, entries)
+        parse_seconds += seconds
+        feed['parser'] = 'feedparser'
+        feed['truncated'] = False
+    feed['parse_seconds'] = parse_seconds
+    feed['fingerprint'] = fingerprint
+    feed['unchanged'] = unchanged
+    feed['status'] = response.status_code
+    feed['etag'] = response.headers.get('ETag')
+    feed['modified'] = response.headers.get('Last-Modified')
+    feed['bytes_read'] = len(body) + drained
+    return feed
+
+def _timed_fetch(feed_url, cache_record, read_timeout, parse_pool=None, deadline=None, started_at=None,
+                 archive=None, host_pool=None):
+    """Run fetch_feed() in a worker, returning (feed, error, seconds taken).
+
+    With a deadline (time.monotonic() value), timeouts are cut to the time left,
+    and a feed that can't start or finish in time gets a DeadlineExceededError.
+    With a host_pool (a FeedHostPool), the fetch first waits for a slot on the
+    feed's host and goes over the pool's connections; it is timed from then.
+    The start time is noted in started_at, if given.
+    """
+    try:
+        with host_pool.slot(feed_url, deadline) if host_pool is not None else nullcontext() as session:
+            started = time.monotonic()
+            if started_at is not None:
+                started_at[feed_url] = started
+            connect_timeout = FEED_CONNECT_TIMEOUT
+            capped = False
+            if deadline is not None:
+                remaining = deadline - started
+                if remaining <= 0:
+                    return None, DeadlineExceededError("Not fetched: time budget used up"), 0.0
+                capped = remaining < read_timeout
+                read_timeout = min(read_timeout, remaining)
+                connect_timeout = min(connect_timeout, remaining)
+            try:
+                feed = fetch_feed(feed_url, cache_record, connect_timeout=connect_timeout, read_timeout=read_timeout,
+                                  parse_pool=parse_pool, archive=archive, session=session)
+                return feed, None, time.monotonic() - started
+            except requests.Timeout as e:
+                if capped:
+                    e = DeadlineExceededError(f"Not finished when the time budget ran out ({e})")
+                return None, e, time.monotonic() - started
+            except Exception as e:
+                return None, e, time.monotonic() - started
+    except DeadlineExceededError as e:
+        # The time budget ran out while waiting for the host
+        return None, e, 0.0
+
+def fetch_feeds(feed_urls, max_workers=FEED_FETCH_CONCURRENCY, feed_cache=None, feed_stats=None, health=None,
+                timer=None, parse_pool=None, deadline=None, archive=None, host_pool=None):
+    """Fetch many feeds concurrently.
+
+    Returns a dict mapping each feed URL to a (feed, error) tuple, where exactly
+    one of the two is set. Total wall-clock time is bounded by the slowest feed
+    rather than the sum of all of them.
+
+    If a feed cache is given, requests are conditional and the cache is updated
+    in place; cache hits, unchanged bodies and byte counts are added to feed_stats. If a health
+    tracker is given, feeds with an open circuit are skipped (error is a
+    CircuitOpenError), read timeouts adapt per feed, and outcomes are recorded.
+    If a RunTimer is given, parse time is added to its "parse" span. Full
+    parses run in parse_pool (a FeedParsePool) if given.
+
+    With a deadline (a time.monotonic() value), the call returns by then:
+    feeds are started in order of health value, and any not done in time
+    get a DeadlineExceededError (not counted against their health).
+
+    Responses are recorded to, or replayed from, archive (a FeedArchive) if given.
+
+    With a host_pool (a FeedHostPool), feeds go over their host's keep-alive
+    connections within its politeness limits, slowest hosts first, and
+    feed_stats['hosts'] gets the pool's summary.
+    """
+    results = {}
+    unique_urls = list(dict.fromkeys(feed_urls))
+    if not unique_urls:
+        return results
+
+    cached_feeds = feed_cache['feeds'] if feed_cache is not None else {}
+    if feed_stats is None:
+        feed_stats = {}
+    for key in ('cache_hits', 'unchanged_feeds', 'bytes_downloaded', 'bytes_saved'):
+        feed_stats.setdefault(key, 0)
+
+    if health is not None:
+        for feed_url in unique_urls:
+            if health.is_open(feed_url):
+                results[feed_url] = (None, CircuitOpenError("Skipped: feed keeps failing, will retry later"))
+        unique_urls = [feed_url for feed_url in unique_urls if feed_url not in results]
+        if not unique_urls:
+            return results
+
+        # Most fresh articles per second of latency first, so a budget cut drops the least valuable
+        unique_urls.sort(key=health.value, reverse=True)
+    if host_pool is not None:
+        unique_urls = host_pool.schedule(unique_urls, health)
+
+    def record_result(feed_url, future):
+        feed, error, latency = future.result()
+        METRICS.inc('newsmonitor_feed_fetch_seconds_total', latency, feed=feed_url)
+        if host_pool is not None and latency > 0:
+            host_pool.record_latency(feed_url, latency)
+        if isinstance(error, DeadlineExceededError):
+            METRICS.inc('newsmonitor_feed_fetches_total', feed=feed_url, outcome='deadline')
+            results[feed_url] = (None, error)
+            if health is not None and latency > 0:
+                health.record_latency(feed_url, latency)
+            return
+        if error is not None:
+            METRICS.inc('newsmonitor_feed_fetches_total', feed=feed_url, outcome='error')
+            results[feed_url] = (None, error)
+            if health is not None:
+                health.record_failure(feed_url, error)
+            return
+
+        results[feed_url] = (feed, None)
+        outcome = 'ok'
+        if feed.get('status') == 304:
+            outcome = 'not_modified'
+        elif feed.get('unchanged'):
+            outcome = 'unchanged'
+        METRICS.inc('newsmonitor_feed_fetches_total', feed=feed_url, outcome=outcome)
+        METRICS.inc('newsmonitor_feed_bytes_total', feed.get('bytes_read', 0), feed=feed_url)
+        if 'parser' in feed:
+            METRICS.inc('newsmonitor_feed_parses_total', parser=feed['parser'],
+                        truncated=str(feed['truncated']).lower())
+        if timer is not None and 'parse_seconds' in feed:
+            timer.add('parse', feed['parse_seconds'])
+        if health is not None:
+            health.record_success(feed_url, latency)
+        if feed.get('status') == 304:
+            feed_stats['cache_hits'] += 1
+            feed_stats['bytes_saved'] += cached_feeds[feed_url].get('content_length', 0)
+        else:
+            feed_stats['bytes_downloaded'] += feed.get('bytes_read', 0)
+            if feed.get('unchanged'):
+                feed_stats['unchanged_feeds'] += 1
+            if feed_cache is not None:
+                # Kept even without validators: the fingerprint still spares a parse
+                cached_feeds[feed_url] = build_feed_cache_record(feed)
+
+    workers = max(1, min(max_workers, len(unique_urls)))
+    started_at = {}
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            executor.submit(
+                _timed_fetch, url, cached_feeds.get(url),
+                health.read_timeout(url) if health is not None else FEED_READ_TIMEOUT,
+                parse_pool, deadline, started_at, archive, host_pool
+            ): url
+            for url in unique_urls
+        }
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                record_result(futures[future], future)
+        except FuturesTimeoutError:
+            # Out of time: keep what finished, drop the rest
+            for future, feed_url in futures.items():
+                if feed_url in results:
+                    continue
+                if future.done() and not future.cancelled():
+                    record_result(feed_url, future)
+                else:
+                    future.cancel()
+                    METRICS.inc('newsmonitor_feed_fetches_total', feed=feed_url, outcome='deadline')
+                    results[feed_url] = (None, DeadlineExceededError("Not finished when the time budget ran out"))
+                    # Slow enough to still be running counts towards the feed's latency
+                    if health is not None and feed_url in started_at:
+                        health.record_latency(feed_url, time.monotonic() - started_at[feed_url])
+    finally:
+        # Threads still downloading are abandoned; their timeouts end them shortly
+        executor.shutdown(wait=deadline is None, cancel_futures=True)
+
+    if host_pool is not None:
+        feed_stats['hosts'] = host_pool.summary()
+    return results
+
+def extract_feed_articles(feed, cutoff_date, entries=None):
+    """Turn the top entries of a parsed feed (or the given ones) into Articles, skipping old ones."""
+    articles = []
+    skipped_undated = skipped_old = skipped_no_url = 0
+    if entries is None:
+        entries = feed.entries[:ENTRIES_PER_FEED]  # Get top 5 from each feed
+
+    for entry in entries:
+        title = entry.get('title', 'No title')
+
+        # Check article date - skip old articles
+        published = entry.get('published', entry.get('updated', ''))
+
+        # Parse the date
+        article_date = None
+        if published:
+            try:
+                # Try parsing with feedparser's time
+                if hasattr(entry, 'published_parsed') and entry.published_parsed:
+                    article_date = datetime(*entry.published_parsed[:6])
+                elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
+                    article_date = datetime(*entry.updated_parsed[:6])
+            except:
+                pass
+
+        # Skip articles without a date or older than 7 days
+        if not article_date:
+            skipped_undated += 1
+            continue
+        if article_date < cutoff_date:
+            skipped_old += 1
+            continue
+
+        # Extract article data
+        description = entry.get('summary', entry.get('description', 'No description available.'))
+
+        # Clean up description: plain, escaped text cut to DESCRIPTION_MAX_LENGTH
+        description = summarize_html(description)
+
+        link = entry.get('link', '')
+
+        # Skip articles without a valid URL (can't be deduplicated)
+        if not link:
+            skipped_no_url += 1
+            continue
+
+        # Extract source name from feed
+        source = feed.feed.get('title', 'Unknown Source')
+
+        articles.append(Article(
+            title, source, link,
+            published_at=published,
+            published_ts=article_date.replace(tzinfo=timezone.utc).timestamp(),
+            description=description if description else "No description available."
+        ))
+
+    if skipped_undated or skipped_old or skipped_no_url:
+        log(f"    Skipped {skipped_old} old, {skipped_undated} undated, {skipped_no_url} link-less entries", 'debug')
+
+    return articles
+
+def new_feed_stats():
+    return {
+        'total_feeds': 0,
+        'successful_feeds': 0,
+        'failed_feeds': [],
+        'skipped_feeds': [],
+        'partial': False,
+        'total_articles': 0,
+        'duplicates_removed': 0,
+        'previously_sent': 0,
+        'near_duplicates': 0,
+        'canonical_duplicates': 0,
+        'cache_hits': 0,
+        'unchanged_feeds': 0,
+        'bytes_downloaded': 0,
+        'bytes_saved': 0,
+        'hosts': None
+    }
+
+def poll_feeds(cutoff_date, feed_stats, timer, deadline=None, archive=None):
+    """Fetch every feed in RSS_FEEDS and extract its recent articles, by category.
+
+    Updates the feed cache and feed health files, and fills in the feed
+    counters and 'feed_health' in feed_stats. Feeds dropped at the deadline
+    (a time.monotonic() value) are listed in 'skipped_feeds' and the run is
+    marked 'partial'. A feed answering with an HTTP error counts as successful
+    with no entries, as it did when feedparser fetched feeds itself.
+
+    With a recording FeedArchive, requests are unconditional (every feed's
+    body ends up in the archive) and the feed cache is left alone. When
+    replaying one, the recorded feeds are used instead of RSS_FEEDS, and
+    neither the feed cache nor feed health is read or saved, and feeds aren't
+    held to per-host limits.
+    """
+    replaying = archive is not None and archive.replaying
+    rss_feeds = archive.rss_feeds if replaying else RSS_FEEDS
+    all_feed_urls = [feed_url for feed_urls in rss_feeds.values() for feed_url in feed_urls]
+    feed_cache = load_feed_cache() if archive is None else None
+    health = FeedHealthTracker(None if replaying else FEED_HEALTH_FILE)
+    parse_pool = get_parse_pool()
+    with timer.span('fetch'):
+        with FeedHostPool(all_feed_urls) if not replaying else nullcontext() as host_pool:
+            fetched_feeds = fetch_feeds(all_feed_urls, feed_cache=feed_cache, feed_stats=feed_stats,
+                                        health=health, timer=timer, parse_pool=parse_pool, deadline=deadline,
+                                        archive=archive, host_pool=host_pool)
+    if feed_cache is not None:
+        save_feed_cache(feed_cache)
+    hosts = feed_stats.get('hosts') or {'connections': 0, 'handshakes_saved': 0}
+    log(f"Fetched {len(fetched_feeds)} feeds in {timer.spans['fetch'][0]:.1f}s "
+        f"({feed_stats['cache_hits']} not modified, {feed_stats['bytes_downloaded']} bytes downloaded, "
+        f"{feed_stats['bytes_saved']} bytes saved, {hosts['connections']} connections opened, "
+        f"{hosts['handshakes_saved']} handshakes saved)")
+
+    articles_by_category = {}
+    for category, feed_urls in rss_feeds.items():
+        log(f"Processing {category}...", 'debug')
+        articles = []
+
+        # Collect articles from each RSS feed in the category
+        for feed_url in feed_urls:
+            feed_stats['total_feeds'] += 1
+            feed, error = fetched_feeds[feed_url]
+
+            if isinstance(error, CircuitOpenError):
+                log(f"  Skipping {feed_url}: circuit open")
+                feed_stats['skipped_feeds'].append({'url': feed_url, 'category': category, 'reason': 'circuit_open'})
+                continue
+
+            if isinstance(error, DeadlineExceededError):
+                log(f"  Skipping {feed_url}: {error}", 'warning')
+                feed_stats['skipped_feeds'].append({'url': feed_url, 'category': category, 'reason': 'deadline'})
+                feed_stats['partial'] = True
+                continue
+
+            if isinstance(error, requests.HTTPError):
+                # Counted the way feedparser.parse(url) counted it, as a feed with no entries;
+                # feed health still has it as a failure, for the circuit breaker
+                log(f"  No entries from {feed_url}: {error}", 'warning')
+                feed_stats['successful_feeds'] += 1
+                continue
+
+            if error is None:
+                try:
+                    log(f"  Parsing feed: {feed_url}", 'debug')
+                    with timer.span('filter'):
+                        feed_articles = extract_feed_articles(feed, cutoff_date)
+                    health.record_yield(feed_url, len(feed_articles))
+                    articles.extend(feed_articles)
+                except Exception as e:
+                    health.record_failure(feed_url, e)
+                    error = e
+
+            if error is not None:
+                log(f"  Error parsing {feed_url}: {str(error)}", 'warning')
+                feed_stats['failed_feeds'].append({
+                    'url': feed_url,
+                    'error': str(error),
+                    'category': category
+                })
+                continue
+
+            feed_stats['successful_feeds'] += 1
+
+        articles_by_category[category] = articles
+
+    health.save()
+    feed_stats['feed_health'] = health.summary(all_feed_urls)
+    return articles_by_category
+
+def score_articles(articles_by_category, now=None):
+    """Score every candidate of a run at once (see RANKING_WEIGHTS).
+
+    The only per-article Python work is reading its fields and intersecting
+    its cached word counts with its category's profile; the rest is array
+    arithmetic. Articles whose words haven't been counted yet (Article.terms,
+    normally counted by near-duplicate detection first) are counted here,
+    which is most of the cost: about 20us an article against 5us once
+    counted (benchmarks/bench_rank.py). `now` (epoch seconds) is what recency
+    is measured from.
+
+    Returns (candidates in category order, their category indexes, publication
+    times, scores), the last three as arrays.
+    """
+    categories = list(articles_by_category)
+    candidates = [article for category in categories for article in articles_by_category[category]]
+    count = len(candidates)
+    now = time.time() if now is None else now
+    category_ids = np.repeat(np.arange(len(categories)), [len(articles_by_category[c]) for c in categories])
+
+    # One pass over the candidates for their fields and the words of their
+    # category's profile they use (how many, then a column and a count for each)
+    published, carriers, source_weights = [], [], []
+    columns = {}
+    hits_per_candidate, hit_columns, counts = [], [], []
+    for category in categories:
+        profile = frozenset(TOPIC_PROFILES.get(category, '').split())
+        for word in profile:
+            columns.setdefault(word, len(columns))
+        for article in articles_by_category[category]:
+            published.append(article.published_ts)
+            carriers.append(len(article.alternates) + 1)
+            source_weights.append(SOURCE_WEIGHTS.get(article.source, 1.0))
+            terms = article.terms
+            hits = profile.intersection(terms)
+            hits_per_candidate.append(len(hits))
+            hit_columns.extend(map(columns.__getitem__, hits))
+            counts.extend(map(terms.__getitem__, hits))
+
+    published = np.array(published, dtype=float)
+    recency = np.exp2(-np.maximum(now - published, 0) / (RANKING_HALF_LIFE_HOURS * 3600))
+    coverage = 1 - 1 / np.array(carriers, dtype=float)
+    topic = np.zeros(count)
+    if hit_columns:
+        rows = np.repeat(np.arange(count), hits_per_candidate)
+        hit_columns = np.array(hit_columns)
+        counts = np.array(counts, dtype=float)
+        # Document frequency among the candidates whose profile has the word
+        idf = np.log(count / np.bincount(hit_columns, minlength=len(columns)).clip(min=1))
+        topic = np.bincount(rows, weights=idf[hit_columns] * counts / (counts + 1), minlength=count)
+        topic /= topic + RANKING_TOPIC_SATURATION
+
+    scores = (RANKING_WEIGHTS['recency'] * recency + RANKING_WEIGHTS['coverage'] * coverage
+              + RANKING_WEIGHTS['topic'] * topic) * np.array(source_weights)
+    return candidates, category_ids, published, scores
+
+def poll_new_entries(alert_state, cutoff_date, feed_stats, timer, deadline=None):
+    """Fetch every feed in RSS_FEEDS and extract the entries no earlier alert poll saw, by category.
+
+    alert_state (loaded with load_feed_cache) holds each feed's cache record
+    under 'feeds' and the ids of its last entries under 'seen'; both are
+    updated in place. Feeds answering 304 or sending an unchanged body are
+    skipped whole, and seen entries are dropped before becoming Articles. A
+    feed's first poll only notes its entries, so a new feed's backlog isn't
+    taken for breaking news. Counts go to feed_stats ('seen_entries',
+    'new_entries' and the usual feed counters).
+    """
+    all_feed_urls = [feed_url for feed_urls in RSS_FEEDS.values() for feed_url in feed_urls]
+    seen_by_feed = alert_state.setdefault('seen', {})
+    health = FeedHealthTracker(FEED_HEALTH_FILE)
+    with timer.span('fetch'), FeedHostPool(all_feed_urls) as host_pool:
+        fetched_feeds = fetch_feeds(all_feed_urls, feed_cache=alert_state, feed_stats=feed_stats, health=health,
+                                    timer=timer, parse_pool=get_parse_pool(), deadline=deadline,
+                                    host_pool=host_pool)
+    feed_stats.setdefault('seen_entries', 0)
+    feed_stats.setdefault('new_entries', 0)
+
+    articles_by_category = {}
+    for category, feed_urls in RSS_FEEDS.items():
+        articles = []
+        for feed_url in feed_urls:
+            feed_stats['total_feeds'] += 1
+            feed, error = fetched_feeds[feed_url]
+
+            if isinstance(error, (CircuitOpenError, DeadlineExceededError)):
+                reason = 'circuit_open' if isinstance(error, CircuitOpenError) else 'deadline'
+                feed_stats['skipped_feeds'].append({'url': feed_url, 'category': category, 'reason': reason})
+                feed_stats['partial'] = feed_stats['partial'] or reason == 'deadline'
+                continue
+            if isinstance(error, requests.HTTPError):
+                # A feed with no entries, as in poll_feeds(); its seen entries are kept for the next poll
+                log(f"  No entries from {feed_url}: {error}", 'warning')
+                feed_stats['successful_feeds'] += 1
+                continue
+            if error is not None:
+                log(f"  Error fetching {feed_url}: {error}", 'warning')
+                feed_stats['failed_feeds'].append({'url': feed_url, 'error': str(error), 'category': category})
+                continue
+            feed_stats['successful_feeds'] += 1
+            if feed.get('status') == 304 or feed.get('unchanged'):
+                continue
+
+            # Entries are told apart by id (an RSS guid or Atom id), else by link
+            entries = feed.entries[:ENTRIES_PER_FEED]
+            entry_ids = [entry.get('id') or entry.get('link') or entry.get('title', '') for entry in entries]
+            seen = seen_by_feed.get(feed_url)
+            seen_by_feed[feed_url] = list(dict.fromkeys(entry_ids + (seen or [])))[:ALERT_SEEN_PER_FEED]
+            if seen is None:
+                feed_stats['seen_entries'] += len(entries)
+                continue
+            seen = set(seen)
+            new_entries = [entry for entry, entry_id in zip(entries, entry_ids) if entry_id not in seen]
+            feed_stats['seen_entries'] += len(entries) - len(new_entries)
+            feed_stats['new_entries'] += len(new_entries)
+            if new_entries:
+                with timer.span('filter'):
+                    articles.extend(extract_feed_articles(feed, cutoff_date, new_entries))
+
+        articles_by_category[category] = articles
+
+    health.save()
+    return articles_by_category
+
+class NewsAPIError(Exception):
+    """NewsAPI answered a request with an error (or kept rate-limiting it)."""
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delay seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class NewsAPISource:
+    """NewsAPI top headlines as Articles, one request per category.
+
+    Categories are fetched concurrently over one requests.Session, whose
+    pool keeps a keep-alive connection per worker, with connect and read
+    timeouts. urllib3's Retry retries connection errors and 5xx answers with
+    backoff. 429s are handled here, so that one Retry-After pauses every
+    worker rather than each finding the limit on its own. `stats` counts
+    requests, retries, rate-limited answers and connections opened.
+    """
+
+    def __init__(self, api_key=NEWS_API_KEY, url=NEWSAPI_URL, categories=NEWSAPI_CATEGORIES,
+                 concurrency=NEWSAPI_CONCURRENCY, retries=NEWSAPI_RETRIES):
+        self.url = url
+        self.categories = dict(categories)
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.session = requests.Session()
+        # The key goes in a header, so it stays out of URLs and logs
+        self.session.headers.update({'X-Api-Key': api_key or '', 'User-Agent': feedparser.USER_AGENT})
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, max_retries=Retry(
+            total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']), raise_on_status=False,
+            # Left to fetch_category(), or each worker would sit out its own Retry-After
+            respect_retry_after_header=False
+        ))
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'connections': 0}
+
+    def _wait_for_rate_limit(self):
+        with self._lock:
+            wait = self._resume_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def fetch_category(self, category):
+        """The raw article records of one category's top headlines."""
+        params = {'category': self.categories[category], 'country': NEWSAPI_COUNTRY, 'pageSize': NEWSAPI_PAGE_SIZE}
+        for attempt in range(self.retries + 1):
+            self._wait_for_rate_limit()
+            response = self.session.get(self.url, params=params,
+                                        timeout=(NEWSAPI_CONNECT_TIMEOUT, NEWSAPI_READ_TIMEOUT))
+            retries = getattr(response.raw, 'retries', None)
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['retries'] += len(retries.history) if retries is not None else 0
+            if response.status_code != 429:
+                break
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is None:
+                retry_after = 2 ** attempt
+            if retry_after > NEWSAPI_MAX_RETRY_AFTER or attempt == self.retries:
+                with self._lock:
+                    self.stats['rate_limited'] += 1
+                raise NewsAPIError(f"Rate limited (retry after {retry_after:.0f}s)")
+            with self._lock:
+                self.stats['rate_limited'] += 1
+                self.stats['retries'] += 1
+                self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code != 200 or data.get('status') == 'error':
+            raise NewsAPIError(f"HTTP {response.status_code}: {data.get('message') or response.reason}")
+        return data.get('articles') or []
+
+    def articles_from_records(self, records, cutoff_date):
+        """Turn NewsAPI article records into Articles, skipping old, undated and removed ones."""
+        cutoff = cutoff_date.timestamp()
+        articles = []
+        for record in records:
+            title, link = record.get('title'), record.get('url')
+            # Articles taken down by their publisher come back as "[Removed]"
+            if not title or not link or title == '[Removed]':
+                continue
+            published = record.get('publishedAt') or ''
+            try:
+                published_ts = parse_search_date(published)
+            except ValueError:
+                published_ts = None
+            if published_ts is None or published_ts < cutoff:
+                continue
+            articles.append(Article(
+                title, (record.get('source') or {}).get('name') or 'NewsAPI', link,
+                published_at=published,
+                published_ts=published_ts,
+                description=summarize_html(record.get('description') or '') or "No description available."
+            ))
+        return articles
+
+    def fetch(self, cutoff_date, feed_stats, timer):
+        """Every category's recent articles, with each category counted as a feed in feed_stats."""
+        results = {}
+        with timer.span('fetch'):
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(self.categories) or 1)) as executor:
+                futures = {executor.submit(self.fetch_category, category): category for category in self.categories}
+                for future in as_completed(futures):
+                    try:
+                        results[futures[future]] = (future.result(), None)
+                    except Exception as e:
+                        results[futures[future]] = (None, e)
+
+        articles_by_category = {}
+        for category in self.categories:
+            records, error = results[category]
+            feed_stats['total_feeds'] += 1
+            feed = f"newsapi:{self.categories[category]}"
+            if error is not None:
+                log(f"  Error fetching NewsAPI {category}: {error}", 'warning')
+                METRICS.inc('newsmonitor_feed_fetches_total', feed=feed, outcome='error')
+                feed_stats['failed_feeds'].append({'url': feed, 'error': str(error), 'category': category})
+                articles_by_category[category] = []
+                continue
+            METRICS.inc('newsmonitor_feed_fetches_total', feed=feed, outcome='ok')
+            feed_stats['successful_feeds'] += 1
+            with timer.span('filter'):
+                articles_by_category[category] = self.articles_from_records(records, cutoff_date)
 
-def load_sent_articles():
-    """Load the history of sent articles from file."""
-    try:
-        if SENT_ARTICLES_FILE.exists():
-            with open(SENT_ARTICLES_FILE, 'r') as f:
-                data = json.load(f)
-                # Clean up old entries (older than 30 days)
-                cutoff_date = (datetime.now() - timedelta(days=30)).isoformat()
-                data['articles'] = {
-                    url: timestamp for url, timestamp in data.get('articles', {}).items()
-                    if timestamp > cutoff_date
-                }
-                return data
-    except Exception as e:
-        print(f"Error loading sent articles: {e}")
+        pools = self.adapter.poolmanager.pools
+        self.stats['connections'] = sum(pools[key].num_connections for key in pools.keys())
+        feed_stats['newsapi'] = dict(self.stats)
+        feed_stats.setdefault('feed_health', [])
+        log(f"Fetched {len(self.categories)} NewsAPI categories in {timer.spans['fetch'][0]:.1f}s "
+            f"({self.stats['requests']} requests over {self.stats['connections']} connections)")
+        return articles_by_category
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
 
-    return {'articles': {}, 'last_updated': datetime.now().isoformat()}
+    def __exit__(self, *exc_info):
+        self.close()
 
-def save_sent_articles(sent_articles):
-    """Save the history of sent articles to file."""
+def rank_digest(articles_by_category, per_category=DIGEST_ARTICLES_PER_CATEGORY, now=None):
+    """Each category's top per_category articles for the digest, best first.
+
+    Articles are ordered by score_articles(), ties going to the newer article.
+    """
+    categories = list(articles_by_category)
+    if not any(articles_by_category.values()):
+        return {category: [] for category in categories}
+    candidates, category_ids, published, scores = score_articles(articles_by_category, now)
+    order = np.lexsort((-published, -scores, category_ids))
+    bounds = np.searchsorted(category_ids[order], np.arange(len(categories) + 1))
+    return {
+        category: [candidates[i] for i in order[bounds[c]:min(bounds[c] + per_category, bounds[c + 1])]]
+        for c, category in enumerate(categories)
+    }
+
+def deliver_digest(articles_by_category, feed_stats, timer, history_store, now=None,
+                   subject="Your Top News Update", dry_run=False):
+    """Send the digest of a run's articles, whichever source they came from.
+
+    Collapses near-duplicates, drops repeats and articles every subscriber
+    was already sent (history_store keeps it per subscriber profile, see
+    SubscriberHistory), ranks (as of `now`, epoch seconds, if given), works
+    out each subscriber's digest, leaving out what they already got, and
+    renders and sends each distinct one. What was sent to whom is then saved
+    to history_store, which is closed in any case. Fills in the dedup
+    counters and 'total_articles' of feed_stats.
+
+    With dry_run, the digests are rendered and measured but nothing is sent
+    (so 'delivery_results' is empty) or saved to history_store.
+
+    Returns a dict with the 'delivery_results' (see send_email()), 'email'
+    (the first digest's size report) and 'subscribers' counts.
+    """
     try:
-        sent_articles['last_updated'] = datetime.now().isoformat()
-        SENT_ARTICLES_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(SENT_ARTICLES_FILE, 'w') as f:
-            json.dump(sent_articles, f, indent=2)
-        print(f"Saved {len(sent_articles['articles'])} article URLs to history")
-    except Exception as e:
-        print(f"Error saving sent articles: {e}")
+        subscriptions = load_subscriptions()
+        history = SubscriberHistory(history_store, subscriptions)
 
-def get_article_hash(article):
-    """Generate a unique hash for an article based on URL or title."""
-    # Use URL as primary identifier, fallback to title
-    identifier = article.get('url', '') or article.get('title', '')
-    return hashlib.md5(identifier.encode()).hexdigest()
+        # Collapse the same story carried by several feeds, across all categories
+        with timer.span('dedup'):
+            articles_by_category, near_duplicates = cluster_near_duplicates(articles_by_category,
+                                                                            feed_stats=feed_stats)
+        feed_stats['near_duplicates'] = near_duplicates
+        feed_stats['duplicates_removed'] += near_duplicates
+        log(f"Collapsed {near_duplicates} near-duplicate articles")
 
-def deduplicate_articles(articles, sent_articles_history):
-    """Remove duplicate articles and filter out previously sent ones."""
-    seen_urls = set()
-    seen_hashes = set()
-    deduplicated = []
+        for category, articles in articles_by_category.items():
+            # Deduplicate articles before limiting
+            original_count = len(articles)
+            with timer.span('dedup'):
+                articles = deduplicate_articles(articles, history, feed_stats)
+            duplicates_removed = original_count - len(articles)
+            feed_stats['duplicates_removed'] += duplicates_removed
+            articles_by_category[category] = articles
 
-    for article in articles:
-        url = article.get('url', '')
-        article_hash = get_article_hash(article)
+            if duplicates_removed > 0:
+                log(f"  Removed {duplicates_removed} duplicate/previously-sent {category} articles", 'debug')
 
-        # Skip if we've seen this URL in current batch
-        if url and url in seen_urls:
-            print(f"  Skipping duplicate in current batch: {article.get('title', 'No title')[:50]}")
-            continue
+        # Rank each category's unique articles, scored across the whole run
+        with timer.span('rank'):
+            ranked = rank_digest(articles_by_category, per_category=SUBSCRIBER_POOL_PER_CATEGORY, now=now)
+        for category, unique_articles in ranked.items():
+            log(f"  Found {len(unique_articles)} unique articles for {category}", 'debug')
 
-        # Skip if we've seen this article hash in current batch
-        if article_hash in seen_hashes:
-            print(f"  Skipping duplicate by hash: {article.get('title', 'No title')[:50]}")
-            continue
+        # Work out every subscriber's digest at once; subscribers getting the same one share it
+        with timer.span('match'):
+            digests = SubscriberIndex(subscriptions).match(ranked, received=history.received)
+        log(f"{len(digests)} distinct digests for {len(subscriptions)} subscribers")
 
-        # Skip if we've sent this article before (within last 30 days)
-        if url and url in sent_articles_history.get('articles', {}):
-            print(f"  Skipping previously sent: {article.get('title', 'No title')[:50]}")
-            continue
+        # Format each distinct digest once with stats, trimmed to the size budget, and send it
+        delivery_results = []
+        email_size = None
+        sent_articles = {}
+        deliveries = []
+        rendered = empty_digests = 0
+        with SMTPSender() if not dry_run else nullcontext() as sender:
+            for news_data, subscribers in digests:
+                if not any(news_data.values()):
+                    empty_digests += len(subscribers)
+                    continue
+                with timer.span('render'):
+                    news_data, email_content, plain_text, size = render_digest(news_data, feed_stats, subject)
+                rendered += 1
+                if not dry_run:
+                    with timer.span('send'):
+                        delivery_results += send_email(subject, email_content,
+                                                       [subscriber.email for subscriber in subscribers],
+                                                       sender=sender, plain_text=plain_text)
+                if email_size is None:
+                    email_size = size
+                # The articles (and the other sources carrying them) these subscribers got;
+                # articles dropped to fit the email stay eligible for their next digest
+                url_keys = []
+                for articles in news_data.values():
+                    for article in articles:
+                        sent_articles[article.url_key] = article
+                        url_keys.append(article.url_key)
+                        url_keys += [alternate.url_key for alternate in article.alternates]
+                deliveries.append((subscribers, url_keys))
+        feed_stats['total_articles'] = len(sent_articles)
+        delivered = sum(1 for result in delivery_results if result['status'] == 'sent')
 
-        # This is a new, unique article
-        if url:
-            seen_urls.add(url)
-        seen_hashes.add(article_hash)
-        deduplicated.append(article)
+        # Save sent articles to history to prevent future duplicates
+        if not dry_run:
+            with timer.span('history'):
+                history.mark_sent(deliveries)
+    finally:
+        with timer.span('history'):
+            history_store.close()
 
-    return deduplicated
+    if not dry_run:
+        METRICS.inc('newsmonitor_articles_sent_total', feed_stats['total_articles'])
+    METRICS.inc('newsmonitor_emails_sent_total', delivered, outcome='sent')
+    METRICS.inc('newsmonitor_emails_sent_total', len(delivery_results) - delivered, outcome='failed')
+    log(f"Total articles sent: {feed_stats['total_articles']}")
+    log(f"Total duplicates removed: {feed_stats['duplicates_removed']} "
+        f"({feed_stats['canonical_duplicates']} caught by URL canonicalization)")
+
+    return {
+        'delivery_results': delivery_results,
+        'email': email_size,
+        'subscribers': {
+            'total': len(subscriptions),
+            'digests': rendered,
+            'without_articles': empty_digests
+        }
+    }
+
+def get_route(path):
+    """Which handler route a request path asks for ("digest" unless told otherwise)."""
+    parts = urlsplit(path or '/')
+    route = parse_qs(parts.query).get('route', [''])[0]
+    if route:
+        return route
+    last_segment = parts.path.rstrip('/').rsplit('/', 1)[-1]
+    return last_segment if last_segment in ('alert', 'ingest', 'metrics', 'search') else 'digest'
+
+def parse_search_date(value):
+    """Epoch seconds for an ISO 8601 date or datetime (UTC unless it says otherwise), or None."""
+    if not value:
+        return None
+    date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
 
 class handler(BaseHTTPRequestHandler):
     """Vercel serverless function handler"""
@@ -165,237 +3120,444 @@ class handler(BaseHTTPRequestHandler):
         api_key = self.headers.get('X-API-KEY') or self.headers.get('x-api-key')
 
         if api_key != MY_SECRET_API_KEY:
-            self.send_response(403)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Forbidden: Invalid API key"}).encode())
+            METRICS.inc('newsmonitor_requests_total', route=get_route(self.path), status='403')
+            self.send_json(403, {"error": "Forbidden: Invalid API key"})
+            return
+
+        route = get_route(self.path)
+        routes = {
+            'digest': self.handle_digest,
+            'alert': self.handle_alert,
+            'ingest': self.handle_ingest,
+            'metrics': self.handle_metrics,
+            'search': self.handle_search
+        }
+        if route not in routes:
+            METRICS.inc('newsmonitor_requests_total', route='unknown', status='404')
+            self.send_json(404, {"error": f"Unknown route: {route}"})
+            return
+        routes[route]()
+
+    def send_json(self, status, data):
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
+
+    def handle_metrics(self):
+        """Process-wide counters in Prometheus text exposition format."""
+        METRICS.inc('newsmonitor_requests_total', route='metrics', status='200')
+        body = METRICS.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_search(self):
+        """Search the article archive.
+
+        Query parameters: q (keywords; all must match, word* for a prefix),
+        category, source, since and until (ISO dates), page and per_page.
+        """
+        query = parse_qs(urlsplit(self.path).query)
+
+        def param(name, default=None):
+            return query.get(name, [default])[0]
+
+        try:
+            page = max(1, int(param('page', '1')))
+            per_page = min(SEARCH_MAX_PAGE_SIZE, max(1, int(param('per_page', str(SEARCH_PAGE_SIZE)))))
+            since = parse_search_date(param('since'))
+            until = parse_search_date(param('until'))
+        except ValueError as e:
+            METRICS.inc('newsmonitor_requests_total', route='search', status='400')
+            self.send_json(400, {"error": f"Bad search parameter: {e}"})
             return
 
         try:
-            # Load history of sent articles
-            sent_articles_history = load_sent_articles()
-            new_articles_sent = []
+            started = time.perf_counter()
+            article_archive = ArticleArchive()
+            results, has_more = article_archive.search(
+                param('q', ''), category=param('category'), source=param('source'),
+                since=since, until=until, page=page, per_page=per_page
+            )
+            article_archive.close()
+            METRICS.inc('newsmonitor_requests_total', route='search', status='200')
+            self.send_json(200, {
+                "query": param('q', ''),
+                "page": page,
+                "per_page": per_page,
+                "has_more": has_more,
+                "results": results,
+                "seconds": round(time.perf_counter() - started, 4)
+            })
 
-            # Fetch news data from RSS feeds
-            import time as time_module
+        except Exception as e:
+            log(f"Error in search: {str(e)}", 'error')
+            METRICS.inc('newsmonitor_requests_total', route='search', status='500')
+            self.send_json(500, {"error": str(e)})
 
-            news_data = {}
-            feed_stats = {
-                'total_feeds': 0,
-                'successful_feeds': 0,
-                'failed_feeds': [],
-                'total_articles': 0,
-                'duplicates_removed': 0,
-                'previously_sent': 0
-            }
+    def handle_ingest(self):
+        """Poll all feeds and upsert their recent articles into the article store."""
+        timer = RunTimer()
+        deadline = time.monotonic() + FEED_FETCH_BUDGET
 
-            # Only include articles from last 7 days
-            cutoff_date = datetime.now() - timedelta(days=7)
+        try:
+            try:
+                archive = open_feed_archive(self.path)
+            except (ValueError, FileNotFoundError) as e:
+                METRICS.inc('newsmonitor_requests_total', route='ingest', status='400')
+                self.send_json(400, {"error": f"Bad archive run: {e}"})
+                return
+            if archive is not None and archive.replaying:
+                METRICS.inc('newsmonitor_requests_total', route='ingest', status='400')
+                self.send_json(400, {"error": "Replays run through the digest route only"})
+                return
 
-            for category, feed_urls in RSS_FEEDS.items():
-                print(f"Fetching {category}...")
-                articles = []
+            feed_stats = new_feed_stats()
+            cutoff_date = datetime.now() - timedelta(days=ARTICLE_RETENTION_DAYS)
+            articles_by_category = poll_feeds(cutoff_date, feed_stats, timer, deadline, archive)
+            archive_run = archive.save() if archive is not None else None
 
-                # Fetch from each RSS feed in the category
-                for feed_url in feed_urls:
-                    feed_stats['total_feeds'] += 1
-                    try:
-                        print(f"  Parsing feed: {feed_url}")
-                        feed = feedparser.parse(feed_url)
-
-                        for entry in feed.entries[:5]:  # Get top 5 from each feed
-                            # Check article date - skip old articles
-                            published = entry.get('published', entry.get('updated', ''))
-
-                            # Parse the date
-                            article_date = None
-                            if published:
-                                try:
-                                    # Try parsing with feedparser's time
-                                    if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                                        article_date = datetime(*entry.published_parsed[:6])
-                                    elif hasattr(entry, 'updated_parsed') and entry.updated_parsed:
-                                        article_date = datetime(*entry.updated_parsed[:6])
-                                except:
-                                    pass
-
-                            # Skip articles without a date or older than 7 days
-                            if not article_date:
-                                print(f"    Skipping article without valid date: {title[:50]}")
-                                continue
-                            if article_date < cutoff_date:
-                                print(f"    Skipping old article from {article_date.strftime('%Y-%m-%d')}")
-                                continue
-
-                            # Extract article data
-                            title = entry.get('title', 'No title')
-                            description = entry.get('summary', entry.get('description', 'No description available.'))
-
-                            # Clean up description (remove HTML tags if present)
-                            import re
-                            description = re.sub('<[^<]+?>', '', description)
-                            description = description.strip()[:300]  # Limit length
-
-                            link = entry.get('link', '')
-
-                            # Skip articles without a valid URL (can't be deduplicated)
-                            if not link:
-                                print(f"    Skipping article without URL: {title[:50]}")
-                                continue
-
-                            # Extract source name from feed
-                            source = feed.feed.get('title', 'Unknown Source')
-
-                            articles.append({
-                                "title": title,
-                                "source": source,
-                                "published_at": published,
-                                "url": link,
-                                "description": description if description else "No description available."
-                            })
-
-                        feed_stats['successful_feeds'] += 1
+            with timer.span('store'):
+                store = ArticleStore()
+                new_articles = store.upsert(articles_by_category)
+                store.record_ingest(feed_stats)
+                store.close()
+            with timer.span('archive'):
+                article_archive = ArticleArchive()
+                archived_articles = article_archive.add(articles_by_category)
+                article_archive.close()
 
-                    except Exception as e:
-                        print(f"  Error parsing {feed_url}: {str(e)}")
-                        feed_stats['failed_feeds'].append({
-                            'url': feed_url,
-                            'error': str(e),
-                            'category': category
-                        })
-                        continue
-
-                # Deduplicate articles before limiting
-                original_count = len(articles)
-                articles = deduplicate_articles(articles, sent_articles_history)
-                duplicates_removed = original_count - len(articles)
-                feed_stats['duplicates_removed'] += duplicates_removed
-
-                if duplicates_removed > 0:
-                    print(f"  Removed {duplicates_removed} duplicate/previously-sent articles")
-
-                # Take top 15 unique articles for this category
-                unique_articles = articles[:15]
-                news_data[category] = unique_articles
-                feed_stats['total_articles'] += len(unique_articles)
-
-                # Track new articles for saving to history
-                for article in unique_articles:
-                    if article.get('url'):
-                        new_articles_sent.append(article['url'])
-
-                print(f"  Found {len(unique_articles)} unique articles for {category}")
-
-            # Format and send email with stats
-            email_content = format_email_content(news_data, feed_stats)
-            send_email("Your Top News Update", email_content)
-
-            # Save sent articles to history to prevent future duplicates
-            for url in new_articles_sent:
-                sent_articles_history['articles'][url] = datetime.now().isoformat()
-            save_sent_articles(sent_articles_history)
-
-            print(f"Total articles sent: {len(new_articles_sent)}")
-            print(f"Total duplicates removed: {feed_stats['duplicates_removed']}")
-
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
+            METRICS.inc('newsmonitor_articles_ingested_total', new_articles)
+            METRICS.inc('newsmonitor_requests_total', route='ingest', status='200')
+            self.send_json(200, {
+                "message": f"Ingested {new_articles} new articles",
+                "stats": {
+                    "articles_seen": sum(len(articles) for articles in articles_by_category.values()),
+                    "new_articles": new_articles,
+                    "archived_articles": archived_articles,
+                    "total_feeds": feed_stats['total_feeds'],
+                    "successful_feeds": feed_stats['successful_feeds'],
+                    "failed_feeds": len(feed_stats['failed_feeds']),
+                    "skipped_feeds": len(feed_stats['skipped_feeds']),
+                    "cache_hits": feed_stats['cache_hits'],
+                    "unchanged_feeds": feed_stats['unchanged_feeds'],
+                    "bytes_downloaded": feed_stats['bytes_downloaded'],
+                    "bytes_saved": feed_stats['bytes_saved']
+                },
+                "partial": feed_stats['partial'],
+                "skipped_feeds": feed_stats['skipped_feeds'],
+                "hosts": feed_stats['hosts'],
+                "archive_run": archive_run,
+                "timings": timer.summary()
+            })
+
+        except Exception as e:
+            log(f"Error in ingest: {str(e)}", 'error')
+            METRICS.inc('newsmonitor_requests_total', route='ingest', status='500')
+            self.send_json(500, {"error": str(e)})
+
+    def handle_alert(self):
+        """Send a short alert for each high-scoring story that appeared since the last alert poll.
+
+        Alerted articles go into the sent history, so the digest won't repeat them.
+        """
+        timer = RunTimer()
+        deadline = time.monotonic() + FEED_FETCH_BUDGET
+
+        try:
+            feed_stats = new_feed_stats()
+            cutoff_date = datetime.now() - timedelta(hours=ALERT_MAX_AGE_HOURS)
+            alert_state = load_feed_cache(ALERT_STATE_FILE)
+            articles_by_category = poll_new_entries(alert_state, cutoff_date, feed_stats, timer, deadline)
+
+            # Only the new entries get this far: dedup them and score them as the digest would
+            subscriptions = load_subscriptions()
+            with timer.span('history'):
+                history_store = open_history_store()
+            try:
+                history = SubscriberHistory(history_store, subscriptions)
+                with timer.span('dedup'):
+                    articles_by_category, near_duplicates = cluster_near_duplicates(articles_by_category,
+                                                                                    feed_stats=feed_stats)
+                    for category, articles in articles_by_category.items():
+                        articles_by_category[category] = deduplicate_articles(articles, history, feed_stats)
+                with timer.span('rank'):
+                    categories = list(articles_by_category)
+                    candidates, category_ids, _, scores = score_articles(articles_by_category)
+                    alerts = {category: [] for category in categories}
+                    alert_scores = {}
+                    for i in np.argsort(-scores, kind='stable')[:ALERT_MAX_ARTICLES]:
+                        if scores[i] >= ALERT_MIN_SCORE:
+                            alerts[categories[category_ids[i]]].append(candidates[i])
+                            alert_scores[candidates[i].url_key] = round(float(scores[i]), 3)
+                with timer.span('match'):
+                    digests = SubscriberIndex(subscriptions).match(alerts, per_category=ALERT_MAX_ARTICLES,
+                                                                   received=history.received)
+
+                delivery_results = []
+                sent_articles = {}
+                deliveries = []
+                with SMTPSender() as sender:
+                    for news_data, subscribers in digests:
+                        if not any(news_data.values()):
+                            continue
+                        with timer.span('render'):
+                            best_first = sorted(
+                                ((category, article) for category, articles in news_data.items()
+                                 for article in articles),
+                                key=lambda item: -alert_scores[item[1].url_key]
+                            )
+                            subject, email_content, plain_text = format_alert_email(best_first)
+                        with timer.span('send'):
+                            delivery_results += send_email(subject, email_content,
+                                                           [subscriber.email for subscriber in subscribers],
+                                                           sender=sender, plain_text=plain_text)
+                        url_keys = []
+                        for category, article in best_first:
+                            sent_articles[article.url_key] = article
+                            url_keys += [article.url_key] + [alt.url_key for alt in article.alternates]
+                        deliveries.append((subscribers, url_keys))
+
+                if deliveries:
+                    with timer.span('history'):
+                        history.mark_sent(deliveries)
+            finally:
+                with timer.span('history'):
+                    history_store.close()
+            save_feed_cache(alert_state, ALERT_STATE_FILE)
+            delivered = sum(1 for result in delivery_results if result['status'] == 'sent')
+
+            METRICS.inc('newsmonitor_alerts_sent_total', len(sent_articles))
+            METRICS.inc('newsmonitor_emails_sent_total', delivered, outcome='sent')
+            METRICS.inc('newsmonitor_emails_sent_total', len(delivery_results) - delivered, outcome='failed')
+            METRICS.inc('newsmonitor_requests_total', route='alert', status='200')
+            log(f"Alert poll: {feed_stats['new_entries']} new entries, {len(sent_articles)} alerted")
+            self.send_json(200, {
+                "message": f"Alerted {len(sent_articles)} stories" if sent_articles else "Nothing to alert",
+                "alerts": [
+                    {"title": article.title, "source": article.source, "url": article.url,
+                     "score": alert_scores[article.url_key]}
+                    for article in sent_articles.values()
+                ],
+                "stats": {
+                    "total_feeds": feed_stats['total_feeds'],
+                    "successful_feeds": feed_stats['successful_feeds'],
+                    "failed_feeds": len(feed_stats['failed_feeds']),
+                    "skipped_feeds": len(feed_stats['skipped_feeds']),
+                    "cache_hits": feed_stats['cache_hits'],
+                    "unchanged_feeds": feed_stats['unchanged_feeds'],
+                    "seen_entries": feed_stats['seen_entries'],
+                    "new_entries": feed_stats['new_entries'],
+                    "near_duplicates": near_duplicates,
+                    "bytes_downloaded": feed_stats['bytes_downloaded'],
+                    "bytes_saved": feed_stats['bytes_saved']
+                },
+                "partial": feed_stats['partial'],
+                "hosts": feed_stats['hosts'],
+                "history": getattr(history_store, 'stats', None),
+                "timings": timer.summary(),
+                "delivery": {
+                    "sent": delivered,
+                    "failed": [result for result in delivery_results if result['status'] != 'sent']
+                }
+            })
+
+        except Exception as e:
+            log(f"Error in alert: {str(e)}", 'error')
+            METRICS.inc('newsmonitor_requests_total', route='alert', status='500')
+            self.send_json(500, {"error": str(e)})
+
+    def handle_digest(self):
+        timer = RunTimer()
+        deadline = time.monotonic() + FEED_FETCH_BUDGET
+
+        try:
+            # Record feed responses, or replay recorded ones; a replay leaves history and the store
+            # alone, and never sends
+            try:
+                archive = open_feed_archive(self.path)
+            except (ValueError, FileNotFoundError) as e:
+                METRICS.inc('newsmonitor_requests_total', route='digest', status='400')
+                self.send_json(400, {"error": f"Bad archive run: {e}"})
+                return
+            replaying = archive is not None and archive.replaying
+            archive_run = None
+
+            # Open history of sent articles
+            with timer.span('history'):
+                history_store = open_history_store('memory' if replaying else None)
+
+            feed_stats = new_feed_stats()
+
+            # Only include articles from last 7 days (of the recorded run, when replaying)
+            cutoff_date = (archive.recorded_at if replaying else datetime.now()) - timedelta(days=7)
+
+            # Read articles from the store if an ingest ran recently, else fetch the feeds now
+            store = ArticleStore()
+            finished_at, ingest_stats = store.last_ingest()
+            source = DIGEST_SOURCE
+            if archive is not None:
+                source = 'replay' if replaying else 'live'
+            elif source == 'auto':
+                fresh = finished_at is not None and time.time() - finished_at < ARTICLE_STORE_MAX_AGE
+                source = 'store' if fresh else 'live'
+
+            if source == 'newsapi':
+                with NewsAPISource() as newsapi:
+                    articles_by_category = newsapi.fetch(cutoff_date, feed_stats, timer)
+            elif source == 'store':
+                with timer.span('query'):
+                    articles_by_category = store.recent_articles(cutoff_date)
+                for key in ('total_feeds', 'successful_feeds', 'failed_feeds', 'skipped_feeds',
+                            'cache_hits', 'unchanged_feeds', 'bytes_downloaded', 'bytes_saved', 'feed_health',
+                            'hosts'):
+                    if ingest_stats and key in ingest_stats:
+                        feed_stats[key] = ingest_stats[key]
+                feed_stats.setdefault('feed_health', [])
+                log(f"Read {sum(len(a) for a in articles_by_category.values())} articles from the article store")
+            else:
+                articles_by_category = poll_feeds(cutoff_date, feed_stats, timer, deadline, archive)
+                if archive is not None:
+                    archive_run = archive.run_id if replaying else archive.save()
+                if not replaying:
+                    # Keep the store warm so the next digest can use it
+                    with timer.span('store'):
+                        store.upsert(articles_by_category)
+                    with timer.span('archive'):
+                        article_archive = ArticleArchive()
+                        article_archive.add(articles_by_category)
+                        article_archive.close()
+            store.close()
+
+            # Dedup, rank, render and send (ranking as of the recording when there is one,
+            # so a replay picks the same articles)
+            digest = deliver_digest(articles_by_category, feed_stats, timer, history_store,
+                                    now=archive.recorded_at.timestamp() if archive is not None else None,
+                                    dry_run=replaying)
+            delivery_results = digest['delivery_results']
+            delivered = sum(1 for result in delivery_results if result['status'] == 'sent')
+
+            if replaying:
+                message = f"Replayed run {archive.run_id}; no email sent"
+            elif delivered == len(delivery_results):
+                message = "Email sent successfully!"
+            else:
+                message = f"Email sent to {delivered} of {len(delivery_results)} recipients"
             response_data = {
-                "message": "Email sent successfully!",
+                "message": message,
+                "source": source,
+                "archive_run": archive_run,
                 "stats": {
-                    "articles_sent": len(new_articles_sent),
+                    "articles_sent": feed_stats['total_articles'],
                     "duplicates_removed": feed_stats['duplicates_removed'],
+                    "near_duplicates": feed_stats['near_duplicates'],
+                    "canonical_duplicates": feed_stats['canonical_duplicates'],
                     "total_feeds": feed_stats['total_feeds'],
-                    "successful_feeds": feed_stats['successful_feeds']
+                    "successful_feeds": feed_stats['successful_feeds'],
+                    "skipped_feeds": len(feed_stats['skipped_feeds']),
+                    "cache_hits": feed_stats['cache_hits'],
+                    "unchanged_feeds": feed_stats['unchanged_feeds'],
+                    "bytes_downloaded": feed_stats['bytes_downloaded'],
+                    "bytes_saved": feed_stats['bytes_saved']
+                },
+                "partial": feed_stats['partial'],
+                "skipped_feeds": feed_stats['skipped_feeds'],
+                "hosts": feed_stats['hosts'],
+                "newsapi": feed_stats.get('newsapi'),
+                "timings": timer.summary(),
+                "feed_health": feed_stats['feed_health'],
+                "email": digest['email'],
+                "history": getattr(history_store, 'stats', None),
+                "subscribers": digest['subscribers'],
+                "delivery": {
+                    "sent": delivered,
+                    "failed": [result for result in delivery_results if result['status'] != 'sent']
                 }
             }
-            self.wfile.write(json.dumps(response_data).encode())
+            METRICS.inc('newsmonitor_requests_total', route='digest', status='200')
+            self.send_json(200, response_data)
 
         except Exception as e:
-            print(f"Error in handler: {str(e)}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
-
-def format_email_content(news_data, feed_stats=None):
-    """Format the news data into a modern, responsive HTML email."""
-
-    # Default stats if not provided
-    if feed_stats is None:
-        feed_stats = {'total_feeds': 0, 'successful_feeds': 0, 'failed_feeds': [], 'total_articles': 0}
+            log(f"Error in handler: {str(e)}", 'error')
+            METRICS.inc('newsmonitor_requests_total', route='digest', status='500')
+            self.send_json(500, {"error": str(e)})
 
-    # Category colors - vibrant, high-contrast for dark theme
-    category_colors = {
-        "Top News": "#00d4ff",          # Electric blue
-        "Technology": "#8b5cf6",         # Violet
-        "AI": "#ff0080",                 # Hot magenta
-        "Arts and Entertainment": "#f97316",  # Orange
-        "Science": "#00ff88",            # Bright cyan/green
-        "Health": "#a855f7",             # Purple
-        "Business": "#06b6d4"            # Cyan
-    }
+# Category colors - vibrant, high-contrast for dark theme
+CATEGORY_COLORS = {
+    "Top News": "#00d4ff",          # Electric blue
+    "Technology": "#8b5cf6",         # Violet
+    "AI": "#ff0080",                 # Hot magenta
+    "Arts and Entertainment": "#f97316",  # Orange
+    "Science": "#00ff88",            # Bright cyan/green
+    "Health": "#a855f7",             # Purple
+    "Business": "#06b6d4"            # Cyan
+}
+DEFAULT_CATEGORY_COLOR = "#6b7280"
 
-    content = f"""
+# Email templates, built once per process and filled in with str.format().
+# The header (including all CSS) is static.
+EMAIL_HEADER = """
     <html>
     <head>
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <meta name="color-scheme" content="dark">
         <meta name="supported-color-schemes" content="dark">
         <style>
-            :root {{
+            :root {
                 color-scheme: dark;
-            }}
-            body {{
+            }
+            body {
                 font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
                 line-height: 1.6;
                 color: #e5e7eb;
                 background-color: #000000;
                 margin: 0;
                 padding: 0;
-            }}
-            .container {{
+            }
+            .container {
                 max-width: 600px;
                 margin: 0 auto;
                 background-color: #0a0a0a;
                 border: 1px solid #1f1f1f;
-            }}
-            .header {{
+            }
+            .header {
                 background: #000000;
                 border-bottom: 2px solid #00ff88;
                 color: white;
                 padding: 40px 20px;
                 text-align: center;
-            }}
-            .header h1 {{
+            }
+            .header h1 {
                 margin: 0;
                 font-size: 32px;
                 font-weight: 900;
                 letter-spacing: -1px;
                 color: #ffffff;
-            }}
-            .header p {{
+            }
+            .header p {
                 margin: 12px 0 0 0;
                 color: #9ca3af;
                 font-size: 14px;
                 font-weight: 500;
-            }}
-            .content {{
+            }
+            .content {
                 padding: 24px;
                 background: #0a0a0a;
-            }}
-            .category {{
+            }
+            .category {
                 margin-bottom: 40px;
-            }}
-            .category-header {{
+            }
+            .category-header {
                 display: flex;
                 align-items: center;
                 margin-bottom: 16px;
                 padding-bottom: 12px;
                 border-bottom: 1px solid #1f1f1f;
-            }}
-            .category-badge {{
+            }
+            .category-badge {
                 display: inline-block;
                 padding: 8px 16px;
                 border-radius: 4px;
@@ -404,28 +3566,28 @@ def format_email_content(news_data, feed_stats=None):
                 font-weight: 700;
                 text-transform: uppercase;
                 letter-spacing: 1px;
-            }}
-            .article-card {{
+            }
+            .article-card {
                 background: #0f0f0f;
                 border: 1px solid #1a1a1a;
                 border-left: 3px solid;
                 border-radius: 4px;
                 padding: 20px;
                 margin-bottom: 14px;
-            }}
-            .article-title {{
+            }
+            .article-title {
                 font-size: 17px;
                 font-weight: 700;
                 color: #ffffff;
                 margin: 0 0 10px 0;
                 line-height: 1.3;
-            }}
-            .article-meta {{
+            }
+            .article-meta {
                 font-size: 13px;
                 color: #6b7280;
                 margin-bottom: 12px;
-            }}
-            .source-badge {{
+            }
+            .source-badge {
                 display: inline-block;
                 background: #1a1a1a;
                 border: 1px solid #2a2a2a;
@@ -436,14 +3598,14 @@ def format_email_content(news_data, feed_stats=None):
                 color: #9ca3af;
                 text-transform: uppercase;
                 letter-spacing: 0.5px;
-            }}
-            .article-description {{
+            }
+            .article-description {
                 font-size: 14px;
                 color: #d1d5db;
                 margin: 12px 0;
                 line-height: 1.6;
-            }}
-            .read-more {{
+            }
+            .read-more {
                 display: inline-block;
                 background: transparent;
                 border: 2px solid;
@@ -456,42 +3618,42 @@ def format_email_content(news_data, feed_stats=None):
                 margin-top: 10px;
                 text-transform: uppercase;
                 letter-spacing: 0.5px;
-            }}
-            .footer {{
+            }
+            .footer {
                 background: #000000;
                 border-top: 1px solid #1f1f1f;
                 padding: 24px;
                 text-align: center;
                 font-size: 11px;
                 color: #6b7280;
-            }}
-            .no-articles {{
+            }
+            .no-articles {
                 color: #4b5563;
                 font-style: italic;
                 padding: 20px;
                 text-align: center;
-            }}
-            .toc {{
+            }
+            .toc {
                 background: #0f0f0f;
                 border: 1px solid #1f1f1f;
                 border-radius: 6px;
                 padding: 24px;
                 margin-bottom: 32px;
-            }}
-            .toc-title {{
+            }
+            .toc-title {
                 font-size: 13px;
                 font-weight: 700;
                 color: #9ca3af;
                 text-transform: uppercase;
                 letter-spacing: 1px;
                 margin: 0 0 16px 0;
-            }}
-            .toc-links {{
+            }
+            .toc-links {
                 display: flex;
                 flex-wrap: wrap;
                 gap: 10px;
-            }}
-            .toc-link {{
+            }
+            .toc-link {
                 display: inline-block;
                 text-decoration: none;
                 padding: 10px 18px;
@@ -501,47 +3663,58 @@ def format_email_content(news_data, feed_stats=None):
                 color: #000000;
                 text-transform: uppercase;
                 letter-spacing: 0.5px;
-            }}
-            .alert-banner {{
+            }
+            .alert-banner {
                 background: #1a1a1a;
                 border-left: 4px solid #f97316;
                 padding: 12px 16px;
                 margin: 16px 24px;
                 border-radius: 4px;
-            }}
-            .alert-banner-text {{
+            }
+            .alert-banner-text {
                 color: #f97316;
                 font-size: 13px;
                 font-weight: 600;
                 margin: 0;
-            }}
-            .stats-dashboard {{
+            }
+            .stats-dashboard {
                 background: #0a0a0a;
                 border: 1px solid #1f1f1f;
                 border-radius: 4px;
                 padding: 16px;
                 margin: 16px 0 0 0;
                 font-size: 11px;
-            }}
-            .stats-title {{
+            }
+            .stats-title {
                 color: #6b7280;
                 font-weight: 700;
                 text-transform: uppercase;
                 letter-spacing: 0.5px;
                 margin: 0 0 8px 0;
                 font-size: 10px;
-            }}
-            .stats-row {{
+            }
+            .stats-row {
                 color: #9ca3af;
                 margin: 4px 0;
                 font-size: 11px;
-            }}
-            .stats-success {{
+            }
+            .stats-success {
                 color: #00ff88;
-            }}
-            .stats-error {{
+            }
+            .stats-error {
                 color: #ff0080;
-            }}
+            }
+            .published {
+                margin-left: 8px;
+            }
+            .article-alternates {
+                color: #6b7280;
+                font-size: 12px;
+                margin: 0 0 12px 0;
+            }
+            .article-alternates a {
+                color: #9ca3af;
+            }
         </style>
     </head>
     <body bgcolor="#000000" style="background-color: #000000 !important; margin: 0; padding: 0;">
@@ -556,21 +3729,18 @@ def format_email_content(news_data, feed_stats=None):
                             </td>
                         </tr>"""
 
-    # Add alert banner if any feeds failed
-    if feed_stats['failed_feeds']:
-        failed_count = len(feed_stats['failed_feeds'])
-        content += f"""
+EMAIL_ALERT_BANNER = """
                         <tr>
                             <td bgcolor="#0a0a0a" style="background-color: #0a0a0a;">
                                 <div class="alert-banner" style="background: #1a1a1a; border-left: 4px solid #f97316; padding: 12px 16px; margin: 16px 24px; border-radius: 4px;">
                                     <p class="alert-banner-text" style="color: #f97316; font-size: 13px; font-weight: 600; margin: 0;">
-                                        ⚠️ {failed_count} news feed{"s" if failed_count > 1 else ""} temporarily unavailable
+                                        ⚠️ {failed_count} news feed{plural} temporarily unavailable
                                     </p>
                                 </div>
                             </td>
                         </tr>"""
 
-    content += """
+EMAIL_TOC_START = """
                         <tr>
                             <td bgcolor="#0a0a0a" style="background-color: #0a0a0a; padding: 24px;">
                                 <table width="100%" border="0" cellpadding="0" cellspacing="0" bgcolor="#0f0f0f" style="background-color: #0f0f0f; border: 1px solid #1f1f1f; border-radius: 6px; padding: 24px;">
@@ -580,70 +3750,79 @@ def format_email_content(news_data, feed_stats=None):
                                             <div class="toc-links">
     """
 
-    # First pass: Create table of contents
-    for category in news_data.keys():
-        color = category_colors.get(category, "#6b7280")
-        category_id = category.replace(" ", "-").lower()
-        content += f"""
+EMAIL_TOC_LINK = """
                         <a href="#{category_id}" class="toc-link" style="background-color: {color};">
-                            {category.title()}
+                            {title}
                         </a>
         """
 
-    content += """
+EMAIL_TOC_END = """
                                             </div>
                                         </td>
                                     </tr>
                                 </table>
     """
 
-    # Second pass: Create category sections with anchor IDs
-    for category, articles in news_data.items():
-        color = category_colors.get(category, "#6b7280")
-        category_id = category.replace(" ", "-").lower()
-        content += f"""
+EMAIL_CATEGORY_START = """
             <div class="category" id="{category_id}" style="margin-bottom: 40px;">
                 <div class="category-header" style="border-bottom: 1px solid #1f1f1f;">
                     <span class="category-badge" style="background-color: {color}; color: #000000; padding: 8px 16px; border-radius: 4px; font-weight: 700; text-transform: uppercase;">
-                        {category.upper()}
+                        {label}
                     </span>
                 </div>
         """
 
-        if articles:
-            for article in articles:
-                # Format the date nicely
-                published_at = article.get('published_at', '')
-                if published_at:
-                    try:
-                        from datetime import datetime
-                        date_obj = datetime.fromisoformat(published_at.replace('Z', '+00:00'))
-                        published_at = date_obj.strftime('%b %d, %Y at %I:%M %p')
-                    except:
-                        pass
-
-                content += f"""
+EMAIL_ARTICLE_CARD = """
                 <div class="article-card" style="background-color: #0f0f0f; border: 1px solid #1a1a1a; border-left: 3px solid {color}; border-radius: 4px; padding: 20px; margin-bottom: 14px;">
-                    <h3 class="article-title" style="color: #ffffff; font-weight: 700; margin: 0 0 10px 0;">{article['title']}</h3>
+                    <h3 class="article-title" style="color: #ffffff; font-weight: 700; margin: 0 0 10px 0;">{title}</h3>
                     <div class="article-meta" style="color: #6b7280; margin-bottom: 12px;">
-                        <span class="source-badge" style="background-color: #1a1a1a; border: 1px solid #2a2a2a; padding: 3px 10px; border-radius: 3px; color: #9ca3af;">{article['source']}</span>
+                        <span class="source-badge" style="background-color: #1a1a1a; border: 1px solid #2a2a2a; padding: 3px 10px; border-radius: 3px; color: #9ca3af;">{source}</span>
                         <span style="margin-left: 8px;">{published_at}</span>
                     </div>
                     <div class="article-description" style="color: #d1d5db; margin: 12px 0;">
-                        {article['description']}
-                    </div>
-                    <a href="{article['url']}" class="read-more" style="display: inline-block; background: transparent; border: 2px solid {color}; color: {color}; text-decoration: none; padding: 10px 20px; border-radius: 4px; font-weight: 700;">READ FULL STORY</a>
+                        {description}
+                    </div>{alternates}
+                    <a href="{url}" class="read-more" style="display: inline-block; background: transparent; border: 2px solid {color}; color: {color}; text-decoration: none; padding: 10px 20px; border-radius: 4px; font-weight: 700;">READ FULL STORY</a>
                 </div>
                 """
-        else:
-            content += '<div class="no-articles">No articles found for this category.</div>'
 
-        content += "</div>"
+EMAIL_ALTERNATES = """
+                    <div class="article-alternates" style="color: #6b7280; font-size: 12px; margin: 0 0 12px 0;">Also covered by: {links}</div>"""
 
-    # Build stats dashboard
-    success_rate = (feed_stats['successful_feeds'] / feed_stats['total_feeds'] * 100) if feed_stats['total_feeds'] > 0 else 0
+EMAIL_ALTERNATE_LINK = '<a href="{url}" style="color: #9ca3af;">{source}</a>'
+
+# Compact variants of the repeated fragments: styled by class from the <style>
+# block, with per-category colors from EMAIL_CATEGORY_STYLE rules (c0, c1, ...)
+EMAIL_TOC_LINK_COMPACT = '<a href="#{category_id}" class="toc-link c{index}">{title}</a>'
+
+EMAIL_CATEGORY_START_COMPACT = (
+    '<div class="category c{index}" id="{category_id}">'
+    '<div class="category-header"><span class="category-badge">{label}</span></div>'
+)
+
+EMAIL_ARTICLE_CARD_COMPACT = (
+    '<div class="article-card"><h3 class="article-title">{title}</h3>'
+    '<div class="article-meta"><span class="source-badge">{source}</span>'
+    '<span class="published">{published_at}</span></div>'
+    '<div class="article-description">{description}</div>{alternates}'
+    '<a href="{url}" class="read-more">READ FULL STORY</a></div>'
+)
+
+EMAIL_ALTERNATES_COMPACT = '<div class="article-alternates">Also covered by: {links}</div>'
+
+EMAIL_ALTERNATE_LINK_COMPACT = '<a href="{url}">{source}</a>'
+
+EMAIL_CATEGORY_STYLE = (
+    '.c{index} .category-badge,.toc-links .c{index}{{background-color:{color}}}'
+    '.c{index} .article-card{{border-left-color:{color}}}'
+    '.c{index} .read-more{{border-color:{color};color:{color} !important}}'
+)
 
-    content += f"""
+EMAIL_NO_ARTICLES = '<div class="no-articles">No articles found for this category.</div>'
+
+EMAIL_CATEGORY_END = "</div>"
+
+EMAIL_FOOTER = """
                             </td>
                         </tr>
                         <tr>
@@ -654,14 +3833,15 @@ def format_email_content(news_data, feed_stats=None):
                                 <div class="stats-dashboard" style="background: #0a0a0a; border: 1px solid #1f1f1f; border-radius: 4px; padding: 16px; margin: 16px 0 0 0;">
                                     <div class="stats-title" style="color: #6b7280; font-weight: 700; text-transform: uppercase; font-size: 10px; margin-bottom: 8px;">Feed Status</div>
                                     <div class="stats-row" style="color: #9ca3af; margin: 4px 0; font-size: 11px;">
-                                        Unique Articles: <span class="stats-success" style="color: #00ff88;">{feed_stats['total_articles']}</span>
+                                        Unique Articles: <span class="stats-success" style="color: #00ff88;">{total_articles}</span>
                                     </div>
                                     <div class="stats-row" style="color: #9ca3af; margin: 4px 0; font-size: 11px;">
-                                        Feeds: <span class="stats-success" style="color: #00ff88;">{feed_stats['successful_feeds']}</span>/{feed_stats['total_feeds']}
+                                        Feeds: <span class="stats-success" style="color: #00ff88;">{successful_feeds}</span>/{total_feeds}
                                         ({success_rate:.0f}%)
                                     </div>
-                                    {f'<div class="stats-row" style="color: #9ca3af; margin: 4px 0; font-size: 11px;">Duplicates Removed: <span style="color: #8b5cf6;">{feed_stats["duplicates_removed"]}</span></div>' if feed_stats.get('duplicates_removed', 0) > 0 else ''}
-                                    {f'<div class="stats-row" style="color: #9ca3af; margin: 4px 0; font-size: 11px;">Failed Feeds: <span class="stats-error" style="color: #ff0080;">{len(feed_stats["failed_feeds"])}</span></div>' if feed_stats['failed_feeds'] else ''}
+                                    {duplicates_row}
+                                    {failed_row}
+                                    {health_rows}
                                 </div>
                             </td>
                         </tr>
@@ -673,20 +3853,627 @@ def format_email_content(news_data, feed_stats=None):
     </html>
     """
 
-    return content
+EMAIL_DUPLICATES_ROW = '<div class="stats-row" style="color: #9ca3af; margin: 4px 0; font-size: 11px;">Duplicates Removed: <span style="color: #8b5cf6;">{duplicates_removed}</span></div>'
+
+EMAIL_HEALTH_ROW = '<div class="stats-row" style="color: #9ca3af; margin: 4px 0; font-size: 11px;">{label}: <span style="color: {color};">{value}</span></div>'
+
+EMAIL_FAILED_ROW = '<div class="stats-row" style="color: #9ca3af; margin: 4px 0; font-size: 11px;">Failed Feeds: <span class="stats-error" style="color: #ff0080;">{failed_count}</span></div>'
+
+# Breaking-news alert: a single short card list, styled inline like the digest
+EMAIL_BREAKING_HEADER = """
+    <html>
+    <head>
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <meta name="color-scheme" content="dark">
+    </head>
+    <body bgcolor="#000000" style="background-color: #000000; margin: 0; padding: 10px; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; color: #e5e7eb;">
+        <div style="max-width: 600px; margin: 0 auto; background-color: #0a0a0a; border: 1px solid #1f1f1f;">
+            <div style="border-bottom: 2px solid #ff0080; padding: 20px; text-align: center;">
+                <h1 style="color: #ffffff; margin: 0; font-size: 24px; font-weight: 900;">🚨 Breaking News</h1>
+            </div>"""
+
+EMAIL_BREAKING_ARTICLE = """
+            <div style="padding: 18px 20px; border-bottom: 1px solid #1a1a1a;">
+                <div style="color: {color}; font-size: 11px; font-weight: 700; text-transform: uppercase; letter-spacing: 1px;">{category}</div>
+                <a href="{url}" style="display: block; color: #ffffff; font-size: 17px; font-weight: 700; text-decoration: none; margin: 6px 0;">{title}</a>
+                <div style="color: #6b7280; font-size: 12px;">{source} {published_at}{alternates}</div>
+                <p style="color: #d1d5db; font-size: 14px; margin: 8px 0 0 0;">{description}</p>
+            </div>"""
+
+EMAIL_BREAKING_FOOTER = """
+            <p style="color: #6b7280; margin: 0; padding: 16px; font-size: 11px; text-align: center;">Sent as it broke; it won't be repeated in your digest.</p>
+        </div>
+    </body>
+    </html>
+    """
+
+@lru_cache(maxsize=4096)
+def format_published_at(published_at):
+    """Format an article date for display.
+
+    ISO 8601 dates are shown as e.g. "Jan 05, 2024 at 10:20 AM"; anything else
+    (such as RFC 822 dates from RSS) is shown as-is.
+    """
+    if published_at:
+        try:
+            date_obj = datetime.fromisoformat(published_at.replace('Z', '+00:00'))
+            return date_obj.strftime('%b %d, %Y at %I:%M %p')
+        except (TypeError, ValueError):
+            pass
+    return published_at
+
+def format_email_content(news_data, feed_stats=None, compact=None):
+    """Format the news data into a modern, responsive HTML email.
+
+    Fragments are collected in a list and joined once at the end. With compact
+    (default: EMAIL_RENDER_MODE == "compact") cards, badges and links carry
+    classes instead of inline styles, and runs of whitespace are collapsed.
+    """
+
+    # Default stats if not provided
+    if feed_stats is None:
+        feed_stats = {'total_feeds': 0, 'successful_feeds': 0, 'failed_feeds': [], 'total_articles': 0}
+    if compact is None:
+        compact = EMAIL_RENDER_MODE == 'compact'
+
+    if compact:
+        category_styles = ''.join(
+            EMAIL_CATEGORY_STYLE.format(index=index, color=CATEGORY_COLORS.get(category, DEFAULT_CATEGORY_COLOR))
+            for index, category in enumerate(news_data)
+        )
+        parts = [EMAIL_HEADER.replace('</style>', category_styles + '</style>', 1)]
+        toc_link, category_start, article_card, alternates_block, alternate_link = (
+            EMAIL_TOC_LINK_COMPACT, EMAIL_CATEGORY_START_COMPACT, EMAIL_ARTICLE_CARD_COMPACT,
+            EMAIL_ALTERNATES_COMPACT, EMAIL_ALTERNATE_LINK_COMPACT)
+    else:
+        parts = [EMAIL_HEADER]
+        toc_link, category_start, article_card, alternates_block, alternate_link = (
+            EMAIL_TOC_LINK, EMAIL_CATEGORY_START, EMAIL_ARTICLE_CARD, EMAIL_ALTERNATES, EMAIL_ALTERNATE_LINK)
+    append = parts.append
+
+    # Add alert banner if any feeds failed
+    failed_count = len(feed_stats['failed_feeds'])
+    if failed_count:
+        append(EMAIL_ALERT_BANNER.format(failed_count=failed_count, plural="s" if failed_count > 1 else ""))
+
+    # First pass: Create table of contents
+    append(EMAIL_TOC_START)
+    for index, category in enumerate(news_data):
+        append(toc_link.format(
+            index=index,
+            category_id=category.replace(" ", "-").lower(),
+            color=CATEGORY_COLORS.get(category, DEFAULT_CATEGORY_COLOR),
+            title=category.title()
+        ))
+    append(EMAIL_TOC_END)
+
+    # Second pass: Create category sections with anchor IDs
+    for index, (category, articles) in enumerate(news_data.items()):
+        color = CATEGORY_COLORS.get(category, DEFAULT_CATEGORY_COLOR)
+        append(category_start.format(
+            index=index,
+            category_id=category.replace(" ", "-").lower(),
+            color=color,
+            label=category.upper()
+        ))
+
+        if articles:
+            for article in articles:
+                # Other sources carrying the same story
+                alternates_html = ''
+                if article.alternates:
+                    alternates_html = alternates_block.format(links=', '.join(
+                        alternate_link.format(url=alt.url, source=alt.source)
+                        for alt in article.alternates
+                    ))
+
+                append(article_card.format(
+                    color=color,
+                    title=article.title,
+                    source=article.source,
+                    published_at=article.published_display,
+                    description=article.description,
+                    alternates=alternates_html,
+                    url=article.url
+                ))
+        else:
+            append(EMAIL_NO_ARTICLES)
+
+        append(EMAIL_CATEGORY_END)
+
+    # Build stats dashboard
+    success_rate = (feed_stats['successful_feeds'] / feed_stats['total_feeds'] * 100) if feed_stats['total_feeds'] > 0 else 0
+    duplicates_removed = feed_stats.get('duplicates_removed', 0)
+
+    health_rows = []
+    feed_health = feed_stats.get('feed_health')
+    if feed_health:
+        if feed_health['median_latency'] is not None:
+            health_rows.append(EMAIL_HEALTH_ROW.format(
+                label="Median Feed Latency", color="#00ff88", value=f"{feed_health['median_latency']:.1f}s"))
+        if feed_health['degraded']:
+            health_rows.append(EMAIL_HEALTH_ROW.format(
+                label="Degraded Feeds", color="#f97316", value=feed_health['degraded']))
+        if feed_health['circuit_open']:
+            health_rows.append(EMAIL_HEALTH_ROW.format(
+                label="Feeds Paused", color="#ff0080", value=feed_health['circuit_open']))
+    if feed_stats.get('partial'):
+        late_feeds = sum(1 for feed in feed_stats['skipped_feeds'] if feed.get('reason') == 'deadline')
+        health_rows.append(EMAIL_HEALTH_ROW.format(
+            label="Feeds Cut Off (time limit)", color="#f97316", value=late_feeds))
+
+    append(EMAIL_FOOTER.format(
+        total_articles=feed_stats['total_articles'],
+        successful_feeds=feed_stats['successful_feeds'],
+        total_feeds=feed_stats['total_feeds'],
+        success_rate=success_rate,
+        duplicates_row=EMAIL_DUPLICATES_ROW.format(duplicates_removed=duplicates_removed) if duplicates_removed > 0 else '',
+        failed_row=EMAIL_FAILED_ROW.format(failed_count=failed_count) if failed_count else '',
+        health_rows=''.join(health_rows)
+    ))
+
+    content = ''.join(parts)
+    return ' '.join(content.split()) if compact else content
+
+def format_plain_text(news_data, feed_stats=None):
+    """The plain-text alternative of the digest, from the same articles as the HTML."""
+    lines = ["Your Daily News Digest", "Top headlines across all major categories", ""]
+    append = lines.append
+
+    for category, articles in news_data.items():
+        append(category.upper())
+        append("=" * len(category))
+        if not articles:
+            append("No articles found for this category.")
+            append("")
+        for number, article in enumerate(articles, 1):
+            append(f"{number}. {article.title}")
+            published = article.published_display
+            append(f"   {article.source} | {published}" if published else f"   {article.source}")
+            append(f"   {html.unescape(article.description)}")
+            if article.alternates:
+                append("   Also covered by: " + ', '.join(alt.source for alt in article.alternates))
+            append(f"   {article.url}")
+            append("")
+        append("")
+
+    if feed_stats:
+        append(f"Unique articles: {feed_stats['total_articles']} | "
+               f"Feeds: {feed_stats['successful_feeds']}/{feed_stats['total_feeds']}")
+    append("You're receiving this because you subscribed to daily news updates.")
+    return '\n'.join(lines)
+
+def render_digest(news_data, feed_stats, subject, budget=EMAIL_SIZE_BUDGET, compact=None):
+    """Render the digest's HTML and plain text, with the HTML part of the MIME
+    message in at most `budget` bytes.
+
+    While the message is over budget, descriptions are shortened to
+    EMAIL_SHORT_DESCRIPTION_LENGTH characters and then cards dropped, both
+    lowest-ranked first: the last places of every category (later categories
+    first), then the places above them. A shortened article is a copy, since
+    the articles passed in may be shared with other subscribers' digests.
+
+    Returns (news_data as rendered, html, plain text, size report). Sets
+    feed_stats['total_articles'] to the number of articles rendered.
+    """
+    if compact is None:
+        compact = EMAIL_RENDER_MODE == 'compact'
+    news_data = {category: list(articles) for category, articles in news_data.items()}
+    trim_order = sorted(
+        ((position, index, category, article)
+         for index, (category, articles) in enumerate(news_data.items())
+         for position, article in enumerate(articles)),
+        key=lambda card: card[:2], reverse=True
+    )
+
+    def measure(content, plain_text):
+        message = build_email_message(subject, content, plain_text)
+        return len(message.get_payload()[1].as_bytes()), len(message.as_bytes())
+
+    def render():
+        feed_stats['total_articles'] = sum(len(articles) for articles in news_data.values())
+        content = format_email_content(news_data, feed_stats, compact)
+        plain_text = format_plain_text(news_data, feed_stats)
+        return (content, plain_text) + measure(content, plain_text)
+
+    content, plain_text, size, message_size = render()
+    initial_size = size
+    shortened = dropped = 0
+
+    # First shorten descriptions, a batch per render (a character cut saves about a byte)
+    position = 0
+    while budget and size > budget and position < len(trim_order):
+        savings = 0
+        while savings < size - budget and position < len(trim_order):
+            card_position, index, category, article = trim_order[position]
+            if len(article.description) > EMAIL_SHORT_DESCRIPTION_LENGTH:
+                short = copy.copy(article)
+                short.description = summarize_html(article.description, EMAIL_SHORT_DESCRIPTION_LENGTH)
+                news_data[category][card_position] = short
+                trim_order[position] = (card_position, index, category, short)
+                savings += len(article.description) - len(short.description)
+                shortened += 1
+            position += 1
+        content, plain_text, size, message_size = render()
+
+    # Then drop cards, sizing each batch from the average card's share of the HTML part
+    if budget and size > budget:
+        empty = {category: [] for category in news_data}
+        empty_size = measure(format_email_content(empty, feed_stats, compact), format_plain_text(empty, feed_stats))[0]
+        while size > budget and dropped < len(trim_order):
+            card_size = max(1, (size - empty_size) // (len(trim_order) - dropped))
+            for _ in range(min(-(-(size - budget) // card_size), len(trim_order) - dropped)):
+                _, _, category, article = trim_order[dropped]
+                news_data[category].remove(article)
+                dropped += 1
+            content, plain_text, size, message_size = render()
+
+    if shortened or dropped:
+        log(f"Email HTML trimmed from {initial_size} to {size} bytes: {shortened} descriptions shortened, "
+            f"{dropped} articles dropped")
+    return news_data, content, plain_text, {
+        'mode': 'compact' if compact else 'inline',
+        'html_part_bytes': size,
+        'untrimmed_html_part_bytes': initial_size,
+        'message_bytes': message_size,
+        'shortened_descriptions': shortened,
+        'dropped_articles': dropped
+    }
+
+def format_alert_email(articles):
+    """The subject, HTML and plain text of a breaking-news alert.
+
+    articles is a list of (category, article), best first; the subject leads with the first.
+    """
+    subject = f"Breaking: {articles[0][1].title}"
+    if len(articles) > 1:
+        subject += f" (+{len(articles) - 1} more)"
+
+    parts = [EMAIL_BREAKING_HEADER]
+    lines = ["Breaking News", ""]
+    for category, article in articles:
+        alternates = ''
+        if article.alternates:
+            alternates = ' · also ' + ', '.join(alt.source for alt in article.alternates)
+        parts.append(EMAIL_BREAKING_ARTICLE.format(
+            color=CATEGORY_COLORS.get(category, DEFAULT_CATEGORY_COLOR),
+            category=category.upper(),
+            url=article.url,
+            title=article.title,
+            source=article.source,
+            published_at=article.published_display,
+            alternates=alternates,
+            description=article.description
+        ))
+        lines += [f"[{category}] {article.title}", f"   {article.source}{alternates}",
+                  f"   {html.unescape(article.description)}", f"   {article.url}", ""]
+    parts.append(EMAIL_BREAKING_FOOTER)
+    lines.append("You're receiving this because you subscribed to news updates.")
+    return subject, ' '.join(''.join(parts).split()), '\n'.join(lines)
+
+def get_recipients():
+    """Subscriber addresses from RECIPIENT_EMAIL (comma-separated)."""
+    return [address.strip() for address in (RECIPIENT_EMAIL or '').split(',') if address.strip()]
+
+def subscription_words(keywords):
+    """The words of a subscriber's keywords, as Article.terms has them."""
+    return frozenset(
+        token for keyword in keywords for token in TOKEN_PATTERN.findall(keyword.lower())
+        if token not in STOPWORDS
+    )
+
+class Subscription:
+    """One subscriber's digest preferences.
+
+    categories is None for all of them. An article needs at least one of the
+    include words (when there are any) and none of the exclude words, and
+    mustn't come from a blocked source (names as shown in the digest).
+    Keywords match word by word against the article's title and description.
+    """
+
+    __slots__ = ('email', 'categories', 'include', 'exclude', 'blocked_sources', 'profile')
+
+    def __init__(self, email, categories=None, include=(), exclude=(), blocked_sources=()):
+        self.email = email
+        self.categories = frozenset(categories) if categories is not None else None
+        self.include = subscription_words(include)
+        self.exclude = subscription_words(exclude)
+        self.blocked_sources = frozenset(blocked_sources)
+        # Subscribers with the same preferences get the same digests (and share a sent history);
+        # None for the subscribers taking everything
+        preferences = (self.categories, self.include, self.exclude, self.blocked_sources)
+        if preferences == (None, frozenset(), frozenset(), frozenset()):
+            self.profile = None
+        else:
+            self.profile = hashlib.blake2b(
+                repr([sorted(value) if value is not None else None for value in preferences]).encode(),
+                digest_size=8
+            ).digest()
+
+    def __repr__(self):
+        return f"Subscription({self.email!r})"
+
+def load_subscriptions(path=SUBSCRIBERS_FILE):
+    """Subscriptions from the subscribers file, or RECIPIENT_EMAIL's addresses taking everything."""
+    path = Path(path)
+    if not path.exists():
+        return [Subscription(address) for address in get_recipients()]
+    with open(path, 'r') as f:
+        records = json.load(f)
+    return [
+        Subscription(record['email'], record.get('categories'), record.get('include', ()),
+                     record.get('exclude', ()), record.get('blocked_sources', ()))
+        for record in records
+    ]
+
+class SubscriberHistory:
+    """The sent history kept per subscriber profile (see Subscription.profile), in one history store.
+
+    An article sent to some subscribers stays new for the others: each
+    profile has its own keys, derived from the URL keys (the take-everything
+    profile uses the URL keys themselves, so a single RECIPIENT_EMAIL list
+    reads and writes the history as before). sent_among() answers for the
+    whole audience, as deduplicate_articles() asks, and records in
+    `received` which subscribers already got the rest, for
+    SubscriberIndex.match().
+    """
+
+    def __init__(self, store, subscriptions):
+        self.store = store
+        members = {}
+        for i, subscription in enumerate(subscriptions):
+            members.setdefault(subscription.profile, []).append(i)
+        self.members = {profile: np.array(indices) for profile, indices in members.items()}
+        self.received = {}
+
+    @staticmethod
+    def key(profile, url_key):
+        if profile is None:
+            return url_key
+        return hashlib.blake2b(url_key, key=profile, digest_size=16).digest()
+
+    def sent_among(self, url_keys):
+        """The URL keys already sent to every subscriber."""
+        keys = {self.key(profile, url_key): (profile, url_key)
+                for profile in self.members for url_key in url_keys}
+        received = {}
+        for key in self.store.sent_among(keys):
+            profile, url_key = keys[key]
+            received.setdefault(url_key, []).append(profile)
+        sent = set()
+        for url_key, profiles in received.items():
+            if len(profiles) == len(self.members):
+                sent.add(url_key)
+            else:
+                self.received[url_key] = np.concatenate([self.members[profile] for profile in profiles])
+        return sent
+
+    def mark_sent(self, deliveries):
+        """Save deliveries, (subscribers, URL keys sent to them) pairs, in one write."""
+        self.store.mark_sent([
+            self.key(profile, url_key)
+            for subscribers, url_keys in deliveries
+            for profile in {subscriber.profile for subscriber in subscribers}
+            for url_key in url_keys
+        ])
+
+class SubscriberIndex:
+    """Inverted index from categories, words and sources to subscribers.
+
+    match() works out every subscriber's digest in one pass over the run's
+    ranked articles. Each article's row of an articles x subscribers matrix
+    comes from index lookups - the subscribers of its category, minus those
+    blocking its source or excluding one of its words, and (for subscribers
+    with include words) only those including one of them - so the cost
+    grows with the articles and the index entries they hit, not with
+    articles times subscribers.
+    """
+
+    def __init__(self, subscriptions):
+        self.subscriptions = list(subscriptions)
+        self.count = len(self.subscriptions)
+        every_category = np.array([s.categories is None for s in self.subscriptions], dtype=bool)
+        self.without_include = np.array([not s.include for s in self.subscriptions], dtype=bool)
+
+        category_members, include, exclude, blocked = {}, {}, {}, {}
+        for i, subscription in enumerate(self.subscriptions):
+            for category in subscription.categories or ():
+                category_members.setdefault(category, []).append(i)
+            for word in subscription.include:
+                include.setdefault(word, []).append(i)
+            for word in subscription.exclude:
+                exclude.setdefault(word, []).append(i)
+            for source in subscription.blocked_sources:
+                blocked.setdefault(source, []).append(i)
+
+        self.every_category = every_category
+        self.category_members = {}
+        for category, members in category_members.items():
+            mask = every_category.copy()
+            mask[members] = True
+            self.category_members[category] = mask
+        self.include = {word: np.array(members) for word, members in include.items()}
+        self.exclude = {word: np.array(members) for word, members in exclude.items()}
+        self.blocked = {source: np.array(members) for source, members in blocked.items()}
+        self.include_words = frozenset(self.include)
+        self.exclude_words = frozenset(self.exclude)
+
+    def match(self, ranked_by_category, per_category=DIGEST_ARTICLES_PER_CATEGORY, received=None):
+        """Group subscribers by the digest they get.
+
+        ranked_by_category holds each category's candidates, best first.
+        received maps URL keys to the indices of subscribers who were
+        already sent that article (see SubscriberHistory). Returns [(news_data, subscriptions)], largest audience first, one
+        entry per distinct digest: the subscriber's categories, each with
+        their first per_category articles of it.
+        """
+        if not self.count:
+            return []
+        categories = list(ranked_by_category)
+        articles = []
+        rows = []
+        bounds = [0]
+        for category in categories:
+            members = self.category_members.get(category, self.every_category)
+            for article in ranked_by_category[category]:
+                row = members.copy()
+                if received:
+                    already = received.get(article.url_key)
+                    if already is not None:
+                        row[already] = False
+                blocking = self.blocked.get(article.source)
+                if blocking is not None:
+                    row[blocking] = False
+                terms = article.terms
+                for word in self.exclude_words.intersection(terms):
+                    row[self.exclude[word]] = False
+                if self.include:
+                    wanted = self.without_include.copy()
+                    for word in self.include_words.intersection(terms):
+                        wanted[self.include[word]] = True
+                    row &= wanted
+                rows.append(row)
+                articles.append(article)
+            bounds.append(len(rows))
+
+        subscribed = np.array([self.category_members.get(category, self.every_category) for category in categories],
+                              dtype=bool).reshape(len(categories), self.count)
+        matrix = np.array(rows, dtype=bool).reshape(len(rows), self.count)
+        for start, end in zip(bounds, bounds[1:]):
+            # Each subscriber's first per_category articles of the category, in rank order
+            block = matrix[start:end]
+            block &= np.cumsum(block, axis=0, dtype=np.int16) <= per_category
+
+        # Subscribers with the same categories and articles share one digest
+        groups = {}
+        keys = np.packbits(np.hstack([subscribed.T, matrix.T]), axis=1)
+        for i, key in enumerate(keys):
+            groups.setdefault(key.tobytes(), []).append(i)
+
+        article_categories = [category for category in categories for _ in ranked_by_category[category]]
+        digests = []
+        for members in sorted(groups.values(), key=len, reverse=True):
+            first = members[0]
+            news_data = {category: [] for category, wanted in zip(categories, subscribed[:, first]) if wanted}
+            for i in np.flatnonzero(matrix[:, first]).tolist():
+                news_data[article_categories[i]].append(articles[i])
+            digests.append((news_data, [self.subscriptions[i] for i in members]))
+        return digests
+
+class SMTPUnavailableError(Exception):
+    """Raised for a message not sent because its SMTPSender already failed to log in or connect."""
+
+class SMTPSender:
+    """Sends many messages over one reused, authenticated SMTP connection.
+
+    The connection is opened lazily, reopened after max_messages_per_connection
+    messages, and reopened once (with the message retried) if the server drops
+    it. Sends are spaced out to at most send_rate messages per second. If the
+    login is rejected, or the server can't be reached on the retry either, the
+    sender gives up: every later send raises SMTPUnavailableError straight
+    away, so a batch doesn't log in (or time out) once per recipient.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, use_ssl=SMTP_USE_SSL,
+                 username=GMAIL_ADDRESS, password=GMAIL_APP_PASSWORD,
+                 max_messages_per_connection=SMTP_MESSAGES_PER_CONNECTION, send_rate=SMTP_SEND_RATE,
+                 timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.max_messages_per_connection = max(1, max_messages_per_connection)
+        self.min_interval = 1.0 / send_rate if send_rate > 0 else 0
+        self.timeout = timeout
+        self.server = None
+        self.messages_on_connection = 0
+        self.connections_opened = 0
+        self.last_send = 0.0
+        self.failure = None
+
+    def _connect(self):
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.username and self.password:
+            try:
+                server.login(self.username, self.password)
+            except Exception:
+                server.close()
+                raise
+        self.server = server
+        self.messages_on_connection = 0
+        self.connections_opened += 1
+
+    def _disconnect(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def _throttle(self):
+        wait = self.last_send + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.last_send = time.monotonic()
+
+    def send(self, sender, recipient, message_text):
+        if self.failure is not None:
+            raise SMTPUnavailableError(f"Not sent: {self.failure}")
+        self._throttle()
+        for attempt in range(2):
+            if self.server is not None and self.messages_on_connection >= self.max_messages_per_connection:
+                self._disconnect()
+            connecting = self.server is None
+            try:
+                if connecting:
+                    self._connect()
+                self.server.sendmail(sender, [recipient], message_text)
+                self.messages_on_connection += 1
+                return
+            except smtplib.SMTPAuthenticationError as e:
+                # Retrying (here or for the next recipient) would be rejected the same way
+                self.failure = f"SMTP login failed: {e}"
+                raise
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # The server rejected this message; the connection itself is fine
+                raise
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                if attempt:
+                    if connecting:
+                        self.failure = f"SMTP server unavailable: {e}"
+                    raise
 
-def send_email(subject, content):
-    sender_email = GMAIL_ADDRESS
-    recipient_email = RECIPIENT_EMAIL
+    def close(self):
+        self._disconnect()
 
-    # Create message
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Both parts are quoted-printable: the digest is almost all ASCII, so this is
+# close to its raw size, where base64 would add a third
+EMAIL_CHARSET = Charset('utf-8')
+EMAIL_CHARSET.body_encoding = QP
+
+def build_email_message(subject, content, plain_text=None):
+    """Build the multipart digest message (the To header is set per recipient)."""
     message = MIMEMultipart("alternative")
     message["Subject"] = subject
-    message["From"] = sender_email
-    message["To"] = recipient_email
+    message["From"] = GMAIL_ADDRESS
+    message["To"] = ""
 
-    # Create plain text version to help avoid spam filters
-    plain_text = """
+    # Without a plain-text digest, a short pointer to the HTML part (a text part
+    # helps avoid spam filters)
+    if plain_text is None:
+        plain_text = """
 Your Daily News Digest
 
 View this email in a browser that supports HTML for the best experience.
@@ -695,16 +4482,39 @@ To unsubscribe or manage your preferences, reply to this email.
     """
 
     # Add both plain text and HTML
-    text_part = MIMEText(plain_text.strip(), "plain")
-    html_part = MIMEText(content, "html")
+    text_part = MIMEText(plain_text.strip(), "plain", EMAIL_CHARSET)
+    html_part = MIMEText(content, "html", EMAIL_CHARSET)
     message.attach(text_part)
     message.attach(html_part)
+    return message
+
+def send_email(subject, content, recipients=None, sender=None, plain_text=None):
+    """Send the digest to each recipient over a shared SMTP connection.
 
+    Returns one {'recipient', 'status', 'error'} result per recipient; a failed
+    recipient doesn't stop delivery to the rest, but once the sender can't log
+    in or connect, the rest fail straight away (see SMTPSender).
+    """
+    if recipients is None:
+        recipients = get_recipients()
+    message = build_email_message(subject, content, plain_text)
+    results = []
+
+    own_sender = sender is None
+    if own_sender:
+        sender = SMTPSender()
     try:
-        # Connect to Gmail SMTP server
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(GMAIL_ADDRESS, GMAIL_APP_PASSWORD)
-            server.sendmail(sender_email, recipient_email, message.as_string())
-            print(f"Email sent successfully to {recipient_email}")
-    except Exception as e:
-        print(f"Error sending email: {e}")
+        for recipient in recipients:
+            message.replace_header("To", recipient)
+            try:
+                sender.send(GMAIL_ADDRESS, recipient, message.as_string())
+                log(f"Email sent successfully to {recipient}")
+                results.append({'recipient': recipient, 'status': 'sent', 'error': None})
+            except Exception as e:
+                log(f"Error sending email to {recipient}: {e}", 'error')
+                results.append({'recipient': recipient, 'status': 'failed', 'error': str(e)})
+    finally:
+        if own_sender:
+            sender.close()
+
+    return results
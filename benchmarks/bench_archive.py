@@ -0,0 +1,115 @@
+"""Benchmark the article archive: ingest rate and search latency as it grows.
+
+Articles use a Zipf-distributed vocabulary of made-up words, so search terms
+range from rare to very common, like real headlines. Ingest goes in runs of
+--batch articles (one transaction each, as the handler does); queries are
+timed at each size checkpoint.
+
+Usage:
+    python benchmarks/bench_archive.py                       # up to 1,000,000 articles
+    python benchmarks/bench_archive.py --sizes 10000 100000 --batch 700
+"""
+import argparse
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from common import load_send_news
+
+CATEGORIES = ["Top News", "Technology", "AI", "Arts and Entertainment", "Science", "Health", "Business"]
+VOCABULARY_SIZE = 50000
+
+def make_vocabulary(rng):
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))))
+    return sorted(words, key=lambda word: rng.random())
+
+def article_batches(send_news, vocabulary, total, batch, rng, first):
+    """Articles archived in publication order, a minute apart from `first`."""
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    for start in range(0, total, batch):
+        count = min(batch, total - start)
+        words = rng.choices(vocabulary, weights, k=count * 50)
+        by_category = {category: [] for category in CATEGORIES}
+        for i in range(count):
+            number = start + i
+            text = words[i * 50:(i + 1) * 50]
+            by_category[CATEGORIES[number % len(CATEGORIES)]].append(send_news.Article(
+                title=' '.join(text[:10]),
+                source=f"Source {number % 300}",
+                url=f"https://example.com/{number}",
+                published_at='',
+                published_ts=first + number * 60,
+                description=' '.join(text[10:])
+            ))
+        yield by_category
+
+def query_set(vocabulary, newest):
+    common, mid, rare = vocabulary[2], vocabulary[200], vocabulary[20000]
+    return [
+        ('rare term', {'query': rare}),
+        ('mid term', {'query': mid}),
+        ('common term', {'query': common}),
+        ('two terms', {'query': f"{mid} {vocabulary[300]}"}),
+        ('prefix', {'query': vocabulary[150][:3] + '*'}),
+        ('term + category', {'query': mid, 'category': 'Science'}),
+        ('term + source', {'query': mid, 'source': 'Source 7'}),
+        ('term + last week', {'query': mid, 'since': newest - 7 * 86400}),
+        ('term, page 5', {'query': mid, 'page': 5}),
+        ('no term, category', {'category': 'Health'}),
+        ('no term, source, page 5', {'source': 'Source 7', 'page': 5}),
+    ]
+
+def time_queries(archive, queries, repeats):
+    timings = {}
+    for label, params in queries:
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            results, _ = archive.search(**params)
+            samples.append(time.perf_counter() - started)
+        samples.sort()
+        timings[label] = (samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000, len(results))
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='archive sizes at which to time queries')
+    parser.add_argument('--batch', type=int, default=1000, help='articles per ingest run')
+    parser.add_argument('--repeats', type=int, default=20, help='runs of each query')
+    args = parser.parse_args()
+
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = send_news.LOG_LEVELS['warning']
+    rng = random.Random(11)
+    vocabulary = make_vocabulary(rng)
+    first = time.time() - max(args.sizes) * 60
+
+    with tempfile.TemporaryDirectory(prefix='newsmonitor-archive-') as data_dir:
+        archive = send_news.ArticleArchive(Path(data_dir) / 'archive.db')
+        batches = article_batches(send_news, vocabulary, max(args.sizes), args.batch, rng, first)
+        archived = 0
+        insert_seconds = 0.0
+        for size in sorted(args.sizes):
+            while archived < size:
+                by_category = next(batches)
+                started = time.perf_counter()
+                archived += archive.add(by_category)
+                insert_seconds += time.perf_counter() - started
+
+            db_bytes = sum(path.stat().st_size for path in Path(data_dir).iterdir())
+            print(f"\n{archived:,} articles: ingest {archived / insert_seconds:,.0f} articles/s "
+                  f"({insert_seconds / archived * args.batch * 1000:.1f}ms per {args.batch}-article run), "
+                  f"{db_bytes / 2 ** 20:.0f}MiB on disk")
+            print(f"  {'query':<26} {'p50 ms':>8} {'p95 ms':>8} {'rows':>5}")
+            queries = query_set(vocabulary, newest=first + archived * 60)
+            for label, (p50, p95, rows) in time_queries(archive, queries, args.repeats).items():
+                print(f"  {label:<26} {p50:>8.2f} {p95:>8.2f} {rows:>5}")
+        archive.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Memory per 10k articles: Article objects against the per-article dicts they replaced.
+
+Fields are rebuilt from fresh strings for every article, as when rows come
+back from the article store, so per-article copies of the source name show
+up in the dict version. The dict version is the shape extract_feed_articles()
+used to return. Both get the same description, the summarize_html() summary
+of a long feed description, so only the container differs.
+
+Usage: python benchmarks/bench_articles.py [count]
+"""
+import sys
+import time
+import tracemalloc
+
+from common import load_send_news, synthetic_articles
+
+def fresh(text):
+    """An equal but distinct string object, like one decoded from a database row."""
+    return text.encode().decode()
+
+def as_dict(send_news, record):
+    return {
+        "title": fresh(record['title']),
+        "source": fresh(record['source']),
+        "published_at": fresh(record['published_at']),
+        "published_display": send_news.format_published_at(record['published_at']),
+        "published_ts": record['published_ts'],
+        "url": fresh(record['url']),
+        "canonical_url": send_news.canonicalize_url(record['url']),
+        "url_key": send_news.get_url_key(record['url']),
+        "description": fresh(record['summary'])
+    }
+
+def as_article(send_news, record):
+    return send_news.Article(
+        fresh(record['title']), fresh(record['source']), fresh(record['url']),
+        published_at=fresh(record['published_at']),
+        published_ts=record['published_ts'],
+        description=fresh(record['summary'])
+    )
+
+def measure(send_news, records, build):
+    send_news.canonicalize_url.cache_clear()
+    send_news.format_published_at.cache_clear()
+    tracemalloc.start()
+    started = time.perf_counter()
+    articles = [build(send_news, record) for record in records]
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del articles
+    return current, elapsed
+
+def main(count):
+    send_news = load_send_news()
+    records = synthetic_articles(count, duplicate_ratio=0)
+    for i, record in enumerate(records):
+        record['published_at'] = f"Mon, 05 Jan 2026 {i % 24:02d}:20:00 GMT"
+        record['published_ts'] = 1767600000.0 + i
+        record['summary'] = send_news.summarize_html(record['description'] * 3)
+
+    print(f"{count} articles")
+    print(f"{'type':>8} {'MiB':>8} {'bytes/article':>14} {'build ms':>9}")
+    for label, build in (('dict', as_dict), ('Article', as_article)):
+        memory, elapsed = measure(send_news, records, build)
+        print(f"{label:>8} {memory / 2 ** 20:>8.2f} {memory / count:>14.0f} {elapsed * 1000:>9.1f}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,59 @@
+"""Benchmark the size of the digest email: inline vs compact rendering, and
+trimming to EMAIL_SIZE_BUDGET.
+
+For each digest size, reports the bytes of the HTML MIME part (what Gmail
+clips) with the inline templates, with compact rendering, and after
+render_digest() trims it to the budget, plus the whole trimmed message.
+
+Usage: python benchmarks/bench_email_size.py [budget_bytes]
+"""
+import sys
+import time
+
+from common import build_articles, load_send_news, synthetic_articles
+
+CATEGORIES = ["Top News", "Technology", "AI", "Arts and Entertainment", "Science", "Health", "Business"]
+SUBJECT = "Your Top News Update"
+
+def build_digest(send_news, per_category):
+    records = synthetic_articles(len(CATEGORIES) * per_category, duplicate_ratio=0)
+    for record in records:
+        record['published_at'] = '2024-01-05T10:20:00Z'
+        # Full-length descriptions, as cut by extract_feed_articles()
+        record['description'] = send_news.summarize_html(record['description'] * 2)
+    articles = build_articles(send_news, records)
+    for i, article in enumerate(articles[::3]):
+        for j in range(2):
+            article.add_alternate(send_news.Article(
+                title=article.title, source=f"Wire {j}", published_at='',
+                url=f"https://wire{j}.example/story/{i}", description=''))
+    return {
+        category: articles[i * per_category:(i + 1) * per_category]
+        for i, category in enumerate(CATEGORIES)
+    }
+
+def new_stats():
+    return {'total_feeds': 50, 'successful_feeds': 48, 'failed_feeds': [{}, {}],
+            'total_articles': 0, 'duplicates_removed': 12}
+
+def main(budget):
+    send_news = load_send_news()
+    print(f"budget {budget} bytes\n")
+    print(f"{'digest':>9} {'inline':>9} {'compact':>9} {'trimmed':>9} {'message':>9} "
+          f"{'shortened':>10} {'dropped':>8} {'ms':>7}")
+    for label, per_category in (("7 x 15", 15), ("7 x 30", 30), ("7 x 150", 150)):
+        news_data = build_digest(send_news, per_category)
+
+        _, _, _, inline = send_news.render_digest(news_data, new_stats(), SUBJECT, budget=0, compact=False)
+        _, _, _, compact = send_news.render_digest(news_data, new_stats(), SUBJECT, budget=0, compact=True)
+
+        started = time.perf_counter()
+        _, _, _, report = send_news.render_digest(news_data, new_stats(), SUBJECT, budget=budget, compact=True)
+        elapsed = time.perf_counter() - started
+
+        print(f"{label:>9} {inline['html_part_bytes']:>9} {compact['html_part_bytes']:>9} "
+              f"{report['html_part_bytes']:>9} {report['message_bytes']:>9} "
+              f"{report['shortened_descriptions']:>10} {report['dropped_articles']:>8} {elapsed * 1000:>7.1f}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 102000)
@@ -0,0 +1,92 @@
+"""Benchmark sent-history lookups with and without the Bloom filter tier.
+
+A history of 30 days of sent article URLs is written to SQLite (and JSON),
+then a digest's worth of candidates - mostly new, a tenth sent before - is
+checked against it with sent_among(), as deduplicate_articles() does:
+straight from the store, and through BloomHistoryStore, which only asks the
+store about possible hits. The filter is built from the history the first
+time ("build") and only mapped afterwards ("open"). The JSON backend reads
+its file on first use, so that is part of its lookup time.
+
+Usage: python benchmarks/bench_history.py [keys per day...]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from common import load_send_news
+
+DAYS = 30
+CANDIDATES = 20000
+SENT_SHARE = 0.1
+
+def random_keys(rng, count):
+    return [rng.randbytes(16) for _ in range(count)]
+
+def write_history(send_news, data_dir, per_day, rng):
+    """Sent keys for each of the last DAYS days, in both backends."""
+    now = time.time()
+    sent = []
+    for day in range(DAYS):
+        sent += [(key, now - day * 86400) for key in random_keys(rng, per_day)]
+    sqlite_store = send_news.SQLiteHistoryStore(Path(data_dir) / 'sent_articles.db')
+    with sqlite_store.conn:
+        sqlite_store.conn.executemany("INSERT INTO sent_articles VALUES (?, ?)", sent)
+    sqlite_store.close()
+    with open(Path(data_dir) / 'sent_articles.json', 'w') as f:
+        json.dump({'articles': {key.hex(): datetime.fromtimestamp(sent_at).isoformat() for key, sent_at in sent}}, f)
+    return [key for key, _ in sent]
+
+def time_lookups(store, candidates):
+    started = time.perf_counter()
+    found = len(store.sent_among(candidates))
+    return (time.perf_counter() - started) * 1000, found
+
+def main(sizes):
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = send_news.LOG_LEVELS['warning']
+    rng = random.Random(3)
+    print(f"{CANDIDATES} candidates, {SENT_SHARE:.0%} sent before, {DAYS} days of history\n")
+    print(f"{'keys/day':>8} {'backend':>7} {'open ms':>8} {'lookup ms':>10} {'bloom build ms':>15} "
+          f"{'bloom open ms':>14} {'bloom lookup ms':>16} {'avoided':>8} {'false +':>8} {'bloom KB':>9}")
+
+    for per_day in sizes:
+        with tempfile.TemporaryDirectory(prefix='newsmonitor-history-') as data_dir:
+            sent = write_history(send_news, data_dir, per_day, rng)
+            new = random_keys(rng, int(CANDIDATES * (1 - SENT_SHARE)))
+            candidates = new + rng.sample(sent, CANDIDATES - len(new))
+            rng.shuffle(candidates)
+
+            for backend, store_class, path in (('sqlite', send_news.SQLiteHistoryStore, 'sent_articles.db'),
+                                               ('json', send_news.JSONHistoryStore, 'sent_articles.json')):
+                started = time.perf_counter()
+                store = store_class(Path(data_dir) / path)
+                lookup_ms, found = time_lookups(store, candidates)
+                open_ms = (time.perf_counter() - started) * 1000 - lookup_ms
+                store.close()
+
+                bloom_path = Path(data_dir) / f'{backend}.bloom'
+                timings = []
+                for _ in range(2):  # first builds the filter from the history, then maps it
+                    started = time.perf_counter()
+                    bloom_store = send_news.BloomHistoryStore(
+                        store_class(Path(data_dir) / path),
+                        send_news.DailyBloomFilter(bloom_path, daily_items=per_day))
+                    opened = (time.perf_counter() - started) * 1000
+                    bloom_ms, bloom_found = time_lookups(bloom_store, candidates)
+                    stats = bloom_store.stats
+                    bloom_store.close()
+                    timings.append((opened, bloom_ms))
+                assert bloom_found == found, (bloom_found, found)
+
+                print(f"{per_day:>8} {backend:>7} {open_ms:>8.1f} {lookup_ms:>10.1f} {timings[0][0]:>15.1f} "
+                      f"{timings[1][0]:>14.2f} {timings[1][1]:>16.1f} {stats['exact_lookups_avoided']:>8} "
+                      f"{stats['false_positives']:>8} {os.path.getsize(bloom_path) / 1024:>9.0f}")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
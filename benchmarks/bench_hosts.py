@@ -0,0 +1,87 @@
+"""Benchmark per-host connection reuse and politeness limits in fetch_feeds().
+
+Feeds are spread over local fixture servers the way RSS_FEEDS spreads them
+over hosts (several BBC and CNN feeds, one feed for most others), one
+server standing in for each host. New connections cost handshake_latency
+seconds, standing in for DNS, TCP and TLS, and a few hosts are slow. The
+feeds are fetched on a connection each, as before, and through a
+FeedHostPool, with the default per-host cap (FEED_HOST_CONCURRENCY) and a
+looser one. Each way runs twice, so that the second run orders feeds by
+the value (fresh articles per second) and host latencies the first one
+measured.
+
+Usage: python benchmarks/bench_hosts.py [handshake seconds] [slow hosts]
+"""
+import random
+import sys
+import time
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from common import load_send_news
+from fixture_server import FeedProfile, FixtureFeedServer
+
+SLOW_LATENCY = 1.0
+
+def host_layout(send_news):
+    """Feeds per host in RSS_FEEDS, most first."""
+    counts = {}
+    for feed_urls in send_news.RSS_FEEDS.values():
+        for feed_url in feed_urls:
+            host = urlsplit(feed_url).hostname
+            counts[host] = counts.get(host, 0) + 1
+    return sorted(counts.values(), reverse=True)
+
+def fetch_all(send_news, servers, feed_urls, health, host_concurrency):
+    connections = sum(server.connections for server in servers)
+    for server in servers:
+        server.max_in_flight = 0
+    feed_stats = {}
+    started = time.perf_counter()
+    if host_concurrency is not None:
+        with send_news.FeedHostPool(feed_urls, concurrency=host_concurrency) as host_pool:
+            results = send_news.fetch_feeds(feed_urls, feed_stats=feed_stats, health=health, host_pool=host_pool)
+    else:
+        results = send_news.fetch_feeds(feed_urls, feed_stats=feed_stats, health=health)
+    wall = time.perf_counter() - started
+    errors = sum(1 for feed, error in results.values() if error is not None)
+    return (wall, sum(server.connections for server in servers) - connections,
+            max(server.max_in_flight for server in servers), errors, feed_stats.get('hosts'))
+
+def main(handshake, slow_hosts):
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = send_news.LOG_LEVELS['error']
+    layout = host_layout(send_news)
+    rng = random.Random(11)
+    slow = set(rng.sample(range(len(layout)), slow_hosts)) | {1}  # the 4-feed host is one of the slow ones
+    print(f"{sum(layout)} feeds on {len(layout)} hosts, {handshake * 1000:.0f}ms per new connection, "
+          f"{len(slow)} hosts taking {SLOW_LATENCY:.1f}s per response\n")
+    print(f"{'fetch':>16} {'run':>5} {'wall s':>7} {'connections':>12} {'handshakes saved':>17} "
+          f"{'max per host':>13} {'errors':>7}")
+
+    with ExitStack() as stack:
+        servers, feed_urls = [], []
+        for i, count in enumerate(layout):
+            profile = FeedProfile(latency=SLOW_LATENCY if i in slow else 0.05, jitter=0.05,
+                                  handshake_latency=handshake, seed=i)
+            server = stack.enter_context(FixtureFeedServer(profile))
+            servers.append(server)
+            feed_urls += server.feed_urls(count)
+
+        default_cap = send_news.FEED_HOST_CONCURRENCY
+        for name, host_concurrency in (('per feed', None), (f'per host, cap {default_cap}', default_cap),
+                                       (f'per host, cap {default_cap * 2}', default_cap * 2)):
+            health = send_news.FeedHealthTracker(None)
+            for run in ('cold', 'warm'):
+                wall, connections, in_flight, errors, hosts = fetch_all(send_news, servers, feed_urls, health,
+                                                                         host_concurrency)
+                saved = hosts['handshakes_saved'] if hosts else 0
+                print(f"{name:>16} {run:>5} {wall:>7.2f} {connections:>12} {saved:>17} {in_flight:>13} {errors:>7}")
+
+        print(f"\nslowest hosts, per host with cap {default_cap * 2}:")
+        for host in hosts['per_host'][:3]:
+            print(f"  {host['host']}: {host['requests']} requests over {host['connections']} connections, "
+                  f"p50 {host['latency_p50']:.2f}s, waited {host['waited']:.2f}s for slots")
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.1, int(sys.argv[2]) if len(sys.argv) > 2 else 2)
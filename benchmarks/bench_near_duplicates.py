@@ -0,0 +1,26 @@
+"""Benchmark near-duplicate clustering (SimHash + LSH bands) at increasing sizes.
+
+Usage: python benchmarks/bench_near_duplicates.py [sizes...]
+"""
+import sys
+import time
+
+from common import build_articles, load_send_news, synthetic_articles
+
+def main(sizes):
+    send_news = load_send_news()
+    print(f"{'articles':>9} {'seconds':>9} {'articles/s':>11} {'collapsed':>10}")
+    for size in sizes:
+        articles = build_articles(send_news, synthetic_articles(size))
+        # Spread over 7 categories, as in a real run
+        by_category = {f"Category {i}": articles[i::7] for i in range(7)}
+        send_news._token_spreads.clear()
+
+        started = time.perf_counter()
+        _, removed = send_news.cluster_near_duplicates(by_category)
+        elapsed = time.perf_counter() - started
+
+        print(f"{size:>9} {elapsed:>9.3f} {size / elapsed:>11.0f} {removed:>10}")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [500, 1000, 2000, 5000, 10000, 20000])
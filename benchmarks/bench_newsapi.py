@@ -0,0 +1,122 @@
+"""Benchmark the NewsAPI digest source against the local NewsAPI stand-in.
+
+Fetches every NEWSAPI_CATEGORIES category the way NewsMonitorApp.py used to
+(one requests.get after another, a new connection each, no timeout or
+retries) and with NewsAPISource (concurrent over one pooled session, with
+retries and shared Retry-After handling), for a healthy API, one that
+rate-limits the first requests, one failing a fifth of them and ones that
+keep failing or rate-limiting. Then runs the handler's newsapi digest end
+to end against the stand-in and an SMTP sink.
+
+For NewsAPISource it checks that: each category takes one request, plus
+one per retry it reports; every category comes back unless retries run
+out, and then each failed category is reported with its error; a 429
+pauses the fetch for its Retry-After; and the requests share at most
+NEWSAPI_CONCURRENCY connections. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_newsapi.py [latency seconds]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from common import load_send_news
+from e2e_benchmark import configure_environment, invoke_handler
+from fixture_server import FixtureNewsAPIServer, SMTPSink
+
+SCENARIOS = [
+    # (name, server options, categories expected back, minimum seconds, minimum retries)
+    ('healthy', {}, 'all', 0, 0),
+    ('rate limited', {'rate_limit_first': 3, 'retry_after': 1}, 'all', 1, 3),
+    # Which categories draw the failures depends on thread timing, so one may run out of retries
+    ('failing 20%', {'failure_rate': 0.2}, 'some', 0, 1),
+    ('failing', {'failure_rate': 1.0}, 'none', 0, 'all'),
+    ('always limited', {'rate_limit_first': 10 ** 6, 'retry_after': 0}, 'none', 0, 'all'),
+]
+
+def sequential_fetch(send_news, url, api_key):
+    """The previous fetch: a plain requests.get per category. Returns the categories that came back."""
+    fetched = 0
+    for category in send_news.NEWSAPI_CATEGORIES.values():
+        response = requests.get(f"{url}?category={category}&country=us&pageSize=15&apiKey={api_key}",
+                                headers={'X-Api-Key': api_key})
+        fetched += response.status_code == 200
+    return fetched
+
+def pooled_fetch(send_news, url, api_key):
+    """NewsAPISource.fetch(). Returns the categories that came back, the feed stats and the source's stats."""
+    feed_stats = send_news.new_feed_stats()
+    with send_news.NewsAPISource(api_key=api_key, url=url) as source:
+        source.fetch(datetime.now() - timedelta(days=7), feed_stats, send_news.RunTimer())
+    return feed_stats['successful_feeds'], feed_stats, feed_stats['newsapi']
+
+def check_pooled(send_news, server, seconds, fetched, feed_stats, stats, expected, minimum, min_retries):
+    """The checks a pooled fetch failed, by name."""
+    categories = len(send_news.NEWSAPI_CATEGORIES)
+    failed_feeds = feed_stats['failed_feeds']
+    expected = {'all': categories, 'some': categories - len(failed_feeds), 'none': 0}[expected]
+    if min_retries == 'all':
+        min_retries = categories * send_news.NEWSAPI_RETRIES
+    failures = []
+    if fetched != expected:
+        failures.append('categories fetched')
+    if len(failed_feeds) != categories - expected or not all(feed['error'] for feed in failed_feeds):
+        failures.append('failures reported')
+    if server.requests != categories + stats['retries'] or stats['retries'] < min_retries:
+        failures.append('requests')
+    if stats['rate_limited'] != min(server.requests, server.rate_limit_first):
+        failures.append('rate limits counted')
+    if seconds < minimum:
+        failures.append('retry-after')
+    if not 0 < server.connections <= min(send_news.NEWSAPI_CONCURRENCY, categories):
+        failures.append('connections')
+    return failures
+
+def main(latency):
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = send_news.LOG_LEVELS['error']
+    categories = len(send_news.NEWSAPI_CATEGORIES)
+    print(f"{categories} categories, {latency * 1000:.0f}ms per response\n")
+    print(f"{'scenario':>14} {'fetch':>10} {'seconds':>8} {'fetched':>8} {'requests':>9} "
+          f"{'connections':>12} {'retries':>8} {'ok':>4}")
+
+    failed = 0
+    for name, options, expected, minimum, min_retries in SCENARIOS:
+        with FixtureNewsAPIServer(latency=latency, **options) as server:
+            started = time.perf_counter()
+            fetched = sequential_fetch(send_news, server.url, server.api_key)
+            print(f"{name:>14} {'sequential':>10} {time.perf_counter() - started:>8.2f} "
+                  f"{fetched:>8} {server.requests:>9} {server.connections:>12} {0:>8}")
+        with FixtureNewsAPIServer(latency=latency, **options) as server:
+            started = time.perf_counter()
+            fetched, feed_stats, stats = pooled_fetch(send_news, server.url, server.api_key)
+            seconds = time.perf_counter() - started
+            failures = check_pooled(send_news, server, seconds, fetched, feed_stats, stats,
+                                    expected, minimum, min_retries)
+            failed += bool(failures)
+            print(f"{name:>14} {'pooled':>10} {seconds:>8.2f} {fetched:>8} {server.requests:>9} "
+                  f"{server.connections:>12} {stats['retries']:>8} {'yes' if not failures else 'NO':>4}"
+                  + (f"  ({', '.join(failures)})" if failures else ''))
+
+    with FixtureNewsAPIServer(latency=latency) as server, SMTPSink() as smtp_sink, \
+            tempfile.TemporaryDirectory(prefix='newsmonitor-newsapi-') as data_dir:
+        configure_environment(data_dir, smtp_sink.port, read_timeout=10)
+        os.environ.update({'DIGEST_SOURCE': 'newsapi', 'NEWS_API_KEY': server.api_key, 'NEWSAPI_URL': server.url})
+        send_news = load_send_news()
+        send_news.LOG_LEVEL = send_news.LOG_LEVELS['warning']
+        started = time.perf_counter()
+        status, body = invoke_handler(send_news)
+        ok = (status == 200 and body['stats']['articles_sent'] > 0 and smtp_sink.messages > 0
+              and server.requests == categories)
+        failed += not ok
+        print(f"\nnewsapi digest: HTTP {status} in {time.perf_counter() - started:.2f}s, "
+              f"{body['stats']['articles_sent']} articles, {smtp_sink.messages} emails, "
+              f"{server.requests} requests over {server.connections} connections, ok: {'yes' if ok else 'NO'}")
+    return failed
+
+if __name__ == '__main__':
+    sys.exit(1 if main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.1) else 0)
@@ -0,0 +1,56 @@
+"""Benchmark fetch_feed() with the streaming parser against full feedparser.
+
+Feeds come from the local fixture server. For each feed size, every feed is
+fetched once per parse mode and the average bytes read and parse time per
+feed are reported, plus whether both modes extract the same articles.
+
+Usage: python benchmarks/bench_parse.py [feeds per size]
+"""
+import sys
+from datetime import datetime, timedelta
+
+from common import load_send_news
+from fixture_server import FeedProfile, FixtureFeedServer
+
+SIZES = [
+    # (entries, description bytes)
+    (20, 600),
+    (100, 600),
+    (100, 3000),
+    (500, 3000),
+]
+
+def fetch_all(send_news, feed_urls, mode, cutoff_date):
+    send_news.FEED_PARSE_MODE = mode
+    bytes_read = parse_seconds = 0
+    articles = []
+    for feed_url in feed_urls:
+        feed = send_news.fetch_feed(feed_url)
+        bytes_read += feed['bytes_read']
+        parse_seconds += feed['parse_seconds']
+        articles.append([
+            (article.title, article.source, article.url, article.published_ts, article.description)
+            for article in send_news.extract_feed_articles(feed, cutoff_date)
+        ])
+    return bytes_read / len(feed_urls), parse_seconds / len(feed_urls), articles
+
+def main(feed_count):
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = send_news.LOG_LEVELS['error']
+    cutoff_date = datetime.now() - timedelta(days=7)
+
+    print(f"{'entries':>7} {'desc':>5} {'mode':>7} {'KiB read/feed':>14} {'parse ms/feed':>14} {'same articles':>14}")
+    for entries, description_size in SIZES:
+        profile = FeedProfile(entries=entries, description_size=description_size, latency=0)
+        with FixtureFeedServer(profile) as feed_server:
+            feed_urls = feed_server.feed_urls(feed_count)
+            full = fetch_all(send_news, feed_urls, 'full', cutoff_date)
+            stream = fetch_all(send_news, feed_urls, 'stream', cutoff_date)
+
+        for mode, (bytes_read, parse_seconds, articles) in (('full', full), ('stream', stream)):
+            same = 'yes' if articles == full[2] else 'NO'
+            print(f"{entries:>7} {description_size:>5} {mode:>7} {bytes_read / 1024:>14.1f} "
+                  f"{parse_seconds * 1000:>14.2f} {same:>14}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
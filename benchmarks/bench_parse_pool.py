@@ -0,0 +1,43 @@
+"""Benchmark feed parsing throughput against FeedParsePool worker count.
+
+Fetches fixture feeds from the local server with FEED_PARSE_MODE=full, so
+every feed goes through a full feedparser parse, and reports wall time and
+feeds per second for each worker count (0 = parse in the fetch threads).
+
+Usage: python benchmarks/bench_parse_pool.py [feeds] [worker counts...]
+"""
+import os
+import sys
+import time
+
+from common import load_send_news
+from fixture_server import FeedProfile, FixtureFeedServer
+
+def main(feed_count, worker_counts):
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = send_news.LOG_LEVELS['error']
+    send_news.FEED_PARSE_MODE = 'full'
+    profile = FeedProfile(entries=100, description_size=3000, latency=0)
+
+    print(f"{send_news.AVAILABLE_CORES} cores available, {feed_count} feeds of {profile.entries} entries")
+    print(f"{'workers':>7} {'wall s':>8} {'feeds/s':>8} {'parse s (sum)':>14}")
+    with FixtureFeedServer(profile) as feed_server:
+        feed_urls = feed_server.feed_urls(feed_count)
+        for workers in worker_counts:
+            pool = send_news.FeedParsePool(workers)
+            try:
+                started = time.perf_counter()
+                results = send_news.fetch_feeds(feed_urls, parse_pool=pool)
+                wall = time.perf_counter() - started
+            finally:
+                pool.close()
+            errors = sum(1 for feed, error in results.values() if error is not None)
+            parse_seconds = sum(feed['parse_seconds'] for feed, error in results.values() if feed is not None)
+            note = f"  ({errors} errors)" if errors else ""
+            print(f"{workers:>7} {wall:>8.2f} {feed_count / wall:>8.1f} {parse_seconds:>14.2f}{note}")
+
+if __name__ == '__main__':
+    feed_count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    worker_counts = [int(arg) for arg in sys.argv[2:]] or sorted({0, 1, 2, 4, cores})
+    main(feed_count, worker_counts)
@@ -0,0 +1,71 @@
+"""Benchmark digest ranking: rank_digest() over all of a run's candidates at once.
+
+Candidates are spread over the 7 categories and the last 7 days, with a
+tenth carried by several feeds. "warm" is the digest's case, where near-
+duplicate clustering has already counted each article's words; "cold"
+counts them too. "newest first" is the previous per-category sort, for
+comparison, with the number of distinct sources each picks for the digest.
+
+Usage: python benchmarks/bench_rank.py [candidates...]
+"""
+import random
+import sys
+import time
+
+from common import build_articles, load_send_news, synthetic_articles
+
+CATEGORIES = ["Top News", "Technology", "AI", "Arts and Entertainment", "Science", "Health", "Business"]
+HOSTS = ["reuters.com", "bbc.com", "example.com", "techmeme.com", "news.example.org"]
+REPEATS = 5
+
+def build_candidates(send_news, count, now, seed=7):
+    rng = random.Random(seed)
+    records = synthetic_articles(count, duplicate_ratio=0, seed=seed)
+    for i, record in enumerate(records):
+        record['url'] = f"https://{HOSTS[i % len(HOSTS)]}/story/{i}"
+    articles = build_articles(send_news, records)
+    for i, article in enumerate(articles):
+        article.published_ts = now - rng.random() * 7 * 86400
+        if rng.random() < 0.1:
+            for j in range(rng.randint(1, 4)):
+                article.add_alternate(send_news.Article(
+                    title=article.title, source=f"Wire {j}", url=f"https://wire{j}.example/{i}"))
+    return {category: articles[i::len(CATEGORIES)] for i, category in enumerate(CATEGORIES)}
+
+def newest_first(by_category, per_category):
+    return {
+        category: sorted(articles, key=lambda article: article.published_ts, reverse=True)[:per_category]
+        for category, articles in by_category.items()
+    }
+
+def median_ms(run):
+    samples = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    return sorted(samples)[len(samples) // 2] * 1000
+
+def distinct_sources(digest):
+    return len({article.source for articles in digest.values() for article in articles})
+
+def main(sizes):
+    send_news = load_send_news()
+    now = time.time()
+    per_category = send_news.DIGEST_ARTICLES_PER_CATEGORY
+    print(f"{'candidates':>10} {'cold ms':>9} {'warm ms':>9} {'newest ms':>10} "
+          f"{'sources':>8} {'(newest)':>9}")
+    for size in sizes:
+        # Fresh articles for each cold run, so their word counts aren't cached yet
+        cold_inputs = [build_candidates(send_news, size, now) for _ in range(REPEATS)]
+        cold = median_ms(lambda: send_news.rank_digest(cold_inputs.pop(), now=now))
+        by_category = build_candidates(send_news, size, now)
+        send_news.rank_digest(by_category, now=now)  # counts the words, as clustering would
+        warm = median_ms(lambda: send_news.rank_digest(by_category, now=now))
+        newest = median_ms(lambda: newest_first(by_category, per_category))
+        print(f"{size:>10} {cold:>9.2f} {warm:>9.2f} {newest:>10.2f} "
+              f"{distinct_sources(send_news.rank_digest(by_category, now=now)):>8} "
+              f"{distinct_sources(newest_first(by_category, per_category)):>9}")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
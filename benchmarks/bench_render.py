@@ -0,0 +1,40 @@
+"""Benchmark format_email_content() on a normal and a 10x larger digest.
+
+Usage: python benchmarks/bench_render.py [repeats]
+"""
+import sys
+import time
+
+from common import build_articles, load_send_news, synthetic_articles
+
+CATEGORIES = ["Top News", "Technology", "AI", "Arts and Entertainment", "Science", "Health", "Business"]
+
+def build_digest(send_news, per_category):
+    records = synthetic_articles(len(CATEGORIES) * per_category, duplicate_ratio=0)
+    for record in records:
+        record['published_at'] = '2024-01-05T10:20:00Z'
+    articles = build_articles(send_news, records)
+    return {
+        category: articles[i * per_category:(i + 1) * per_category]
+        for i, category in enumerate(CATEGORIES)
+    }
+
+def main(repeats):
+    send_news = load_send_news()
+    feed_stats = {'total_feeds': 50, 'successful_feeds': 48, 'failed_feeds': [{}, {}],
+                  'total_articles': 0, 'duplicates_removed': 12}
+
+    print(f"{'digest':>12} {'cards':>6} {'ms/render':>10} {'html bytes':>11}")
+    for label, per_category in (("7 x 15", 15), ("7 x 150", 150)):
+        news_data = build_digest(send_news, per_category)
+        feed_stats['total_articles'] = len(CATEGORIES) * per_category
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            html = send_news.format_email_content(news_data, feed_stats)
+        elapsed = (time.perf_counter() - started) / repeats
+
+        print(f"{label:>12} {feed_stats['total_articles']:>6} {elapsed * 1000:>10.2f} {len(html.encode()):>11}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
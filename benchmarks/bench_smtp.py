@@ -0,0 +1,84 @@
+"""Check and time SMTPSender, the pooled digest sender, against a local SMTP sink.
+
+Sends a digest to many recipients through send_email() and checks that:
+one connection carries them all; SMTP_MESSAGES_PER_CONNECTION opens a new
+one when reached; a server dropping the connection mid-run costs a
+reconnect and no message; and SMTP_SEND_RATE spaces the sends out. Against
+that, the cost of a connection per message. Then that failures are
+reported per recipient: refused recipients fail alone on the shared
+connection, and a rejected login or a server that isn't there fails every
+recipient after one login (or one connect and its retry). Exits non-zero
+if a check fails.
+
+Usage: python benchmarks/bench_smtp.py [messages]
+"""
+import math
+import socket
+import sys
+import time
+
+from common import load_send_news
+from fixture_server import SMTPSink
+
+def send(send_news, port, count, **options):
+    """Send the digest to count recipients; returns (seconds, results, sender connections)."""
+    sender = send_news.SMTPSender(host='127.0.0.1', port=port, use_ssl=False, **options)
+    recipients = [f"reader{i}@example.com" for i in range(count)]
+    started = time.perf_counter()
+    with sender:
+        results = send_news.send_email("Your Top News Update", "<p>digest</p>" * 500, recipients, sender=sender)
+    return time.perf_counter() - started, results, sender.connections_opened
+
+def unused_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def main(count):
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = max(send_news.LOG_LEVELS.values()) + 1  # the failure checks log an error per recipient
+    send_news.GMAIL_ADDRESS = 'digest@benchmark.local'
+    rate = 50
+    per_connection = max(1, count // 4)
+    drop_after = max(1, count // 3)
+    refused = {f"reader{i}@example.com" for i in range(0, count, 7)}
+    pooled = {'max_messages_per_connection': count, 'send_rate': 0}
+    login = {**pooled, 'username': 'digest', 'password': 'wrong'}
+    checks = [
+        # (name, sink options, sender options, expected failed recipients, expected connections, minimum seconds)
+        ('pooled', {}, pooled, set(), 1, 0),
+        (f'{per_connection} per connection', {}, {'max_messages_per_connection': per_connection, 'send_rate': 0},
+         set(), math.ceil(count / per_connection), 0),
+        (f'dropped every {drop_after}', {'drop_after': drop_after}, pooled, set(), math.ceil(count / drop_after), 0),
+        (f'{rate}/s rate limit', {}, {'max_messages_per_connection': count, 'send_rate': rate}, set(), 1,
+         (count - 1) / rate),
+        ('connection each', {}, {'max_messages_per_connection': 1, 'send_rate': 0}, set(), count, 0),
+        (f'{len(refused)} refused', {'refuse': refused}, pooled, refused, 1, 0),
+        ('login rejected', {'reject_login': True}, login, None, 1, 0),
+        ('server down', None, pooled, None, 0, 0),
+    ]
+
+    print(f"{count} messages\n")
+    print(f"{'sender':>22} {'seconds':>8} {'sent':>5} {'failed':>7} {'connections':>12} {'expected':>9} {'ok':>4}")
+    failed = 0
+    for name, sink_options, sender_options, expected_failed, expected, minimum in checks:
+        if sink_options is None:
+            seconds, results, opened = send(send_news, unused_port(), count, **sender_options)
+            accepted = 0
+        else:
+            with SMTPSink(**sink_options) as sink:
+                seconds, results, opened = send(send_news, sink.port, count, **sender_options)
+                accepted = sink.connections
+        if expected_failed is None:
+            expected_failed = {result['recipient'] for result in results}
+        sent = sum(1 for result in results if result['status'] == 'sent')
+        failures = {result['recipient'] for result in results if result['status'] == 'failed' and result['error']}
+        ok = (len(results) == count and failures == expected_failed and sent == count - len(expected_failed)
+              and accepted == expected and opened == (expected if sent else 0) and seconds >= minimum)
+        failed += not ok
+        print(f"{name:>22} {seconds:>8.3f} {sent:>5} {len(failures):>7} {accepted:>12} {expected:>9} "
+              f"{'yes' if ok else 'NO':>4}")
+    return failed
+
+if __name__ == '__main__':
+    sys.exit(1 if main(int(sys.argv[1]) if len(sys.argv) > 1 else 40) else 0)
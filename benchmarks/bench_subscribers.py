@@ -0,0 +1,97 @@
+"""Benchmark personalized digests: matching one run's articles to every subscriber.
+
+Subscribers pick a few categories (a fifth take all), and some add include
+or exclude keywords or block a source. SubscriberIndex.match() is timed
+against a straightforward loop over subscribers and articles (and checked
+to agree with it), then each distinct digest is rendered once with
+render_digest(), against the cost of rendering one per subscriber.
+
+Usage: python benchmarks/bench_subscribers.py [subscribers...]
+"""
+import random
+import sys
+import time
+
+from common import WORDS, build_articles, load_send_news, synthetic_articles
+
+CATEGORIES = ["Top News", "Technology", "AI", "Arts and Entertainment", "Science", "Health", "Business"]
+
+def build_ranked(send_news, per_category):
+    articles = build_articles(send_news, synthetic_articles(len(CATEGORIES) * per_category, duplicate_ratio=0))
+    for article in articles:
+        article.published_at = '2024-01-05T10:20:00Z'
+    return {category: articles[i::len(CATEGORIES)] for i, category in enumerate(CATEGORIES)}
+
+def build_subscriptions(send_news, count, seed=5):
+    rng = random.Random(seed)
+    popular = WORDS[:20]
+    subscriptions = []
+    for i in range(count):
+        categories = None if rng.random() < 0.2 else rng.sample(CATEGORIES, rng.randint(1, 3))
+        include = rng.sample(popular, rng.randint(1, 2)) if rng.random() < 0.25 else ()
+        exclude = [rng.choice(WORDS)] if rng.random() < 0.15 else ()
+        blocked = [f"Source {rng.randrange(10)}"] if rng.random() < 0.1 else ()
+        subscriptions.append(send_news.Subscription(f"reader{i}@example.com", categories, include, exclude, blocked))
+    return subscriptions
+
+def naive_match(subscriptions, ranked, per_category):
+    """Each subscriber's digest by checking every article for every subscriber."""
+    digests = []
+    for subscription in subscriptions:
+        news_data = {}
+        for category, articles in ranked.items():
+            if subscription.categories is not None and category not in subscription.categories:
+                continue
+            picked = []
+            for article in articles:
+                if len(picked) == per_category:
+                    break
+                terms = article.terms
+                if (article.source in subscription.blocked_sources
+                        or not subscription.exclude.isdisjoint(terms)
+                        or (subscription.include and subscription.include.isdisjoint(terms))):
+                    continue
+                picked.append(article)
+            news_data[category] = picked
+        digests.append(news_data)
+    return digests
+
+def main(sizes):
+    send_news = load_send_news()
+    send_news.LOG_LEVEL = send_news.LOG_LEVELS['warning']
+    per_category = send_news.DIGEST_ARTICLES_PER_CATEGORY
+    ranked = build_ranked(send_news, send_news.SUBSCRIBER_POOL_PER_CATEGORY)
+    stats = {'total_feeds': 50, 'successful_feeds': 50, 'failed_feeds': [], 'total_articles': 0}
+    print(f"{sum(len(articles) for articles in ranked.values())} ranked articles\n")
+    print(f"{'subscribers':>11} {'index ms':>9} {'match ms':>9} {'naive ms':>9} {'agree':>6} "
+          f"{'digests':>8} {'render s':>9} {'per-subscriber s':>17}")
+
+    for size in sizes:
+        subscriptions = build_subscriptions(send_news, size)
+
+        started = time.perf_counter()
+        index = send_news.SubscriberIndex(subscriptions)
+        indexed = time.perf_counter()
+        digests = index.match(ranked, per_category)
+        matched = time.perf_counter()
+        naive = naive_match(subscriptions, ranked, per_category)
+        naive_seconds = time.perf_counter() - matched
+
+        by_email = {subscription.email: news_data for news_data, group in digests for subscription in group}
+        agree = all(
+            {category: [a.url for a in articles] for category, articles in by_email[s.email].items()}
+            == {category: [a.url for a in articles] for category, articles in expected.items()}
+            for s, expected in zip(subscriptions, naive)
+        )
+
+        started_render = time.perf_counter()
+        for news_data, _ in digests:
+            send_news.render_digest(news_data, dict(stats), "Your Top News Update")
+        render_seconds = time.perf_counter() - started_render
+
+        print(f"{size:>11} {(indexed - started) * 1000:>9.1f} {(matched - indexed) * 1000:>9.1f} "
+              f"{naive_seconds * 1000:>9.1f} {'yes' if agree else 'NO':>6} {len(digests):>8} "
+              f"{render_seconds:>9.2f} {render_seconds / len(digests) * size:>17.1f}")
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000])
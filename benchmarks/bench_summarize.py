@@ -0,0 +1,74 @@
+"""Benchmark summarize_html() against the old regex tag strip + [:300] cut.
+
+Inputs are the item bodies in benchmarks/fixtures/*.xml (feeds that embed
+whole articles), the same bodies as plain text (feeds whose summaries carry
+no markup) and generated article bodies of increasing size.
+
+Usage: python benchmarks/bench_summarize.py [repeats]
+"""
+import random
+import re
+import sys
+import time
+
+import feedparser
+
+from common import WORDS, load_send_news
+from fixture_server import FIXTURES_DIR
+
+def regex_summary(text):
+    """What extract_feed_articles() used to do."""
+    return re.sub('<[^<]+?>', '', text).strip()[:300]
+
+def article_body(size, seed=3):
+    rng = random.Random(seed)
+    parts = ['<div class="article"><style>.x { color: red }</style>']
+    length = 0
+    while length < size:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(20))
+        paragraph = (f'<p>{sentence.capitalize()} &mdash; <a href="https://example.com/{length}">'
+                     f'{rng.choice(WORDS)}</a> &amp; <em>{rng.choice(WORDS)}</em>&nbsp;said.</p>\n')
+        parts.append(paragraph)
+        length += len(paragraph)
+    parts.append('</div>')
+    return ''.join(parts)
+
+def fixture_bodies():
+    bodies = []
+    for path in sorted(FIXTURES_DIR.glob("*.xml")):
+        for entry in feedparser.parse(path.read_bytes()).entries:
+            content = entry.get('content')
+            bodies.append(content[0]['value'] if content else entry.get('summary', ''))
+    return bodies
+
+def bench(function, bodies, repeats):
+    """Seconds per body, best of `repeats` rounds (the others lost time to the machine, not the code)."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for body in bodies:
+            function(body)
+        best = min(best, time.perf_counter() - started)
+    return best / len(bodies)
+
+def main(repeats):
+    send_news = load_send_news()
+    inputs = [('fixture items', fixture_bodies())]
+    inputs.append(('plain items', [' '.join(regex_summary(body).split()) * 3 for body in inputs[0][1]]))
+    inputs += [(f'{size // 1024} KiB bodies', [article_body(size, seed) for seed in range(20)])
+               for size in (1024, 10 * 1024, 100 * 1024)]
+
+    print(f"{'input':>16} {'avg bytes':>10} {'regex us':>10} {'summarize us':>13} {'speedup':>8}")
+    for label, bodies in inputs:
+        average = sum(len(body) for body in bodies) / len(bodies)
+        regex = bench(regex_summary, bodies, repeats)
+        summarize = bench(send_news.summarize_html, bodies, repeats)
+        print(f"{label:>16} {average:>10.0f} {regex * 1e6:>10.1f} {summarize * 1e6:>13.1f} "
+              f"{regex / summarize:>7.1f}x")
+
+    sample = inputs[-1][1][0]
+    print(f"\nregex:     {regex_summary(sample)[:120]!r}")
+    print(f"summarize: {send_news.summarize_html(sample)[:120]!r}")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,55 @@
+"""Shared helpers for the benchmark scripts.
+
+api/send-news.py isn't an importable module name, so it is loaded by path.
+"""
+import importlib.util
+import random
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SEND_NEWS_PATH = REPO_ROOT / "api" / "send-news.py"
+
+WORDS = """
+market stocks rally inflation senate budget vote court ruling election campaign storm
+flood wildfire earthquake tsunami climate summit talks ceasefire border trade tariffs
+chip startup funding launch model research study vaccine hospital outbreak drug trial
+film festival album tour award streaming series studio space rocket mission telescope
+planet energy oil prices bank rates jobs report profit merger deal lawsuit regulator
+""".split()
+
+def load_send_news():
+    """Import api/send-news.py as a module."""
+    spec = importlib.util.spec_from_file_location("send_news", SEND_NEWS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def synthetic_articles(count, duplicate_ratio=0.2, seed=42):
+    """Random article fields where roughly duplicate_ratio of them re-word an earlier story.
+
+    Returns dicts of Article keyword arguments; see build_articles().
+    """
+    rng = random.Random(seed)
+    articles = []
+    for i in range(count):
+        if articles and rng.random() < duplicate_ratio:
+            original = rng.choice(articles)
+            title_words = original['title'].split()
+            title_words[rng.randrange(len(title_words))] = rng.choice(WORDS)
+            title = ' '.join(title_words)
+            description = original['description']
+        else:
+            title = ' '.join(rng.choice(WORDS) for _ in range(10))
+            description = ' '.join(rng.choice(WORDS) for _ in range(35))
+        articles.append({
+            'title': title,
+            'description': description,
+            'source': f"Source {rng.randrange(50)}",
+            'published_at': '',
+            'url': f"https://example.com/story/{i}"
+        })
+    return articles
+
+def build_articles(send_news, records):
+    """Turn synthetic_articles() output into send_news.Article objects."""
+    return [send_news.Article(**record) for record in records]
@@ -0,0 +1,311 @@
+"""Offline end-to-end benchmark of handler.do_GET.
+
+Serves fixture feeds from a local HTTP server, sends mail to a local SMTP
+sink, drives the real handler and reports per-stage timings, peak memory and
+how both scale with the number of feeds and entries per feed.
+
+Usage:
+    python benchmarks/e2e_benchmark.py                    # quick grid
+    python benchmarks/e2e_benchmark.py --full             # up to 5,000 feeds / entries
+    python benchmarks/e2e_benchmark.py --feeds 50 500 --entries 20 --latency 0.2
+    python benchmarks/e2e_benchmark.py --compare benchmarks/results/abc1234.json
+    python benchmarks/e2e_benchmark.py --from-store       # ingest first, time only the digest
+    python benchmarks/e2e_benchmark.py --record --archive-dir /tmp/feeds   # record feed responses
+    python benchmarks/e2e_benchmark.py --replay latest --archive-dir /tmp/feeds --replay-latency zero
+
+--replay re-runs a digest from a recorded run (see FeedArchive in
+api/send-news.py), e.g. one copied from production, instead of fixture feeds.
+
+Results are written as JSON to benchmarks/results/<commit>.json (or --output).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+
+from common import REPO_ROOT, load_send_news
+from fixture_server import FeedProfile, FixtureFeedServer, SMTPSink
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+CATEGORIES = ["Top News", "Technology", "AI", "Arts and Entertainment", "Science", "Health", "Business"]
+API_KEY = "benchmark-key"
+
+# Pipeline functions timed as stages. "parse" is cumulative parse time across
+# fetch threads, taken from the handler's own timings, so it overlaps "fetch"
+# (wall time).
+STAGE_FUNCTIONS = {
+    'fetch': ['fetch_feeds'],
+    'filter': ['extract_feed_articles'],
+    'dedup': ['cluster_near_duplicates', 'deduplicate_articles'],
+    'rank': ['rank_digest'],
+    'render': ['render_digest'],
+    'send': ['send_email'],
+}
+
+class StageTimer:
+    """Wraps module functions so every call adds its duration to a stage."""
+
+    def __init__(self):
+        self.totals = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._restore = []
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.totals[stage] = self.totals.get(stage, 0.0) + elapsed
+                    self.calls[stage] = self.calls.get(stage, 0) + 1
+
+        setattr(owner, name, timed)
+        self._restore.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._restore):
+            setattr(owner, name, original)
+        self._restore = []
+
+def invoke_handler(send_news, path='/api/send-news'):
+    """Call handler.do_GET without a socket and return (status, parsed JSON body)."""
+    handler = send_news.handler.__new__(send_news.handler)
+    handler.headers = {'X-API-KEY': API_KEY}
+    handler.path = path
+    handler.command = 'GET'
+    handler.request_version = 'HTTP/1.1'
+    handler.requestline = f'GET {path} HTTP/1.1'
+    handler.client_address = ('127.0.0.1', 0)
+    handler.wfile = io.BytesIO()
+    handler.log_request = lambda *args: None
+    handler.do_GET()
+
+    raw = handler.wfile.getvalue()
+    head, _, body = raw.partition(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    return status, json.loads(body or b'null')
+
+def configure_environment(data_dir, smtp_port, read_timeout, archive_dir=None):
+    if archive_dir:
+        os.environ['FEED_ARCHIVE_DIR'] = str(Path(archive_dir).resolve())
+    os.environ.update({
+        'NEWSMONITOR_DATA_DIR': str(data_dir),
+        'MY_SECRET_API_KEY': API_KEY,
+        'GMAIL_ADDRESS': 'digest@benchmark.local',
+        'GMAIL_APP_PASSWORD': 'benchmark',
+        'RECIPIENT_EMAIL': 'reader@benchmark.local',
+        'SMTP_HOST': '127.0.0.1',
+        'SMTP_PORT': str(smtp_port),
+        'SMTP_USE_SSL': 'false',
+        'SMTP_SEND_RATE': '0',
+        'FEED_READ_TIMEOUT': str(read_timeout),
+        # Every fixture feed is on the one local host, so per-host limits would serialize them
+        'FEED_HOST_CONCURRENCY': '0',
+        'FEED_HOST_MIN_INTERVAL': '0',
+    })
+
+def run_once(feed_server, smtp_sink, feed_count, read_timeout, measure_memory, verbose, from_store=False,
+             path='/api/send-news', archive_dir=None):
+    """One cold run of the handler against feed_count fixture feeds.
+
+    With from_store=True the ingest route runs first (untimed), so the digest
+    is built from the article store rather than by fetching feeds. Without a
+    feed server, path should ask for a replay from archive_dir.
+    """
+    with tempfile.TemporaryDirectory(prefix='newsmonitor-bench-') as data_dir:
+        configure_environment(data_dir, smtp_sink.port, read_timeout, archive_dir)
+        send_news = load_send_news()
+
+        if feed_server is not None:
+            feed_urls = feed_server.feed_urls(feed_count)
+            send_news.RSS_FEEDS = {
+                category: feed_urls[i::len(CATEGORIES)]
+                for i, category in enumerate(CATEGORIES)
+                if feed_urls[i::len(CATEGORIES)]
+            }
+
+        if from_store:
+            with redirect_stdout(io.StringIO()):
+                invoke_handler(send_news, '/api/ingest')
+
+        timer = StageTimer()
+        for stage, names in STAGE_FUNCTIONS.items():
+            for name in names:
+                timer.wrap(send_news, name, stage)
+
+        messages_before = smtp_sink.messages
+        bytes_before = smtp_sink.bytes_received
+        served_before = feed_server.bytes_served if feed_server is not None else 0
+        log = io.StringIO()
+        if measure_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            with redirect_stdout(sys.stdout if verbose else log):
+                status, body = invoke_handler(send_news, path)
+        finally:
+            wall = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+            if measure_memory:
+                tracemalloc.stop()
+            timer.restore()
+
+    stats = (body or {}).get('stats', {})
+    handler_timings = (body or {}).get('timings') or {}
+    if 'parse' in handler_timings:
+        timer.totals['parse'] = handler_timings['parse']['seconds']
+        timer.calls['parse'] = handler_timings['parse']['calls']
+    return {
+        'status': status,
+        'source': (body or {}).get('source'),
+        'archive_run': (body or {}).get('archive_run'),
+        'wall_seconds': round(wall, 4),
+        'stages': {stage: round(seconds, 4) for stage, seconds in sorted(timer.totals.items())},
+        'stage_calls': dict(sorted(timer.calls.items())),
+        'handler_timings': (body or {}).get('timings'),
+        'peak_memory_bytes': peak,
+        'articles_sent': stats.get('articles_sent'),
+        'successful_feeds': stats.get('successful_feeds'),
+        'total_feeds': stats.get('total_feeds'),
+        'duplicates_removed': stats.get('duplicates_removed'),
+        'feed_bytes_served': feed_server.bytes_served - served_before if feed_server is not None else 0,
+        'emails_sent': smtp_sink.messages - messages_before,
+        'email_bytes': smtp_sink.bytes_received - bytes_before,
+    }
+
+def run_scenario(args, feed_count, entries):
+    profile = FeedProfile(
+        entries=entries,
+        description_size=args.description_size,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.read_timeout * 2,
+        malformed_rate=args.malformed_rate,
+    )
+    path = '/api/send-news?archive=record' if args.record else '/api/send-news'
+    with FixtureFeedServer(profile, recorded=args.recorded) as feed_server, SMTPSink() as smtp_sink:
+        result = run_once(feed_server, smtp_sink, feed_count, args.read_timeout, False, args.verbose,
+                          args.from_store, path, args.archive_dir)
+        if not args.no_memory:
+            # Separate pass: tracemalloc slows everything down, so it mustn't skew timings
+            memory_run = run_once(feed_server, smtp_sink, feed_count, args.read_timeout, True, False,
+                                  args.from_store, '/api/send-news', args.archive_dir)
+            result['peak_memory_bytes'] = memory_run['peak_memory_bytes']
+
+    result = {'feeds': feed_count, 'entries_per_feed': entries, **result}
+    if result['archive_run']:
+        print(f"Recorded run {result['archive_run']}")
+    stages = ' '.join(f"{stage}={seconds:.3f}" for stage, seconds in result['stages'].items())
+    memory = f"{result['peak_memory_bytes'] / 2 ** 20:.1f}MiB" if result['peak_memory_bytes'] else '-'
+    print(f"{feed_count:>6} feeds x {entries:>5} entries: {result['wall_seconds']:>8.3f}s  "
+          f"peak {memory:>9}  {stages}")
+    return result
+
+def run_replay(args):
+    """Time a digest replayed from a recorded run."""
+    path = f'/api/send-news?archive=replay&run={args.replay}&latency={args.replay_latency}'
+    with SMTPSink() as smtp_sink:
+        result = run_once(None, smtp_sink, 0, args.read_timeout, False, args.verbose, path=path,
+                          archive_dir=args.archive_dir)
+        if not args.no_memory:
+            memory_run = run_once(None, smtp_sink, 0, args.read_timeout, True, False, path=path,
+                                  archive_dir=args.archive_dir)
+            result['peak_memory_bytes'] = memory_run['peak_memory_bytes']
+
+    result = {'feeds': result['total_feeds'], 'entries_per_feed': None, **result}
+    stages = ' '.join(f"{stage}={seconds:.3f}" for stage, seconds in result['stages'].items())
+    memory = f"{result['peak_memory_bytes'] / 2 ** 20:.1f}MiB" if result['peak_memory_bytes'] else '-'
+    print(f"replay {result['archive_run']} ({args.replay_latency} latency), {result['feeds']} feeds: "
+          f"{result['wall_seconds']:.3f}s  peak {memory}  {stages}")
+    return result
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return 'unknown'
+
+def compare(previous_path, results):
+    previous = json.loads(Path(previous_path).read_text())
+    before = {(r['feeds'], r['entries_per_feed']): r for r in previous['scenarios']}
+    print(f"\nCompared with {previous['commit']}:")
+    for result in results['scenarios']:
+        old = before.get((result['feeds'], result['entries_per_feed']))
+        if not old:
+            continue
+        change = (result['wall_seconds'] - old['wall_seconds']) / old['wall_seconds'] * 100
+        print(f"{result['feeds']:>6} feeds x {result['entries_per_feed']:>5} entries: "
+              f"{old['wall_seconds']:.3f}s -> {result['wall_seconds']:.3f}s ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feeds', type=int, nargs='+', help='feed counts to sweep (default 50 500)')
+    parser.add_argument('--entries', type=int, nargs='+', help='entries per feed to sweep (default 50 500)')
+    parser.add_argument('--full', action='store_true', help='sweep feeds and entries up to 5,000')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per feed response')
+    parser.add_argument('--jitter', type=float, default=0.05, help='extra random latency, seconds')
+    parser.add_argument('--description-size', type=int, default=600, help='bytes of HTML per item')
+    parser.add_argument('--failure-rate', type=float, default=0.02, help='fraction of feeds returning 500')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='fraction of feeds that stall')
+    parser.add_argument('--malformed-rate', type=float, default=0.02, help='fraction of feeds with broken XML')
+    parser.add_argument('--read-timeout', type=float, default=5.0, help='FEED_READ_TIMEOUT for the run')
+    parser.add_argument('--recorded', action='store_true', help='serve benchmarks/fixtures/*.xml instead')
+    parser.add_argument('--from-store', action='store_true', help='ingest first, then time a digest from the store')
+    parser.add_argument('--record', action='store_true', help='record the feed responses to --archive-dir')
+    parser.add_argument('--replay', metavar='RUN', help="replay a recorded run (or 'latest') from --archive-dir")
+    parser.add_argument('--archive-dir', help='feed archive directory for --record and --replay')
+    parser.add_argument('--replay-latency', choices=['original', 'zero'], default='original',
+                        help="replay with each feed's recorded download time, or none")
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak-memory pass')
+    parser.add_argument('--verbose', action='store_true', help="show the handler's own log output")
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+    if (args.record or args.replay) and not args.archive_dir:
+        parser.error('--record and --replay need --archive-dir')
+
+    sweep = [5000] if args.full else []
+    feed_counts = args.feeds or [50, 500] + sweep
+    entry_counts = args.entries or [50, 500] + sweep
+    # Sweep feeds at the first entry count, then entries at the first feed count
+    scenarios = [(feeds, entry_counts[0]) for feeds in feed_counts]
+    scenarios += [(feed_counts[0], entries) for entries in entry_counts[1:]]
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': ([run_replay(args)] if args.replay else
+                      [run_scenario(args, feeds, entries) for feeds, entries in scenarios]),
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{results['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == '__main__':
+    main()
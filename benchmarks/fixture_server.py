@@ -0,0 +1,473 @@
+"""Local stand-ins for the outside world: an RSS/Atom fixture server, a NewsAPI
+stand-in and an SMTP sink.
+
+FixtureFeedServer serves /feed/<n> as RSS (even n) or Atom (odd n), either
+generated or taken from recorded fixture files, with configurable latency,
+size and failure injection. FixtureNewsAPIServer answers NewsAPI's
+/v2/top-headlines, with rate limiting and failures on demand. SMTPSink
+accepts and counts messages without delivering them.
+"""
+import hashlib
+import json
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+from common import WORDS
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+RSS_DATE_PATTERN = re.compile(rb"<pubDate>[^<]*</pubDate>")
+ATOM_DATE_PATTERN = re.compile(rb"<(updated|published)>[^<]*</(updated|published)>")
+
+class FeedProfile:
+    """Knobs for the generated feeds.
+
+    entries          - items per feed
+    description_size - approximate bytes of HTML per item description
+    latency          - seconds before each response starts
+    handshake_latency - seconds before a new connection is served (stands in for DNS, TCP and TLS)
+    jitter           - extra random latency, up to this many seconds
+    failure_rate     - fraction of feeds answering HTTP 500
+    hang_rate        - fraction of feeds that stall for hang_seconds
+    malformed_rate   - fraction of feeds serving broken XML
+    shared_ratio     - fraction of items copied from a shared pool of wire stories
+    """
+
+    def __init__(self, entries=20, description_size=600, latency=0.05, jitter=0.0,
+                 failure_rate=0.0, hang_rate=0.0, hang_seconds=30.0, malformed_rate=0.0,
+                 shared_ratio=0.1, seed=7, handshake_latency=0.0):
+        self.entries = entries
+        self.description_size = description_size
+        self.latency = latency
+        self.handshake_latency = handshake_latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.malformed_rate = malformed_rate
+        self.shared_ratio = shared_ratio
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def _description(rng, size):
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = f"<p>{_sentence(rng, 18).capitalize()} &amp; {_sentence(rng, 12)}.</p>"
+        paragraphs.append(paragraph)
+        length += len(paragraph)
+    return ''.join(paragraphs)
+
+def generate_feed(feed_id, profile, now=None):
+    """Build the XML body for one generated feed."""
+    rng = random.Random(profile.seed * 100003 + feed_id)
+    shared_rng = random.Random(profile.seed)
+    shared_pool = [(_sentence(shared_rng, 10), _description(shared_rng, profile.description_size))
+                   for _ in range(50)]
+    now = now or datetime.now(timezone.utc)
+    is_atom = feed_id % 2 == 1
+
+    items = []
+    for i in range(profile.entries):
+        if rng.random() < profile.shared_ratio:
+            title, description = rng.choice(shared_pool)
+        else:
+            title, description = _sentence(rng, 10), _description(rng, profile.description_size)
+        published = now - timedelta(minutes=37 * i + feed_id % 30)
+        link = f"https://fixture.example/feed{feed_id}/story-{i}?utm_source=rss"
+        if is_atom:
+            items.append(
+                f"<entry><title>{escape(title)}</title><link href=\"{link}\"/>"
+                f"<id>urn:fixture:{feed_id}:{i}</id><updated>{published.isoformat()}</updated>"
+                f"<summary type=\"html\">{escape(description)}</summary></entry>"
+            )
+        else:
+            items.append(
+                f"<item><title>{escape(title)}</title><link>{link}</link>"
+                f"<guid isPermaLink=\"false\">fixture-{feed_id}-{i}</guid>"
+                f"<pubDate>{format_datetime(published)}</pubDate>"
+                f"<description>{escape(description)}</description></item>"
+            )
+
+    if is_atom:
+        return (f"<?xml version=\"1.0\" encoding=\"utf-8\"?>"
+                f"<feed xmlns=\"http://www.w3.org/2005/Atom\"><title>Fixture Atom {feed_id}</title>"
+                f"<id>urn:fixture:{feed_id}</id><updated>{now.isoformat()}</updated>"
+                f"{''.join(items)}</feed>").encode()
+    return (f"<?xml version=\"1.0\" encoding=\"utf-8\"?>"
+            f"<rss version=\"2.0\"><channel><title>Fixture RSS {feed_id}</title>"
+            f"<link>https://fixture.example/feed{feed_id}</link>"
+            f"{''.join(items)}</channel></rss>").encode()
+
+def refresh_recorded_dates(body, now=None):
+    """Shift every date in a recorded feed to the recent past, so the 7-day filter keeps it."""
+    now = now or datetime.now(timezone.utc)
+    counter = iter(range(10 ** 6))
+
+    def rss_date(match):
+        return f"<pubDate>{format_datetime(now - timedelta(minutes=31 * next(counter)))}</pubDate>".encode()
+
+    def atom_date(match):
+        tag = match.group(1).decode()
+        return f"<{tag}>{(now - timedelta(minutes=31 * next(counter))).isoformat()}</{tag}>".encode()
+
+    body = RSS_DATE_PATTERN.sub(rss_date, body)
+    return ATOM_DATE_PATTERN.sub(atom_date, body)
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """Doesn't print tracebacks for clients that hang up early (e.g. streaming parses)."""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+class FixtureFeedServer:
+    """Threaded HTTP server for fixture feeds at http://127.0.0.1:<port>/feed/<n>.
+
+    With recorded=True the files in benchmarks/fixtures are served round-robin
+    (dates refreshed) instead of generated feeds. Supports ETag revalidation
+    and keep-alive; `connections` counts the TCP connections accepted and
+    `max_in_flight` the most requests it was answering at once.
+    """
+
+    def __init__(self, profile=None, recorded=False):
+        self.profile = profile or FeedProfile()
+        self.recorded = [path.read_bytes() for path in sorted(FIXTURES_DIR.glob("*.xml"))] if recorded else None
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.bytes_served = 0
+        self._bodies = {}
+        self._lock = threading.Lock()
+        self._server = QuietHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def feed_urls(self, count):
+        return [f"{self.base_url}/feed/{i}" for i in range(count)]
+
+    def body_for(self, feed_id):
+        body = self._bodies.get(feed_id)
+        if body is None:
+            if self.recorded:
+                body = refresh_recorded_dates(self.recorded[feed_id % len(self.recorded)])
+            else:
+                body = generate_feed(feed_id, self.profile)
+            self._bodies[feed_id] = body
+        return body
+
+    def _fault_for(self, feed_id):
+        rng = random.Random(self.profile.seed * 7919 + feed_id)
+        roll = rng.random()
+        for fault, rate in (('fail', self.profile.failure_rate), ('hang', self.profile.hang_rate),
+                            ('malformed', self.profile.malformed_rate)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+                time.sleep(server.profile.handshake_latency)
+
+            def do_GET(self):
+                with server._lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    self.serve_feed()
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def serve_feed(self):
+                match = re.match(r"^/feed/(\d+)", self.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                feed_id = int(match.group(1))
+                profile = server.profile
+                with server._lock:
+                    server.requests += 1
+
+                delay = profile.latency + random.random() * profile.jitter
+                fault = server._fault_for(feed_id)
+                if fault == 'hang':
+                    delay += profile.hang_seconds
+                time.sleep(delay)
+
+                if fault == 'fail':
+                    self.send_error(500)
+                    return
+                body = server.body_for(feed_id)
+                if fault == 'malformed':
+                    body = body[:len(body) // 2]
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                content_type = 'application/atom+xml' if b'<feed' in body[:200] else 'application/rss+xml'
+                self.send_response(200)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.bytes_served += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+class FixtureNewsAPIServer:
+    """NewsAPI stand-in: /v2/top-headlines?category=<c>&pageSize=<n> as NewsAPI answers it.
+
+    Requests need the X-Api-Key header. The first rate_limit_first requests
+    get a 429 with a Retry-After of retry_after seconds, and failure_rate of
+    the rest a 500. Every response waits `latency` seconds. Counts requests
+    and the TCP connections they came over.
+    """
+
+    def __init__(self, latency=0.1, api_key='benchmark-key', rate_limit_first=0, retry_after=1,
+                 failure_rate=0.0, seed=7):
+        self.latency = latency
+        self.api_key = api_key
+        self.rate_limit_first = rate_limit_first
+        self.retry_after = retry_after
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.connections = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = QuietHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v2/top-headlines"
+
+    def headlines(self, category, count):
+        """NewsAPI article records for a category, newest first, one in ten removed by its publisher."""
+        rng = random.Random(f"{category}-{count}")
+        now = datetime.now(timezone.utc)
+        articles = []
+        for i in range(count):
+            if i % 10 == 9:
+                articles.append({'source': {'id': None, 'name': '[Removed]'}, 'title': '[Removed]',
+                                 'description': '[Removed]', 'url': 'https://removed.com',
+                                 'publishedAt': '1970-01-01T00:00:00Z'})
+                continue
+            articles.append({
+                'source': {'id': None, 'name': f"Wire {rng.randrange(12)}"},
+                'author': None,
+                'title': _sentence(rng, 10).capitalize(),
+                'description': _sentence(rng, 30),
+                'url': f"https://newsapi.example/{category}/{i}",
+                'publishedAt': (now - timedelta(minutes=23 * i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            })
+        return articles
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def reply(self, status, data, headers=()):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if parts.path != '/v2/top-headlines':
+                    self.reply(404, {'status': 'error', 'code': 'notFound', 'message': 'Not found'})
+                    return
+                with server._lock:
+                    server.requests += 1
+                    number = server.requests
+                    failed = server._rng.random() < server.failure_rate
+                time.sleep(server.latency)
+
+                if self.headers.get('X-Api-Key') != server.api_key:
+                    self.reply(401, {'status': 'error', 'code': 'apiKeyInvalid', 'message': 'Your API key is invalid'})
+                elif number <= server.rate_limit_first:
+                    self.reply(429, {'status': 'error', 'code': 'rateLimited', 'message': 'Too many requests'},
+                               [('Retry-After', str(server.retry_after))])
+                elif failed:
+                    self.reply(500, {'status': 'error', 'code': 'unexpectedError', 'message': 'Server error'})
+                else:
+                    query = parse_qs(parts.query)
+                    category = query.get('category', ['general'])[0]
+                    articles = server.headlines(category, min(100, int(query.get('pageSize', ['20'])[0])))
+                    self.reply(200, {'status': 'ok', 'totalResults': len(articles), 'articles': articles})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+class SMTPSink:
+    """Minimal SMTP server that accepts everything and keeps only counts.
+
+    Speaks enough of the protocol for smtplib.SMTP: EHLO/HELO, AUTH, MAIL,
+    RCPT, DATA, RSET, NOOP and QUIT. With drop_after, each connection is cut
+    without a goodbye once it has delivered that many messages, as servers
+    dropping idle or long sessions do. With reject_login, every AUTH is
+    refused (535); recipients in refuse are rejected at RCPT (550).
+    """
+
+    def __init__(self, drop_after=None, reject_login=False, refuse=()):
+        self.drop_after = drop_after
+        self.reject_login = reject_login
+        self.refuse = {recipient.lower() for recipient in refuse}
+        self.messages = 0
+        self.bytes_received = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handler_class(self):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                with sink._lock:
+                    sink.connections += 1
+                delivered = 0
+                self.reply("220 sink ESMTP")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').strip().upper()
+                    if command.startswith(('EHLO', 'HELO')):
+                        self.reply("250-sink")
+                        self.reply("250 AUTH PLAIN LOGIN")
+                    elif command.startswith('AUTH'):
+                        if sink.reject_login:
+                            self.reply("535 5.7.8 Username and Password not accepted")
+                        else:
+                            self.reply("235 2.7.0 Authentication successful")
+                    elif command.startswith('RCPT'):
+                        address = command.partition(':')[2].strip().strip('<>').lower()
+                        if address in sink.refuse:
+                            self.reply("550 5.1.1 No such user")
+                        else:
+                            self.reply("250 OK")
+                    elif command.startswith('DATA'):
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        size = 0
+                        for data_line in self.rfile:
+                            if data_line in (b".\r\n", b".\n"):
+                                break
+                            size += len(data_line)
+                        with sink._lock:
+                            sink.messages += 1
+                            sink.bytes_received += size
+                        self.reply("250 OK")
+                        delivered += 1
+                        if sink.drop_after and delivered >= sink.drop_after:
+                            return
+                    elif command.startswith('QUIT'):
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("250 OK")
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()